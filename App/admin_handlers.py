@@ -1,5 +1,5 @@
 import App.user_keyboards as kb
-from BotData.database_function import *
+from BotData.database_async import *
 from App.states import *
 from App.function import *
 
@@ -10,9 +10,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.filters import CommandStart, Command
 from BotData.config import bot_token, admin_id
 import App.admin_keyboards as ad_kb
+from App.broadcast import run_broadcast
+from App.outbox import setup_outbox
 
 
-bot = Bot(token=bot_token)
+bot = setup_outbox(Bot(token=bot_token))
 router_admin = Router()
 
 @router_admin.message(Command('admin'))
@@ -48,10 +50,8 @@ async def go_mailing(message: Message, state: FSMContext):
         data_message = str(data.get('message'))
         users = await users_list()
         await message.answer('***Выполняем рассылку***⏳', parse_mode='Markdown')
-        counter = 0
-        for i in users:
-            await bot.send_message(i, data_message)
-            counter += 1
+        progress = await run_broadcast(bot, users, {"type": "text", "text": data_message})
+        counter = progress.sent
         await message.answer(f'***Сообщение доставлено всем*** ___"{counter}"___ ***пользователям***📧', parse_mode='Markdown', reply_markup=ad_kb.admin)
     else:
         await message.answer('Как вам угодно😊', reply_markup=ad_kb.admin)
@@ -31,6 +31,15 @@ broadcast_confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="❌ Отменить", callback_data="broadcast_cancel")]
 ])
 
+# Управление идущей рассылкой
+def broadcast_job_keyboard(job_id, paused=False):
+    toggle = (InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"broadcast_resume:{job_id}") if paused
+              else InlineKeyboardButton(text="⏸ Пауза", callback_data=f"broadcast_pause:{job_id}"))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [toggle],
+        [InlineKeyboardButton(text="⏹ Отменить рассылку", callback_data=f"broadcast_stop:{job_id}")]
+    ])
+
 # Зарезервировано для будущих функций (например, блокировки пользователей)
 report = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='Заблокировать анкету'), KeyboardButton(text='Далее'), KeyboardButton(text='Выйти')]\
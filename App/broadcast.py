@@ -0,0 +1,372 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from aiogram.exceptions import (TelegramAPIError, TelegramBadRequest, TelegramForbiddenError,
+                                TelegramNotFound, TelegramRetryAfter)
+
+from App.admin_keyboards import broadcast_job_keyboard
+from App.outbox import outbox_priority, BULK
+from BotData.database_async import (
+    create_broadcast_job, get_broadcast_job, get_unfinished_broadcast_jobs, get_broadcast_recipients,
+    checkpoint_broadcast_job, set_broadcast_job_status, set_broadcast_job_status_message, mark_users_inactive
+)
+
+# Движок рассылок.
+# Сообщения отправляют несколько воркеров одновременно (ограниченная конкурентность),
+# а общий темп держит token bucket: не больше BROADCAST_RATE сообщений в секунду -
+# это глобальный лимит Telegram для бота (~30 сообщений/с).
+# При TelegramRetryAfter останавливаются все воркеры (лимит общий на бота),
+# после паузы сообщение отправляется повторно.
+# Ошибки доставки делятся на постоянные (бот заблокирован, аккаунт удалён - см.
+# is_permanent_failure) и временные. Получатели с постоянной ошибкой помечаются
+# неактивными (users.is_active = 0) и больше не попадают в рассылки и поиск.
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+MAX_RETRIES = 3  # сколько раз повторять сообщение после RetryAfter
+PROGRESS_INTERVAL = 3.0  # секунд между обновлениями прогресса
+JOB_BATCH = int(os.getenv("BROADCAST_BATCH", "100"))  # получателей между сохранениями прогресса задания
+
+
+# Фрагменты текста TelegramBadRequest, которые означают, что чата больше нет
+PERMANENT_BAD_REQUESTS = ("chat not found", "user is deactivated", "peer_id_invalid", "bot can't initiate conversation")
+
+
+def is_permanent_failure(error):
+    """
+    True, если писать этому пользователю бессмысленно и дальше: он заблокировал бота,
+    удалил аккаунт или чат не существует. Остальные ошибки считаются временными.
+    """
+    if isinstance(error, (TelegramForbiddenError, TelegramNotFound)):
+        return True
+    if isinstance(error, TelegramBadRequest):
+        message = str(error.message).lower()
+        return any(fragment in message for fragment in PERMANENT_BAD_REQUESTS)
+    return False
+
+
+class TokenBucket:
+    """
+    Ограничитель темпа: rate токенов в секунду, не больше capacity подряд.
+    По умолчанию capacity = 1: сообщения идут равномерно, без всплеска в начале рассылки.
+    """
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Ждёт, пока не появится токен, и забирает его.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        """
+        Останавливает выдачу токенов на seconds секунд (ответ Telegram RetryAfter).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class BroadcastProgress:
+    """
+    Счётчики рассылки. total - None, если количество получателей заранее неизвестно.
+    """
+
+    def __init__(self, total=None):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.inactive = 0  # из failed: постоянные ошибки, пользователь помечен неактивным
+        self.retries = 0
+        self.started = time.monotonic()
+        self.finished = False
+
+    @property
+    def done(self):
+        return self.sent + self.failed
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def text(self):
+        total = f" из {self.total}" if self.total is not None else ""
+        status = "Рассылка завершена!" if self.finished else "Идёт рассылка..."
+        return (f"{status}\nОбработано: {self.done}{total}\n"
+                f"Отправлено: {self.sent}\nНе удалось: {self.failed} (заблокировали бота: {self.inactive})\n"
+                f"Скорость: {self.rate:.1f} сообщ./с")
+
+
+async def send_content(bot, chat_id, content):
+    """
+    Отправляет контент рассылки (словарь type/text/file_id/caption) одному пользователю.
+    """
+    if content["type"] == "text":
+        return await bot.send_message(chat_id, content["text"])
+    if content["type"] == "photo":
+        return await bot.send_photo(chat_id, content["file_id"], caption=content.get("caption"))
+    if content["type"] == "video":
+        return await bot.send_video(chat_id, content["file_id"], caption=content.get("caption"))
+    if content["type"] == "document":
+        return await bot.send_document(chat_id, content["file_id"], caption=content.get("caption"))
+    raise ValueError(f"Неизвестный тип контента рассылки: {content['type']}")
+
+
+async def _deliver(bot, chat_id, content, bucket, progress):
+    """
+    Отправляет одно сообщение с учётом лимита.
+    Возвращает "sent", "permanent" (пользователю больше писать нельзя) или "transient".
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await bucket.acquire()
+        try:
+            await send_content(bot, chat_id, content)
+            return "sent"
+        except TelegramRetryAfter as e:
+            logging.warning(f"Рассылка: лимит Telegram, пауза {e.retry_after} с.")
+            bucket.pause(e.retry_after)
+            progress.retries += 1
+        except TelegramAPIError as e:
+            if is_permanent_failure(e):
+                logging.info(f"Пользователь {chat_id} недоступен для рассылки: {e}")
+                return "permanent"
+            logging.error(f"Не удалось отправить рассылку пользователю {chat_id}: {e}")
+            return "transient"
+    logging.error(f"Не удалось отправить рассылку пользователю {chat_id}: превышено число повторов.")
+    return "transient"
+
+
+async def _iterate(recipients):
+    if hasattr(recipients, "__aiter__"):
+        async for chat_id in recipients:
+            yield chat_id
+    else:
+        for chat_id in recipients:
+            yield chat_id
+
+
+async def run_broadcast(bot, recipients, content, on_progress=None, rate=None, concurrency=None, bucket=None):
+    """
+    Рассылает content всем recipients (список или асинхронный итератор telegram_id).
+    on_progress(progress) - корутина, которая вызывается раз в PROGRESS_INTERVAL секунд
+    и в конце рассылки. bucket - общий TokenBucket, если рассылка идёт частями.
+    Возвращает BroadcastProgress.
+    """
+    bucket = bucket or TokenBucket(rate or BROADCAST_RATE)
+    concurrency = concurrency or BROADCAST_CONCURRENCY
+    progress = BroadcastProgress(len(recipients) if hasattr(recipients, "__len__") else None)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    unreachable = []  # получатели с постоянной ошибкой
+
+    async def worker():
+        while True:
+            chat_id = await queue.get()
+            try:
+                if chat_id is None:
+                    return
+                result = await _deliver(bot, chat_id, content, bucket, progress)
+                if result == "sent":
+                    progress.sent += 1
+                else:
+                    progress.failed += 1
+                    if result == "permanent":
+                        progress.inactive += 1
+                        unreachable.append(chat_id)
+            finally:
+                queue.task_done()
+
+    async def report():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            await _report(on_progress, progress)
+
+    # Воркеры наследуют приоритет BULK: в общем лимите бота (App/outbox.py) рассылка
+    # уступает ответам пользователям и уведомлениям
+    with outbox_priority(BULK):
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    reporter = asyncio.create_task(report()) if on_progress else None
+    try:
+        async for chat_id in _iterate(recipients):
+            await queue.put(chat_id)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        if reporter:
+            reporter.cancel()
+        if unreachable:
+            await mark_users_inactive(unreachable)
+    progress.finished = True
+    await _report(on_progress, progress)
+    logging.debug(f"Рассылка завершена: отправлено {progress.sent}, не удалось {progress.failed}.")
+    return progress
+
+
+async def _report(on_progress, progress):
+    if on_progress is None:
+        return
+    try:
+        await on_progress(progress)
+    except Exception as e:
+        logging.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+
+# Задания рассылки.
+# Рассылка из админки сохраняется в broadcast_jobs (BotData/database_function.py) и выполняется
+# фоновой задачей: получатели читаются из users порциями по JOB_BATCH, после каждой порции
+# курсор и счётчики записываются в БД. После перезапуска бота незавершённые задания
+# продолжаются с курсора (повторно может уйти не больше одной порции, прерванной на середине).
+# Пауза и отмена - это смена статуса в БД, воркер проверяет его перед каждой порцией.
+
+_job_tasks = {}  # job_id -> asyncio.Task
+_job_bucket = None  # общий лимит для всех заданий: он действует на бота целиком
+
+STATUS_NAMES = {
+    "running": "Идёт рассылка...",
+    "paused": "Рассылка на паузе",
+    "cancelled": "Рассылка отменена",
+    "done": "Рассылка завершена!",
+}
+
+
+def job_text(job):
+    """
+    Текст сообщения с прогрессом задания (строка broadcast_jobs).
+    """
+    job_id, _, status, _, total, sent, failed = job[:7]
+    return (f"{STATUS_NAMES.get(status, status)} (#{job_id})\n"
+            f"Обработано: {sent + failed} из {total}\n"
+            f"Отправлено: {sent}\nНе удалось: {failed}")
+
+
+async def show_job(bot, job):
+    """
+    Обновляет сообщение с прогрессом задания у админа.
+    """
+    if job is None or not job[8]:
+        return
+    keyboard = broadcast_job_keyboard(job[0], paused=job[2] == "paused") if job[2] in ("running", "paused") else None
+    try:
+        await bot.edit_message_text(job_text(job), chat_id=job[8], message_id=job[9], reply_markup=keyboard)
+    except TelegramBadRequest:
+        pass  # текст не изменился или сообщение удалено
+    except TelegramAPIError as e:
+        logging.warning(f"Не удалось обновить прогресс рассылки #{job[0]}: {e}")
+
+
+async def create_job(bot, content, admin_chat_id):
+    """
+    Создаёт задание рассылки, сообщение с прогрессом у админа и запускает задание.
+    Возвращает id задания или None.
+    """
+    job_id = await create_broadcast_job(json.dumps(content, ensure_ascii=False), admin_chat_id)
+    if job_id is None:
+        return None
+    job = await get_broadcast_job(job_id)
+    message = await bot.send_message(admin_chat_id, job_text(job), reply_markup=broadcast_job_keyboard(job_id))
+    await set_broadcast_job_status_message(job_id, admin_chat_id, message.message_id)
+    start_job(bot, job_id)
+    return job_id
+
+
+def start_job(bot, job_id):
+    """
+    Запускает фоновую обработку задания, если она ещё не запущена.
+    """
+    task = _job_tasks.get(job_id)
+    if task is None or task.done():
+        task = asyncio.create_task(_run_job(bot, job_id))
+        _job_tasks[job_id] = task
+        task.add_done_callback(lambda _: _job_tasks.pop(job_id, None))
+    return task
+
+
+async def _run_job(bot, job_id):
+    global _job_bucket
+    if _job_bucket is None:
+        _job_bucket = TokenBucket(BROADCAST_RATE)
+    job = await get_broadcast_job(job_id)
+    if job is None:
+        return
+    content = json.loads(job[1])
+    logging.info(f"Рассылка #{job_id}: старт с курсора {job[3]}.")
+    last_shown = 0.0
+    try:
+        while job is not None and job[2] == "running":
+            batch = await get_broadcast_recipients(job[3], JOB_BATCH)
+            if not batch:
+                await set_broadcast_job_status(job_id, "done", expected=("running",))
+                job = await get_broadcast_job(job_id)
+                break
+            progress = await run_broadcast(bot, [row[1] for row in batch], content, bucket=_job_bucket)
+            await checkpoint_broadcast_job(job_id, batch[-1][0], progress.sent, progress.failed)
+            # Читаем задание заново: статус мог смениться (пауза/отмена) во время порции
+            job = await get_broadcast_job(job_id)
+            if time.monotonic() - last_shown >= PROGRESS_INTERVAL:
+                await show_job(bot, job)
+                last_shown = time.monotonic()
+    except Exception as e:
+        # Курсор сохранён после последней порции: ставим задание на паузу, админ продолжит его кнопкой
+        logging.error(f"Рассылка #{job_id} прервана с ошибкой, задание на паузе: {e}")
+        await set_broadcast_job_status(job_id, "paused", expected=("running",))
+        job = await get_broadcast_job(job_id)
+    await show_job(bot, job)
+    if job is not None:
+        logging.info(f"Рассылка #{job_id}: {job[2]}, отправлено {job[5]}, не удалось {job[6]}.")
+
+
+async def pause_job(job_id):
+    return await set_broadcast_job_status(job_id, "paused", expected=("running",))
+
+
+async def resume_job(bot, job_id):
+    if await set_broadcast_job_status(job_id, "running", expected=("paused",)):
+        start_job(bot, job_id)
+        return True
+    return False
+
+
+async def cancel_job(job_id):
+    return await set_broadcast_job_status(job_id, "cancelled", expected=("running", "paused"))
+
+
+async def resume_jobs(bot):
+    """
+    При старте бота продолжает задания, прерванные перезапуском. Задания на паузе ждут админа.
+    """
+    for job in await get_unfinished_broadcast_jobs():
+        if job[2] == "running":
+            start_job(bot, job[0])
+
+
+async def stop_jobs():
+    """
+    Останавливает фоновые задания при выключении бота (в БД они остаются running).
+    """
+    tasks = list(_job_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,130 @@
+import logging
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputMediaPhoto, Message
+
+from BotData.housing import prefs_from_json, describe
+
+# Карусель анкет в поиске.
+# Следующая анкета показывается редактированием того же сообщения:
+#   фото -> фото: edit_message_media (фото, подпись и кнопки одним запросом),
+#   текст -> текст: edit_message_text.
+# Раньше на каждое "Далее" с фото уходило два запроса (delete_message + send_photo).
+# Если отредактировать нельзя (анкета с фото после текстовой и наоборот, сообщение
+# удалено или слишком старое), отправляется новое сообщение, а старое удаляется или
+# хотя бы теряет кнопки: лайк и "Далее" действуют на анкету из FSM, то есть на новую карточку.
+
+
+def profile_text(user_data):
+    """
+    Текст анкеты (строка users) для подписи или сообщения.
+    """
+    text = (
+        f"<b>Имя:</b> {user_data[2]}\n"
+        f"<b>Возраст:</b> {user_data[3]}\n"
+        f"<b>Пол:</b> {user_data[4]}\n"
+        f"<b>Университет:</b> {user_data[5] or 'Не указан'}\n"
+        f"<b>О себе:</b> {user_data[6] or 'Не указано'}"
+    )
+    housing_prefs = prefs_from_json(user_data[8])
+    if housing_prefs:
+        text += "\n" + describe(housing_prefs)
+    return text
+
+
+def render_card(user_data):
+    """
+    Карточка анкеты для карусели: текст, photo (file_id или None) и telegram_id анкеты.
+    """
+    return {"text": profile_text(user_data), "photo": user_data[7] or None, "telegram_id": user_data[1]}
+
+
+class CarouselStats:
+    """
+    Сколько запросов к Telegram API уходит на одно листание анкеты.
+    """
+
+    def __init__(self):
+        self.swipes = 0
+        self.api_calls = 0
+        self.edits = 0
+        self.fallbacks = 0
+
+    def stats(self):
+        return {
+            "swipes": self.swipes,
+            "api_calls": self.api_calls,
+            "edits": self.edits,
+            "fallbacks": self.fallbacks,
+            "calls_per_swipe": self.api_calls / self.swipes if self.swipes else 0.0,
+        }
+
+
+carousel_stats = CarouselStats()
+
+
+async def _send(bot, chat_id, card, keyboard):
+    if card["photo"]:
+        try:
+            return await bot.send_photo(chat_id, card["photo"], caption=card["text"], reply_markup=keyboard), 1
+        except TelegramBadRequest as e:
+            logging.error(f"Ошибка при отправке фото анкеты: {e}")
+            return await bot.send_message(chat_id, card["text"] + "\n(Фото не загружено или недоступно)",
+                                          reply_markup=keyboard), 2
+    return await bot.send_message(chat_id, card["text"], reply_markup=keyboard), 1
+
+
+async def _edit(bot, chat_id, card, keyboard, message):
+    """
+    Редактирует message в карточку. Возвращает False, если этот переход нельзя сделать правкой.
+    """
+    # InaccessibleMessage (старше 48 часов) не содержит ни фото, ни текста - его не отредактировать
+    if not isinstance(message, Message) or bool(card["photo"]) != bool(message.photo):
+        return False
+    carousel_stats.api_calls += 1
+    try:
+        if card["photo"]:
+            await bot.edit_message_media(InputMediaPhoto(media=card["photo"], caption=card["text"]),
+                                         chat_id=chat_id, message_id=message.message_id, reply_markup=keyboard)
+        else:
+            await bot.edit_message_text(card["text"], chat_id=chat_id, message_id=message.message_id, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e.message):
+            return True
+        logging.warning(f"Не удалось отредактировать анкету в сообщении {message.message_id}: {e}")
+        return False
+    carousel_stats.edits += 1
+    return True
+
+
+async def _retire(bot, chat_id, message):
+    """
+    Убирает карточку, которую не удалось отредактировать: удаляет сообщение, а если это
+    невозможно - снимает с него кнопки. Возвращает число запросов к API.
+    """
+    try:
+        await bot.delete_message(chat_id, message.message_id)
+        return 1
+    except TelegramBadRequest:
+        pass
+    try:
+        await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message.message_id, reply_markup=None)
+    except TelegramBadRequest as e:
+        logging.warning(f"Не удалось убрать кнопки со старой анкеты в сообщении {message.message_id}: {e}")
+    return 2
+
+
+async def show_card(bot, chat_id, card, keyboard, message=None):
+    """
+    Показывает карточку вместо анкеты в message (если передано) или новым сообщением.
+    Запросы считаются в carousel_stats только для листания (когда передано message).
+    """
+    if message is None:
+        await _send(bot, chat_id, card, keyboard)
+        return
+    carousel_stats.swipes += 1
+    if await _edit(bot, chat_id, card, keyboard, message):
+        return
+    carousel_stats.fallbacks += 1
+    _, calls = await _send(bot, chat_id, card, keyboard)
+    carousel_stats.api_calls += calls + await _retire(bot, chat_id, message)
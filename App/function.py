@@ -1,26 +1,19 @@
+import logging
+
 import App.user_keyboards as kb
 
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import BufferedInputFile, ReplyKeyboardRemove
-from BotData.database_function import *
-from geopy.geocoders import Nominatim
-
-# Функция для определения города, области, округа и страны по широте и долготе
-def get_location_details(latitude, longitude):
-    geolocator = Nominatim(user_agent="geoapiExercises")
-    location = geolocator.reverse((latitude, longitude), language='ru')
-    address = location.raw['address']
-
-    city = address.get('city', '')
-    if not city:
-        city = address.get('town', '')
-    if not city:
-        city = address.get('village', '')
-    if not city:
-        city = address.get('hamlet', '')
+from BotData.database_async import *
+from App.outbox import outbox_priority, MATCH
+from App.notifications import like_notifier
+from BotData.gazetteer import city_at, city_named
 
-    state = address.get('state', '')
-    region = address.get('region', '')
-    country = address.get('country', '')
+# Город, область, округ и страна для города из справочника (BotData/gazetteer.py)
+def _location_list(city):
+    state = city.state
+    region = city.region
+    country = city.country
 
     state_list = ['Донецкая область', 'Луганская область', 'Автономная Республика Крым']
     if state in ['Республика Крым', 'Херсонская область', 'Запорожская область']:
@@ -36,53 +29,49 @@ def get_location_details(latitude, longitude):
             state = 'Республика Крым'
         region = 'Южный федеральный округ'
 
-    location_list = [city, state, region, country]
+    location_list = [city.name, state, region, country]
     return location_list
 
+# Функция для определения города, области, округа и страны по широте и долготе.
+# Берётся ближайший город справочника, без запросов в сеть; если рядом с точкой
+# городов справочника нет, возвращается пустой список
+def get_location_details(latitude, longitude):
+    city = city_at(latitude, longitude)
+    if city:
+        return _location_list(city)
+    else:
+        return []
+
 #city, state, region, country = get_location_details(latitude, longitude)
 # Функция для определения города, области, округа и страны по названию города
 def get_city_details(city_name):
-    geolocator = Nominatim(user_agent="GetLoc")
-
-    location = geolocator.geocode(city_name, addressdetails=True, language='ru')
-
-    if location:
-        address = location.raw.get('address', {})
-
-        city = address.get('city', '')
-        if not city:
-            city = address.get('town', '')
-        if not city:
-            city = address.get('village', '')
-        if not city:
-            city = address.get('hamlet', '')
-
-        state = address.get('state', '')
-        region = address.get('region', '')
-        country = address.get('country', '')
-
-        state_list = ['Донецкая область', 'Луганская область', 'Автономная Республика Крым']
-        if state in ['Республика Крым', 'Херсонская область', 'Запорожская область']:
-            country = 'Россия'
-            region = 'Южный федеральный округ'
-        elif state in state_list:
-            country = 'Россия'
-            if state == state_list[0]:
-                state = 'Донецкая Народная Республика'
-            elif state == state_list[1]:
-                state = 'Луганская Народная Республика'
-            else:
-                state = 'Республика Крым'
-            region = 'Южный федеральный округ'
-
-        location_list = [city, state, region, country]
-        return location_list
+    city = city_named(city_name)
+    if city:
+        return _location_list(city)
     else:
         return []
 
+#Функция для отправки фото анкеты owner_id в чат chat_id.
+#После первой загрузки байтов запоминает file_id, который вернул Telegram, и дальше
+#отправляет фото по нему. Если file_id устарел, фото загружается заново.
+async def send_user_photo(bot, chat_id, owner_id, caption, reply_markup=None):
+    file_id = await get_photo_file_id(owner_id)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            logging.warning(f"file_id фото пользователя {owner_id} недействителен, загружаем заново: {e}")
+            await set_photo_file_id(owner_id, None)
+    photo = await get_photo(owner_id)
+    if photo is None:
+        return await bot.send_message(chat_id, caption, reply_markup=reply_markup)
+    input_file = BufferedInputFile(photo, filename='image.jpg')
+    sent = await bot.send_photo(chat_id=chat_id, photo=input_file, caption=caption, reply_markup=reply_markup)
+    await set_photo_file_id(owner_id, sent.photo[-1].file_id)
+    return sent
+
 #Функция для отправки пользователю его анкеты
 async def send_form_to_user(bot, user_id: int, reply_markup=kb.form_menu()):
-    photo_bytes = get_photo(user_id)
     list_info_about_user = await get_all_info(user_id)
     name = list_info_about_user[3]
     age = list_info_about_user[4]
@@ -93,12 +82,10 @@ async def send_form_to_user(bot, user_id: int, reply_markup=kb.form_menu()):
     country = list_info_about_user[12]
     caption = str(f"{name}, {age}, {city}\n"
                f"{description}")
-    input_file = BufferedInputFile(photo_bytes, filename='image.jpg')
-    await bot.send_photo(chat_id=user_id, photo=input_file, caption=caption, reply_markup=reply_markup)
+    await send_user_photo(bot, user_id, user_id, caption, reply_markup)
 
 #Функция для отправки пользователю анкет возможных партнеров
 async def send_partner_form_to_user(bot, user_id: int, partner_id: int, reply_markup=kb.form_menu(), is_view_like = False):
-    photo_bytes = get_photo(partner_id)
     list_info_about_user = await get_all_info(partner_id)
     name = list_info_about_user[3]
     age = list_info_about_user[4]
@@ -109,12 +96,11 @@ async def send_partner_form_to_user(bot, user_id: int, partner_id: int, reply_ma
     country = list_info_about_user[12]
     caption = str(f"{name}, {age}, {city}\n"
                f"{description}")
-    input_file = BufferedInputFile(photo_bytes, filename='image.jpg')
     if is_view_like:
         message_to = await message_to_user(partner_id, user_id)
         if message_to != None:
             caption += f'\nСООБЩЕНИЕ ДЛЯ ВАС💌:\n{message_to}\n'
-    await bot.send_photo(chat_id=user_id, photo=input_file, caption=caption, reply_markup=reply_markup)
+    await send_user_photo(bot, user_id, partner_id, caption, reply_markup)
 
 #Функция для получения фотографии пользователя из телеграмма
 async def take_user_photo_tg(bot, user_id):
@@ -127,16 +113,18 @@ async def take_user_photo_tg(bot, user_id):
         return photo
     return None
 
-#Функция отправляется информацию с количеством симпатий у пользователя
+#Функция отправляется информацию с количеством симпатий у пользователя.
+#Лайки за окно LIKE_NOTIFY_WINDOW собираются в одно сообщение (App/notifications.py)
+#Сейчас не вызывается: main.py подключает только свой router, а этот модуль ссылается на несуществующий get_all_info
 async def send_like(bot, partner_id):
-    counter = await like_counts(partner_id)
-    if counter:
-        message = f"Вам выразили симпатию {counter} человек"
-        await bot.send_message(partner_id, message, reply_markup=kb.shows_more)
+    partner = await get_user_by_id(partner_id)
+    if partner and partner[10]:
+        like_notifier.add(bot, partner_id, total=partner[12], reply_markup=kb.shows_more)
 
 
 #Функция отправляет username и анкету пользвателя, если совпала симпатия пользователю с id user_id
 async def send_username_to_partner(bot, user_id, from_user_id, username):
-    await bot.send_message(user_id, f'У вас с @{username} взаимная симпатия, если забыл кто это, вот анкета')
-    await send_partner_form_to_user(bot, user_id, from_user_id, ReplyKeyboardRemove())
+    with outbox_priority(MATCH):
+        await bot.send_message(user_id, f'У вас с @{username} взаимная симпатия, если забыл кто это, вот анкета')
+        await send_partner_form_to_user(bot, user_id, from_user_id, ReplyKeyboardRemove())
 
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque
+
+from BotData.search_feed import next_steps
+
+# Упреждающая подготовка анкет в поиске.
+# Пока пользователь смотрит анкету, в фоне готовятся следующие SEARCH_LOOKAHEAD:
+# строка из БД, подпись, клавиатура и file_id фото (см. render в Lookahead).
+# Нажатие "Далее" берёт готовую карточку из буфера - без запросов к БД и ранжирования,
+# одним запросом к Telegram - и запускает дозаполнение буфера.
+# Буферы живут только в памяти процесса: после перезапуска лента продолжается
+# из состояния в FSM, просто первое нажатие снова идёт без буфера.
+
+SEARCH_LOOKAHEAD = int(os.getenv("SEARCH_LOOKAHEAD", "3"))
+LOOKAHEAD_SESSIONS = int(os.getenv("LOOKAHEAD_SESSIONS", "5000"))
+
+
+class _Session:
+    __slots__ = ("head", "tail", "buffer", "task")
+
+    def __init__(self, feed):
+        self.head = feed  # состояние ленты, с которого начинается буфер (оно же - в FSM)
+        self.tail = feed  # состояние ленты после последней карточки в буфере
+        self.buffer = deque()  # (карточка, состояние ленты после неё)
+        self.task = None
+
+
+class Lookahead:
+    """
+    Буферы заранее подготовленных карточек по пользователям.
+    render(row) превращает строку users в карточку для показа.
+    """
+
+    def __init__(self, render, depth=SEARCH_LOOKAHEAD, maxsize=LOOKAHEAD_SESSIONS):
+        self.render = render
+        self.depth = depth
+        self.maxsize = maxsize
+        self._sessions = OrderedDict()  # user_id -> _Session
+        self.hits = 0
+        self.misses = 0
+
+    async def next_card(self, user_id, feed):
+        """
+        Возвращает (карточка, новое состояние ленты) или (None, feed), если анкеты закончились.
+        feed - текущее состояние ленты из FSM.
+        """
+        session = self._sessions.get(user_id)
+        if session is not None and session.head == feed and session.buffer:
+            self.hits += 1
+            self._sessions.move_to_end(user_id)
+            card, state = session.buffer.popleft()
+            session.head = state
+            self._refill(user_id, session)
+            return card, state
+
+        # Буфера нет или он от другого поиска: берём сразу карточку и запас за один проход
+        self.misses += 1
+        self.drop(user_id)
+        steps = await next_steps(user_id, feed, self.depth + 1)
+        if not steps:
+            return None, feed
+        (row, state), rest = steps[0], steps[1:]
+        session = _Session(state)
+        session.buffer.extend((self.render(r), s) for r, s in rest)
+        session.tail = rest[-1][1] if rest else state
+        self._sessions[user_id] = session
+        while len(self._sessions) > self.maxsize:
+            _, evicted = self._sessions.popitem(last=False)
+            self._cancel(evicted)
+        if len(rest) < self.depth:
+            session.tail = None  # лента закончилась, дозаполнять нечего
+        return self.render(row), state
+
+    def _refill(self, user_id, session):
+        if session.tail is None or len(session.buffer) >= self.depth:
+            return
+        if session.task is None or session.task.done():
+            session.task = asyncio.create_task(self._fill(user_id, session))
+
+    async def _fill(self, user_id, session):
+        try:
+            while session.tail is not None and len(session.buffer) < self.depth:
+                missing = self.depth - len(session.buffer)
+                steps = await next_steps(user_id, session.tail, missing)
+                if self._sessions.get(user_id) is not session:
+                    return  # сессию сбросили, пока шёл запрос
+                session.buffer.extend((self.render(row), state) for row, state in steps)
+                session.tail = steps[-1][1] if len(steps) == missing else None
+        except Exception as e:
+            logging.error(f"Не удалось подготовить анкеты для {user_id}: {e}")
+
+    def drop(self, user_id):
+        """
+        Забывает буфер пользователя (поиск закончен или отменён).
+        """
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self._cancel(session)
+
+    @staticmethod
+    def _cancel(session):
+        if session.task is not None:
+            session.task.cancel()
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "buffered": sum(len(session.buffer) for session in self._sessions.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import os
+
+from aiogram.exceptions import TelegramAPIError
+
+from App.broadcast import is_permanent_failure
+from App.outbox import outbox_priority, MATCH
+from BotData.database_async import mark_users_inactive
+
+# Уведомления "вам выразили симпатию".
+# Раньше каждый лайк сразу отправлял получателю отдельное сообщение (и считал лайки COUNT(*)).
+# Теперь лайки копятся по получателю в течение LIKE_NOTIFY_WINDOW секунд с первого лайка,
+# после чего уходит одно сообщение с их количеством. Общее число симпатий берётся
+# из users.likes_received, который БД увеличивает вместе со вставкой лайка.
+
+LIKE_NOTIFY_WINDOW = float(os.getenv("LIKE_NOTIFY_WINDOW", "60"))
+
+
+class LikeNotifier:
+    """
+    Копит лайки по получателю и отправляет по ним одно сводное уведомление.
+    """
+
+    def __init__(self, window=LIKE_NOTIFY_WINDOW):
+        self.window = window
+        self._pending = {}  # to_id -> [bot, новых лайков, всего лайков, клавиатура]
+        self._timers = {}  # to_id -> asyncio.Task
+        self.likes = 0
+        self.messages = 0
+
+    def add(self, bot, to_id, total=None, reply_markup=None):
+        """
+        Учитывает новый лайк для to_id. total - users.likes_received после этого лайка.
+        """
+        self.likes += 1
+        pending = self._pending.get(to_id)
+        if pending is None:
+            self._pending[to_id] = [bot, 1, total, reply_markup]
+            self._timers[to_id] = asyncio.create_task(self._flush_later(to_id))
+        else:
+            pending[1] += 1
+            if total is not None:
+                pending[2] = total
+
+    async def _flush_later(self, to_id):
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        await self.flush(to_id)
+
+    async def flush(self, to_id):
+        """
+        Отправляет накопленное уведомление для to_id, если оно есть.
+        """
+        self._timers.pop(to_id, None)
+        pending = self._pending.pop(to_id, None)
+        if pending is None:
+            return
+        bot, new_likes, total, reply_markup = pending
+        text = f"❤️ Вам выразили симпатию {new_likes} человек"
+        if total and total > new_likes:
+            text += f"\nВсего симпатий: {total}"
+        try:
+            with outbox_priority(MATCH):
+                await bot.send_message(to_id, text, reply_markup=reply_markup)
+            self.messages += 1
+        except TelegramAPIError as e:
+            if is_permanent_failure(e):
+                await mark_users_inactive([to_id])
+            else:
+                logging.error(f"Не удалось отправить уведомление о симпатии {to_id}: {e}")
+
+    async def flush_all(self):
+        """
+        Отправляет все накопленные уведомления сразу (при остановке бота).
+        """
+        for task in self._timers.values():
+            task.cancel()
+        await asyncio.gather(*(self.flush(to_id) for to_id in list(self._pending)))
+
+    def stats(self):
+        return {"pending": len(self._pending), "likes": self.likes, "messages": self.messages}
+
+
+like_notifier = LikeNotifier()
@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup, EditMessageText,
+    ForwardMessage, SendAnimation, SendAudio, SendDocument, SendLocation, SendMediaGroup,
+    SendMessage, SendPhoto, SendSticker, SendVideo, SendVoice
+)
+
+# Центральный диспетчер исходящих сообщений.
+# Все запросы бота проходят через middleware сессии (bot.session.middleware), поэтому
+# обработчики по-прежнему вызывают bot.send_message / message.answer как обычно.
+# Для отправки сообщений middleware:
+#   - выдерживает лимит на чат (OUTBOX_CHAT_RATE сообщений в секунду, с небольшим запасом
+#     OUTBOX_CHAT_BURST подряд - например, два ответа на одну команду);
+#   - берёт слот общего лимита бота (OUTBOX_GLOBAL_RATE в секунду). Слоты выдаются по
+#     приоритету: ответы пользователю, потом уведомления о взаимной симпатии, потом
+#     уведомления админам и только потом рассылка;
+#   - при TelegramRetryAfter останавливает выдачу слотов на указанное время и повторяет запрос.
+# Приоритет задаётся через contextvar: with outbox_priority(BULK): ...
+
+INTERACTIVE = 0  # ответы на действия пользователя (по умолчанию)
+MATCH = 1        # уведомления о взаимной симпатии и лайках
+ADMIN = 2        # уведомления админам и ответы поддержки
+BULK = 3         # рассылки
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", MATCH: "match", ADMIN: "admin", BULK: "bulk"}
+
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "30"))
+OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+OUTBOX_CHAT_BURST = float(os.getenv("OUTBOX_CHAT_BURST", "3"))
+MAX_FLOOD_RETRIES = 2
+
+# Методы, которые создают новое сообщение в чате (на них действует лимит на чат)
+SEND_METHODS = (SendMessage, SendPhoto, SendVideo, SendDocument, SendAnimation, SendAudio, SendVoice,
+                SendSticker, SendMediaGroup, SendLocation, CopyMessage, ForwardMessage)
+# Все методы, на которые действует общий лимит
+LIMITED_METHODS = SEND_METHODS + (EditMessageText, EditMessageCaption, EditMessageMedia, EditMessageReplyMarkup)
+
+_priority = ContextVar("outbox_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def outbox_priority(level):
+    """
+    Все сообщения, отправленные внутри блока (и из задач, созданных в нём), получают приоритет level.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class Outbox:
+    """
+    Общие для всех экземпляров Bot лимиты: слоты общего лимита по приоритету и лимит на чат.
+    """
+
+    def __init__(self, global_rate=OUTBOX_GLOBAL_RATE, chat_rate=OUTBOX_CHAT_RATE, chat_burst=OUTBOX_CHAT_BURST):
+        self.global_interval = 1.0 / global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._waiters = []  # куча (приоритет, порядковый номер, future)
+        self._counter = itertools.count()
+        self._pump_task = None
+        self._chats = {}  # chat_id -> (токены, время обновления)
+        self.sent = {level: 0 for level in PRIORITY_NAMES}
+        self.flood_waits = 0
+
+    async def acquire(self, chat_id, level, per_chat=True):
+        """
+        Ждёт, пока сообщение в chat_id можно отправить, не нарушая лимиты.
+        """
+        if per_chat and chat_id is not None:
+            delay = self._reserve_chat(chat_id)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        now = time.monotonic()
+        if not self._waiters and now >= self._paused_until and now >= self._next_slot:
+            self._next_slot = now + self.global_interval
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (level, next(self._counter), future))
+            if self._pump_task is None or self._pump_task.done():
+                self._pump_task = asyncio.create_task(self._pump())
+            await future
+
+    def _reserve_chat(self, chat_id):
+        """
+        Берёт токен лимита на чат (в долг, если их нет) и возвращает, сколько нужно подождать.
+        """
+        now = time.monotonic()
+        tokens, updated = self._chats.get(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate) - 1
+        self._chats[chat_id] = (tokens, now)
+        if len(self._chats) > 10000:
+            self._forget_idle_chats(now)
+        return -tokens / self.chat_rate if tokens < 0 else 0.0
+
+    def _forget_idle_chats(self, now):
+        idle = self.chat_burst / self.chat_rate
+        self._chats = {chat_id: state for chat_id, state in self._chats.items() if now - state[1] < idle}
+
+    async def _pump(self):
+        """
+        Выдаёт слоты общего лимита ожидающим по приоритету.
+        """
+        while self._waiters:
+            now = time.monotonic()
+            wait = max(self._paused_until, self._next_slot) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # ожидающий отменён
+                continue
+            future.set_result(None)
+            self._next_slot = now + self.global_interval
+
+    def flood_wait(self, seconds):
+        """
+        Telegram ответил RetryAfter: не выдаём слоты seconds секунд.
+        """
+        self.flood_waits += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        return {
+            "sent": {PRIORITY_NAMES[level]: count for level, count in self.sent.items()},
+            "queued": len(self._waiters),
+            "flood_waits": self.flood_waits,
+        }
+
+
+outbox = Outbox()
+
+
+class OutboxMiddleware(BaseRequestMiddleware):
+    """
+    Пропускает исходящие сообщения через outbox.
+    """
+
+    def __init__(self, dispatcher=outbox):
+        self.outbox = dispatcher
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, LIMITED_METHODS):
+            return await make_request(bot, method)
+        level = _priority.get()
+        chat_id = getattr(method, "chat_id", None)
+        per_chat = isinstance(method, SEND_METHODS)
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            await self.outbox.acquire(chat_id, level, per_chat=per_chat and attempt == 0)
+            try:
+                response = await make_request(bot, method)
+                self.outbox.sent[level] += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.outbox.flood_wait(e.retry_after)
+                logging.warning(f"Flood wait {e.retry_after} с ({PRIORITY_NAMES[level]}, чат {chat_id}).")
+                if attempt == MAX_FLOOD_RETRIES:
+                    raise
+
+
+def setup_outbox(bot):
+    """
+    Подключает диспетчер исходящих сообщений к боту.
+    """
+    bot.session.middleware(OutboxMiddleware())
+    return bot
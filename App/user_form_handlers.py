@@ -1,5 +1,5 @@
 import App.user_keyboards as kb
-from BotData.database_function import *
+from BotData.database_async import *
 from BotData.config import bot_token
 from App.states import *
 from .function import *
@@ -9,8 +9,9 @@ from aiogram.types import Message, ReplyKeyboardRemove, CallbackQuery
 from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import CommandStart
+from App.outbox import setup_outbox
 
-bot = Bot(token=bot_token)
+bot = setup_outbox(Bot(token=bot_token))
 router = Router()
 
 @router.message(CommandStart())
@@ -94,6 +95,10 @@ async def location_from_user(message: Message, state:FSMContext):
     user_latitude = float(message.location.latitude)
     user_longitude = float(message.location.longitude)
     location_list = get_location_details(user_latitude, user_longitude)
+    await set_user_geo(user_id, user_latitude, user_longitude)  # для поиска рядом
+    if not len(location_list):
+        await message.answer('Не получилось определить город по геопозиции...\n Напиши, пожалуйста, его название')
+        return
     await state.update_data(location=location_list)
     await message.answer('Теперь пришлите ваше фото', reply_markup=kb.photo(user_id))
     await state.set_state(form.photo)
@@ -118,17 +123,17 @@ async def location_from_user(message: Message, state:FSMContext):
 async def photo_from_tg(message: Message, state: FSMContext):
     user_id = message.from_user.id
     photo = await take_user_photo_tg(bot, user_id)
-    await state.update_data(photo=photo)
+    refs = await ingest_photo(photo) if photo else None
+    await state.update_data(photo_refs=refs)
     await message.answer('Напиши что-нибудь о себе.\nЕсли не хочешь ничего писать,то нажми кнопку "Пропустить"',
                          reply_markup=kb.description(user_id))
     await state.set_state(form.description)
 
-#FIXXXXXXXXX
 @router.message(F.text == 'Взять текущее фото', form.photo)
 async def photo_from_tg(message: Message, state: FSMContext):
     user_id = message.from_user.id
-    photo = get_photo(user_id)
-    #await state.update_data(photo=photo)
+    user = await get_user_by_id(user_id)
+    await state.update_data(photo_refs=(user[14], user[15]) if user else None)
     await message.answer('Напиши что-нибудь о себе.\nЕсли не хочешь ничего писать,то нажми кнопку "Пропустить"',
                          reply_markup=kb.description(user_id))
     await state.set_state(form.description)
@@ -140,7 +145,12 @@ async def photo_from_user(message: Message, state:FSMContext):
     file_info = await message.bot.get_file(photo.file_id)
     file_path = file_info.file_path
     photo = await bot.download_file(file_path)
-    await state.update_data(photo=photo)
+    # В FSM кладём только ссылки на обработанное фото в хранилище, а не сами байты
+    refs = await ingest_photo(photo)
+    if refs is None:
+        await message.answer('Не получилось прочитать это фото, пришли другое')
+        return
+    await state.update_data(photo_refs=refs)
     await message.answer('Напиши что-нибудь о себе.\nЕсли не хочешь ничего писать,то нажми кнопку "Пропустить"',
                          reply_markup=kb.description(user_id))
     await state.set_state(form.description)
@@ -182,10 +192,11 @@ async def finish_form(message: Message, state: FSMContext):
     data_age = data.get('age')
     data_interest = data.get('interest')
     data_description = data.get('description')
-    data_photo = data.get('photo')
+    data_photo_refs = data.get('photo_refs') or (None, None)
     data_location = data.get('location')
-    await all_info_to_db(user_id, data_name, username, data_photo, data_age,
+    await all_info_to_db(user_id, data_name, username, None, data_age,
                          data_sex, data_description, data_interest)
+    await set_photo_ref(user_id, *data_photo_refs)
     await location_to_db(user_id,data_location[0], data_location[1], data_location[2], data_location[3])
     await message.answer('Ваша анкета создана!!!', reply_markup=ReplyKeyboardRemove())
     await send_form_to_user(bot, user_id)
@@ -323,6 +334,10 @@ async def update_location(message: Message, state: FSMContext):
     user_latitude = float(message.location.latitude)
     user_longitude = float(message.location.longitude)
     location_list = get_location_details(user_latitude, user_longitude)
+    await set_user_geo(user_id, user_latitude, user_longitude)  # для поиска рядом
+    if not len(location_list):
+        await message.answer('Не получилось определить город по геопозиции...\n Напиши, пожалуйста, его название')
+        return
     await location_to_db(user_id, location_list[0], location_list[1], location_list[2], location_list[3])
     await state.clear()
     await message.answer('Данные о местоположении обновлены!',reply_markup=ReplyKeyboardRemove())
@@ -368,7 +383,9 @@ async def update_photo(message: Message, state:FSMContext):
     file_info = await message.bot.get_file(photo.file_id)
     file_path = file_info.file_path
     photo = await bot.download_file(file_path)
-    await photo_to_db(user_id, photo)
+    if await photo_to_db(user_id, photo) is None:
+        await message.answer('Не получилось прочитать это фото, пришли другое')
+        return
     await message.answer('Фотография успешно обновлена!',
                          reply_markup=ReplyKeyboardRemove())
     await send_form_to_user(bot, user_id)
@@ -1,5 +1,5 @@
 import App.user_keyboards as kb
-from BotData.database_function import *
+from BotData.database_async import *
 from App.states import *
 from .function import *
 
@@ -9,8 +9,9 @@ from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import CommandStart
 from BotData.config import bot_token
+from App.outbox import setup_outbox
 
-bot = Bot(token=bot_token)
+bot = setup_outbox(Bot(token=bot_token))
 router_search = Router()
 
 @router_search.message(F.text == 'Начать поиск')
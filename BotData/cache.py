@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Ограниченный LRU-кэш с временем жизни записей (ttl=math.inf - записи не устаревают).
+    Кэшируется любое значение, в том числе None ("в БД ничего нет"), поэтому после
+    изменения данных запись нужно явно сбросить через invalidate().
+    Значение, прочитанное из БД, кладут через set(..., generation=generation()), где поколение
+    взято до чтения: если ключ за время чтения сбросили, значение могло устареть и не кэшируется.
+    Работает только из event loop, блокировки не нужны.
+    """
+
+    def __init__(self, maxsize=10_000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl  # секунд
+        self._items = OrderedDict()  # key -> (expires_at, value)
+        self._generation = 0  # растёт при каждом invalidate() и clear()
+        self._invalidated = OrderedDict()  # key -> поколение последнего invalidate()
+        self._forgotten = 0  # наибольшее поколение, вытесненное из _invalidated
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Возвращает закэшированное значение или default, если записи нет или она устарела.
+        """
+        item = self._items.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._items[key]
+        self.misses += 1
+        return default
+
+    def generation(self):
+        """
+        Текущее поколение кэша - снимается перед чтением значения из БД.
+        """
+        return self._generation
+
+    def set(self, key, value, generation=None):
+        """
+        Кладёт значение в кэш. Если передано generation и после него ключ сбрасывали,
+        значение не кэшируется.
+        """
+        if generation is not None and (self._invalidated.get(key, 0) > generation
+                                       or self._forgotten > generation):
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+        self._generation += 1
+        self._invalidated[key] = self._generation
+        self._invalidated.move_to_end(key)
+        # Давние сбросы забываются; чтения, начатые до забытого сброса, не кэшируются
+        while len(self._invalidated) > self.maxsize:
+            _, self._forgotten = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+        self._generation += 1
+        self._invalidated.clear()
+        self._forgotten = self._generation
+
+    def stats(self):
+        """
+        Счётчики кэша: попадания, промахи, доля попаданий, размер.
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
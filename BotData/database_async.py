@@ -0,0 +1,300 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import BotData.database_function as db
+from BotData.cache import TTLCache
+from BotData.db_pool import close_pool
+from BotData.exclusion import ExclusionRegistry, LikedSet
+from BotData.photo_ingest import normalize_photo
+from BotData.photo_store import photo_store
+from BotData.snapshots import SnapshotRegistry
+
+# Асинхронная обёртка над BotData/database_function.py.
+# Все запросы к SQLite выполняются в отдельных потоках, поэтому медленный запрос
+# больше не блокирует event loop и polling для остальных пользователей.
+# Потоков столько же, сколько соединений в пуле (BotData/db_pool.py): в режиме WAL
+# чтения идут параллельно, а запись SQLite сериализует сама (busy_timeout).
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DB_POOL_SIZE", "4")), thread_name_prefix="db")
+
+# Кэш анкет перед get_user_by_id и user_exists. Анкеты меняются только при регистрации
+# и редактировании - эти функции сбрасывают запись в кэше.
+_NOT_CACHED = object()
+profile_cache = TTLCache(maxsize=int(os.getenv("PROFILE_CACHE_SIZE", "10000")),
+                         ttl=int(os.getenv("PROFILE_CACHE_TTL", "300")))
+
+# Множества уже лайкнутых анкет для фильтрации ленты в памяти (BotData/exclusion.py)
+liked_sets = ExclusionRegistry(maxsize=int(os.getenv("LIKED_SETS_SIZE", "5000")))
+
+# Множества совместимых по жилью соседей (BotData/housing.py) в том же компактном виде.
+# Изменение предпочтений любого пользователя может сделать его (не)совместимым с кем угодно,
+# поэтому при нём сбрасываются все множества, а строка в таблице housing_prefs
+# обновляется точечно.
+compatible_sets = ExclusionRegistry(maxsize=int(os.getenv("LIKED_SETS_SIZE", "5000")))
+_NO_PREFS = LikedSet()
+
+# Общие снимки кандидатов по полу для ленты поиска (BotData/snapshots.py, BotData/search_feed.py)
+snapshots = SnapshotRegistry()
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию работы с БД в потоке БД и возвращает её результат.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _awaitable(func):
+    """
+    Делает из синхронной функции database_function её асинхронный аналог.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    """
+    Дожидается завершения запросов в очереди, останавливает потоки БД и закрывает пул соединений.
+    """
+    _executor.shutdown(wait=True)
+    close_pool()
+    logging.info("Потоки работы с БД остановлены.")
+
+
+create_tables = _awaitable(db.create_tables)
+
+# Пользователи
+async def add_user(telegram_id, name, age, gender, university, description, photo, housing_prefs=None):
+    """
+    Добавляет пользователя, сбрасывает его запись в кэше анкет и снимок кандидатов его пола.
+    """
+    try:
+        return await run_db(db.add_user, telegram_id, name, age, gender, university, description, photo, housing_prefs)
+    finally:
+        profile_cache.invalidate(telegram_id)
+        snapshots.invalidate(gender)
+        if housing_prefs:
+            compatible_sets.clear()
+
+
+async def set_housing_prefs(telegram_id, prefs):
+    """
+    Сохраняет предпочтения по жилью и сбрасывает всё, что от них зависит:
+    запись в кэше анкет, снимок кандидатов пола пользователя и множества совместимых.
+    """
+    user = await run_db(db.set_housing_prefs, telegram_id, prefs)
+    profile_cache.invalidate(telegram_id)
+    compatible_sets.clear()
+    if user:
+        snapshots.invalidate(user[4])
+    return user
+
+
+async def get_compatible_set(telegram_id):
+    """
+    Возвращает LikedSet совместимых по жилью пользователей или None, если у пользователя
+    нет предпочтений.
+    """
+    compatible = compatible_sets.get(telegram_id)
+    if compatible is None:
+        ids = await run_db(db.get_compatible_ids, telegram_id)
+        compatible = _NO_PREFS if ids is None else LikedSet(ids)
+        compatible_sets.put(telegram_id, compatible)
+    return None if compatible is _NO_PREFS else compatible
+
+
+async def get_user_by_id(telegram_id):
+    """
+    Возвращает анкету пользователя, по возможности из кэша.
+    """
+    row = profile_cache.get(telegram_id, _NOT_CACHED)
+    if row is not _NOT_CACHED:
+        return row
+    generation = profile_cache.generation()
+    row = await run_db(db.get_user_by_id, telegram_id)
+    # Пока шёл запрос, анкету могли создать или изменить - тогда row уже устарела
+    profile_cache.set(telegram_id, row, generation)
+    return row
+
+
+async def user_exists(telegram_id):
+    """
+    Проверяет наличие анкеты через тот же кэш, что и get_user_by_id.
+    """
+    return await get_user_by_id(telegram_id) is not None
+
+
+async def get_liked_set(telegram_id):
+    """
+    Возвращает LikedSet пользователя, при первом обращении загружая его из БД.
+    """
+    liked = liked_sets.get(telegram_id)
+    if liked is None:
+        liked = LikedSet(await run_db(db.get_liked_ids, telegram_id))
+        liked_sets.put(telegram_id, liked)
+    return liked
+
+
+async def mark_users_inactive(telegram_ids):
+    """
+    Помечает пользователей неактивными и убирает их из кэша анкет и снимков кандидатов.
+    """
+    changed = await run_db(db.mark_users_inactive, telegram_ids)
+    for telegram_id, gender in changed:
+        profile_cache.invalidate(telegram_id)
+        snapshots.invalidate(gender)
+    return changed
+
+
+async def reactivate_user(telegram_id):
+    """
+    Возвращает пользователя в поиск и рассылки после того, как он снова написал боту.
+    """
+    reactivated = await run_db(db.reactivate_user, telegram_id)
+    if reactivated:
+        generation = profile_cache.generation()
+        user = await run_db(db.get_user_by_id, telegram_id)
+        profile_cache.set(telegram_id, user, generation)
+        if user:
+            snapshots.invalidate(user[4])
+    return reactivated
+
+
+async def get_photo_file_id(telegram_id):
+    """
+    file_id фото анкеты из кэша анкет (users.photo_file_id) или None.
+    """
+    user = await get_user_by_id(telegram_id)
+    return user[13] if user else None
+
+
+async def set_photo_file_id(telegram_id, file_id):
+    """
+    Сохраняет (или сбрасывает, если file_id - None) file_id фото анкеты.
+    """
+    result = await run_db(db.set_photo_file_id, telegram_id, file_id)
+    profile_cache.invalidate(telegram_id)
+    return result
+
+
+async def ingest_photo(photo):
+    """
+    Нормализует фото в пуле процессов (BotData/photo_ingest.py) и кладёт карточку и миниатюру
+    в хранилище BotData/photo_store.py. Возвращает (ссылка на фото, ссылка на миниатюру)
+    или None, если фото не удалось прочитать.
+    """
+    normalized = await normalize_photo(photo)
+    if normalized is None:
+        return None
+    card, thumb = normalized
+    return await run_db(photo_store.put, card), await run_db(photo_store.put, thumb)
+
+
+async def photo_to_db(telegram_id, photo):
+    """
+    Сохраняет новое фото анкеты: байты - в хранилище, в users - только ссылки.
+    Старый file_id при этом сбрасывается. Возвращает ссылку на фото или None.
+    """
+    refs = await ingest_photo(photo)
+    if refs is None:
+        return None
+    await set_photo_ref(telegram_id, *refs)
+    return refs[0]
+
+
+async def set_photo_ref(telegram_id, photo_ref, thumb_ref=None):
+    """
+    Привязывает к анкете уже сохранённые в хранилище фото и миниатюру.
+    """
+    result = await run_db(db.set_photo_ref, telegram_id, photo_ref, thumb_ref)
+    profile_cache.invalidate(telegram_id)
+    return result
+
+
+async def get_photo(telegram_id, thumbnail=False):
+    """
+    Фото анкеты (или его миниатюра) как memoryview на отображённый в память файл или None.
+    """
+    user = await get_user_by_id(telegram_id)
+    ref = user and user[15 if thumbnail else 14]
+    if not ref:
+        return None
+    return photo_store.get(ref)
+
+
+async def collect_photo_garbage():
+    """
+    Удаляет из хранилища фото, на которые больше не ссылается ни одна анкета.
+    """
+    refs = await run_db(db.get_photo_refs)
+    return await run_db(photo_store.remove_unreferenced, refs)
+
+
+get_users_by_gender = _awaitable(db.get_users_by_gender)
+get_all_users = _awaitable(db.get_all_users)
+
+
+# Лайки
+async def add_like(from_id, to_id):
+    """
+    Добавляет лайк и дополняет множество лайков пользователя, если оно загружено.
+    """
+    result = await run_db(db.add_like, from_id, to_id)
+    liked_sets.add(from_id, to_id)
+    profile_cache.invalidate(to_id)  # изменился users.likes_received
+    return result
+
+
+is_mutual_like = _awaitable(db.is_mutual_like)
+
+
+async def like_and_check_mutual(from_id, to_id):
+    """
+    Ставит лайк (см. database_function.like_and_check_mutual) и заодно обновляет
+    кэш анкет строками, прочитанными в той же транзакции.
+    """
+    generation = profile_cache.generation()
+    result = await run_db(db.like_and_check_mutual, from_id, to_id)
+    if result:
+        liked_sets.add(from_id, to_id)
+        profile_cache.set(from_id, result["from_user"], generation)
+        profile_cache.set(to_id, result["to_user"], generation)
+    return result
+
+
+# Обращения в поддержку
+add_support_request = _awaitable(db.add_support_request)
+get_all_support_requests = _awaitable(db.get_all_support_requests)
+get_new_support_requests = _awaitable(db.get_new_support_requests)
+get_support_requests_for_admin = _awaitable(db.get_support_requests_for_admin)
+mark_support_request_processed = _awaitable(db.mark_support_request_processed)
+mark_support_request_deferred = _awaitable(db.mark_support_request_deferred)
+delete_support_request = _awaitable(db.delete_support_request)
+clear_support_requests = _awaitable(db.clear_support_requests)
+assign_admin_to_request = _awaitable(db.assign_admin_to_request)
+get_support_request_by_id = _awaitable(db.get_support_request_by_id)
+
+
+# Задания рассылки
+create_broadcast_job = _awaitable(db.create_broadcast_job)
+get_broadcast_job = _awaitable(db.get_broadcast_job)
+get_unfinished_broadcast_jobs = _awaitable(db.get_unfinished_broadcast_jobs)
+get_broadcast_recipients = _awaitable(db.get_broadcast_recipients)
+checkpoint_broadcast_job = _awaitable(db.checkpoint_broadcast_job)
+set_broadcast_job_status = _awaitable(db.set_broadcast_job_status)
+set_broadcast_job_status_message = _awaitable(db.set_broadcast_job_status_message)
+
+
+# Состояния FSM
+get_fsm_record = _awaitable(db.get_fsm_record)
+save_fsm_records = _awaitable(db.save_fsm_records)
+
+
+# Координаты пользователей
+set_user_geo = _awaitable(db.set_user_geo)
+get_nearby_users = _awaitable(db.get_nearby_users)
@@ -1,372 +1,757 @@
-import sqlite3
-import logging
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Создаём БД и таблицы
-def create_tables():
-    """
-    Создаёт необходимые таблицы в базе данных, если они ещё не существуют.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            # Таблица пользователей (добавлены housing_prefs и registered_at)
-            cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                telegram_id INTEGER UNIQUE,
-                                name TEXT,
-                                age INTEGER,
-                                gender TEXT,
-                                university TEXT,
-                                description TEXT,
-                                photo TEXT,
-                                housing_prefs TEXT,
-                                registered_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                            )''')
-
-            # Таблица для хранения города (Алматы)
-            cursor.execute('''CREATE TABLE IF NOT EXISTS location (
-                                telegram_id INTEGER PRIMARY KEY,
-                                city TEXT DEFAULT 'Алматы'
-                            )''')
-
-            # Таблица лайков
-            cursor.execute('''CREATE TABLE IF NOT EXISTS likes (
-                                from_id INTEGER,
-                                to_id INTEGER,
-                                PRIMARY KEY (from_id, to_id)
-                            )''')
-
-            # Таблица обращений в поддержку
-            cursor.execute('''CREATE TABLE IF NOT EXISTS support_requests (
-                                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                                user_id INTEGER,
-                                username TEXT,
-                                request_text TEXT,
-                                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                                is_processed INTEGER DEFAULT 0,
-                                reason TEXT,
-                                assigned_admin INTEGER
-                            )''')
-
-            conn.commit()
-            logging.info("Таблицы успешно созданы или уже существуют.")
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при создании таблиц: {e}")
-
-
-# Функции для работы с пользователями (без изменений)
-def add_user(telegram_id, name, age, gender, university, description, photo):
-    """
-    Добавляет нового пользователя в базу данных.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO users (telegram_id, name, age, gender, university, description, photo) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                           (telegram_id, name, age, gender, university, description, photo))
-            conn.commit()
-            logging.info(f"Пользователь {name} ({telegram_id}) добавлен в БД.")
-            return True
-        except sqlite3.IntegrityError:
-            logging.warning(f"Пользователь с Telegram ID {telegram_id} уже существует.")
-            return False
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при добавлении пользователя: {e}")
-            return False
-
-def user_exists(telegram_id):
-    """
-    Проверяет, существует ли пользователь с данным Telegram ID.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM users WHERE telegram_id = ?", (telegram_id,))
-        return cursor.fetchone() is not None
-
-def get_user_by_id(telegram_id):
-    """
-    Возвращает информацию о пользователе по его Telegram ID.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        return cursor.fetchone()
-
-def get_users_by_gender(current_user_id, target_gender):
-    """
-    Возвращает список пользователей указанного пола, исключая текущего пользователя.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        # Исключаем пользователей, которым текущий пользователь уже ставил лайк
-        # и самого текущего пользователя
-        cursor.execute("""
-            SELECT * FROM users
-            WHERE gender = ? AND telegram_id != ?
-            AND telegram_id NOT IN (SELECT to_id FROM likes WHERE from_id = ?)
-        """, (target_gender, current_user_id, current_user_id))
-        return cursor.fetchall()
-
-def get_all_users():
-    """
-    Возвращает список всех зарегистрированных пользователей.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT telegram_id FROM users")
-        return [row[0] for row in cursor.fetchall()]
-
-# Функции для работы с лайками (без изменений)
-def add_like(from_id, to_id):
-    """
-    Добавляет лайк от одного пользователя другому.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO likes (from_id, to_id) VALUES (?, ?)", (from_id, to_id))
-            conn.commit()
-            logging.info(f"Пользователь {from_id} поставил лайк {to_id}.")
-            return True
-        except sqlite3.IntegrityError:
-            logging.warning(f"Лайк от {from_id} к {to_id} уже существует.")
-            return False
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при добавлении лайка: {e}")
-            return False
-
-def is_mutual_like(user1_id, user2_id):
-    """
-    Проверяет наличие взаимного лайка между двумя пользователями.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1 FROM likes WHERE from_id = ? AND to_id = ?", (user1_id, user2_id))
-        like1 = cursor.fetchone()
-        cursor.execute("SELECT 1 FROM likes WHERE from_id = ? AND to_id = ?", (user2_id, user1_id))
-        like2 = cursor.fetchone()
-        return like1 is not None and like2 is not None
-
-# Функции для работы с обращениями в поддержку
-def add_support_request(user_id, username, request_text, reason=None, assigned_admin=None):
-    """
-    Добавляет новое обращение в поддержку.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("INSERT INTO support_requests (user_id, username, request_text, reason, assigned_admin) VALUES (?, ?, ?, ?, ?)",
-                           (user_id, username, request_text, reason, assigned_admin))
-            conn.commit()
-            logging.info(f"Добавлено новое обращение от пользователя {user_id} (причина: {reason}, назначено: {assigned_admin}).")
-            return cursor.lastrowid
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при добавлении обращения в поддержку: {e}")
-            return None
-
-def get_all_support_requests():
-    """
-    Возвращает все обращения в поддержку (без фильтрации по обработанности).
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT * FROM support_requests ORDER BY timestamp DESC")
-            return cursor.fetchall()
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при получении всех обращений: {e}")
-            return []
-
-def get_new_support_requests():
-    """
-    Возвращает список необработанных (is_processed = 0) обращений.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT * FROM support_requests WHERE is_processed = 0 ORDER BY timestamp DESC")
-            return cursor.fetchall()
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при получении новых обращений: {e}")
-            return []
-
-def get_support_requests_for_admin(admin_id=None, reasons=None, include_processed=False):
-    """
-    Возвращает список обращений для указанного админа, включая не обработанные (is_processed = 0)
-    и отложенные (is_processed = 2), с возможностью фильтрации по причинам.
-    Если admin_id = None, возвращает обращения без привязки к админу (для главного админа).
-    Если include_processed = True, возвращает все обращения (включая обработанные),
-    соответствующие фильтрам.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            query_parts = []
-            params = []
-
-            if admin_id is not None:
-                query_parts.append("assigned_admin = ?")
-                params.append(admin_id)
-
-            if not include_processed:
-                query_parts.append("is_processed IN (0, 2)") # Необработанные или отложенные
-
-            if reasons:
-                placeholders = ','.join(['?']*len(reasons))
-                query_parts.append(f"reason IN ({placeholders})")
-                params.extend(reasons)
-
-            query = "SELECT * FROM support_requests"
-            if query_parts:
-                query += " WHERE " + " AND ".join(query_parts)
-            query += " ORDER BY timestamp DESC"
-
-            cursor.execute(query, params)
-            return cursor.fetchall()
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при получении обращений для админа {admin_id}: {e}")
-            return []
-
-def mark_support_request_processed(request_id):
-    """
-    Помечает обращение как обработанное (is_processed = 1).
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("UPDATE support_requests SET is_processed = 1 WHERE id = ?", (request_id,))
-            conn.commit()
-            logging.info(f"Обращение #{request_id} помечено как обработанное.")
-            return True
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при пометке обращения #{request_id} как обработанного: {e}")
-            conn.rollback()
-            return False
-
-def mark_support_request_deferred(request_id):
-    """
-    Помечает обращение как отложенное (is_processed = 2).
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("UPDATE support_requests SET is_processed = 2 WHERE id = ?", (request_id,))
-            conn.commit()
-            logging.info(f"Обращение #{request_id} помечено как отложенное.")
-            return True
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при пометке обращения #{request_id} как отложенного: {e}")
-            conn.rollback()
-            return False
-
-def delete_support_request(request_id):
-    """
-    Удаляет обращение из базы данных.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("DELETE FROM support_requests WHERE id = ?", (request_id,))
-            conn.commit()
-            logging.info(f"Обращение #{request_id} удалено.")
-            return True
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при удалении обращения #{request_id}: {e}")
-            conn.rollback()
-            return False
-
-def clear_support_requests():
-    """
-    Удаляет все обращения из базы данных.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("DELETE FROM support_requests")
-            conn.commit()
-            logging.info("Все обращения в поддержку удалены.")
-            return True
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при очистке обращений: {e}")
-            conn.rollback()
-            return False
-
-def assign_admin_to_request(request_id, admin_id):
-    """
-    Назначает админа на конкретное обращение.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            # Исправлено: условие WHERE assigned_admin IS NULL удалено,
-            # чтобы всегда обновлять назначенного админа, если функция вызывается.
-            # Если требуется назначение только для NULL, то нужно вернуть условие.
-            cursor.execute("UPDATE support_requests SET assigned_admin = ? WHERE id = ?", (admin_id, request_id))
-            conn.commit()
-            logging.info(f"Обращение #{request_id} назначено админу {admin_id}")
-            return True
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при назначении админа #{admin_id} для обращения #{request_id}: {e}")
-            conn.rollback()
-            return False
-
-def get_support_request_by_id(request_id):
-    """
-    Возвращает информацию об обращении по его ID.
-    """
-    with sqlite3.connect("database.db") as conn:
-        cursor = conn.cursor()
-        try:
-            cursor.execute("SELECT * FROM support_requests WHERE id = ?", (request_id,))
-            return cursor.fetchone()
-        except sqlite3.Error as e:
-            logging.error(f"Ошибка при получении обращения #{request_id}: {e}")
-            return None
-
-# Функции для работы с рассылками (УДАЛЕНЫ)
-# def save_broadcast_content(content_type, file_id=None, text_content=None, caption=None):
-#     """
-#     Сохраняет контент рассылки в базу данных.
-#     """
-#     with sqlite3.connect("database.db") as conn:
-#         cursor = conn.cursor()
-#         try:
-#             cursor.execute("INSERT INTO broadcast_content (content_type, file_id, text_content, caption) VALUES (?, ?, ?, ?)",
-#                            (content_type, file_id, text_content, caption))
-#             conn.commit()
-#             logging.info("Контент рассылки сохранён.")
-#             return True
-#         except sqlite3.Error as e:
-#             logging.error(f"Ошибка при сохранении контента рассылки: {e}")
-#             return False
-
-# def get_last_broadcast_content():
-#     """
-#     Возвращает последний сохраненный контент для рассылки.
-#     """
-#     with sqlite3.connect("database.db") as conn:
-#         cursor = conn.cursor()
-#         try:
-#             cursor.execute("SELECT content_type, file_id, text_content, caption FROM broadcast_content ORDER BY timestamp DESC LIMIT 1")
-#             return cursor.fetchone()
-#         except sqlite3.Error as e:
-#             logging.error(f"Ошибка при получении последнего контента рассылки: {e}")
-#             return None
-
-# def clear_broadcast_content():
-#     """
-#     Удаляет весь сохраненный контент рассылки.
-#     """
-#     with sqlite3.connect("database.db") as conn:
-#         cursor = conn.cursor()
-#         try:
-#             cursor.execute("DELETE FROM broadcast_content")
-#             conn.commit()
-#             logging.info("Весь контент рассылки удален.")
-#             return True
-#         except sqlite3.Error as e:
-#             logging.error(f"Ошибка при очистке контента рассылки: {e}")
+import math
+import sqlite3
+import logging
+
+from BotData import geohash
+from BotData.db_pool import connection
+from BotData.housing import prefs_to_json, MOVE_IN_WINDOW_DAYS, MOVE_IN_ASAP
+from BotData.migrations import migrate, check_query_plans
+
+GEOHASH_STORED_PRECISION = 9  # ячейка ~5 м
+KM_PER_DEGREE = 111.32  # км в градусе широты
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Создаём БД и таблицы
+def create_tables():
+    """
+    Приводит схему базы данных к актуальной версии (см. BotData/migrations.py)
+    и проверяет, что горячие запросы используют индексы.
+    """
+    with connection() as conn:
+        try:
+            version = migrate(conn)
+            check_query_plans(conn)
+            logging.info(f"Схема базы данных актуальна (версия {version}).")
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при создании таблиц: {e}")
+
+
+# Функции для работы с пользователями (без изменений)
+def add_user(telegram_id, name, age, gender, university, description, photo, housing_prefs=None):
+    """
+    Добавляет нового пользователя в базу данных.
+    housing_prefs - словарь предпочтений по жилью (BotData/housing.py) или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO users (telegram_id, name, age, gender, university, description, photo, housing_prefs, registered_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                           (telegram_id, name, age, gender, university, description, photo,
+                            prefs_to_json(housing_prefs) if housing_prefs else None))
+            if housing_prefs:
+                _upsert_housing_prefs(cursor, telegram_id, housing_prefs)
+            conn.commit()
+            logging.info(f"Пользователь {name} ({telegram_id}) добавлен в БД.")
+            return True
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            logging.warning(f"Пользователь с Telegram ID {telegram_id} уже существует.")
+            return False
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Ошибка при добавлении пользователя: {e}")
+            return False
+
+def user_exists(telegram_id):
+    """
+    Проверяет, существует ли пользователь с данным Telegram ID.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE telegram_id = ?", (telegram_id,))
+        return cursor.fetchone() is not None
+
+def get_user_by_id(telegram_id):
+    """
+    Возвращает информацию о пользователе по его Telegram ID.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+        return cursor.fetchone()
+
+def get_users_by_gender(current_user_id, target_gender):
+    """
+    Возвращает список пользователей указанного пола, исключая текущего пользователя.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        # Исключаем пользователей, которым текущий пользователь уже ставил лайк
+        # и самого текущего пользователя
+        cursor.execute("""
+            SELECT * FROM users
+            WHERE gender = ? AND is_active = 1 AND telegram_id != ?
+            AND telegram_id NOT IN (SELECT to_id FROM likes WHERE from_id = ?)
+        """, (target_gender, current_user_id, current_user_id))
+        return cursor.fetchall()
+
+def get_candidate_columns(gender):
+    """
+    Возвращает для всех анкет указанного пола (по возрастанию id) поля, нужные ленте
+    и ранжированию: id, telegram_id, age, university, registered_at, housing_prefs
+    и признак наличия структурированных предпочтений (строки в housing_prefs).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, telegram_id, age, university, registered_at, housing_prefs,
+                   EXISTS (SELECT 1 FROM housing_prefs WHERE housing_prefs.telegram_id = users.telegram_id)
+            FROM users WHERE gender = ? AND is_active = 1 ORDER BY id
+        """, (gender,))
+        return cursor.fetchall()
+
+def get_liked_ids(from_id):
+    """
+    Возвращает отсортированный список telegram_id, которым пользователь поставил лайк.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_id FROM likes WHERE from_id = ? ORDER BY to_id", (from_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+def mark_users_inactive(telegram_ids):
+    """
+    Помечает пользователей неактивными (бот заблокирован, аккаунт удалён).
+    Возвращает список строк (telegram_id, gender) тех, кто был активен до этого.
+    """
+    telegram_ids = list(telegram_ids)
+    if not telegram_ids:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            placeholders = ', '.join('?' * len(telegram_ids))
+            cursor.execute(f"SELECT telegram_id, gender FROM users WHERE is_active = 1 AND telegram_id IN ({placeholders})",
+                           telegram_ids)
+            changed = cursor.fetchall()
+            cursor.execute(f"UPDATE users SET is_active = 0, inactive_at = CURRENT_TIMESTAMP WHERE is_active = 1 AND telegram_id IN ({placeholders})",
+                           telegram_ids)
+            conn.commit()
+            if changed:
+                logging.info(f"Помечено неактивными пользователей: {len(changed)}.")
+            return changed
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при пометке пользователей неактивными: {e}")
+            return []
+
+def reactivate_user(telegram_id):
+    """
+    Снова делает пользователя активным (он написал боту после блокировки).
+    Возвращает True, если пользователь был неактивен.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE users SET is_active = 1, inactive_at = NULL WHERE telegram_id = ? AND is_active = 0",
+                           (telegram_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при активации пользователя {telegram_id}: {e}")
+            return False
+
+def set_photo_file_id(telegram_id, file_id):
+    """
+    Запоминает file_id фото анкеты (None - сбросить, например при смене фото).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE users SET photo_file_id = ? WHERE telegram_id = ?", (file_id, telegram_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении file_id фото пользователя {telegram_id}: {e}")
+            return False
+
+def set_photo_ref(telegram_id, photo_ref, thumb_ref=None):
+    """
+    Сохраняет ссылки на новое фото анкеты и его миниатюру в хранилище и сбрасывает старый file_id.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE users SET photo_ref = ?, photo_thumb_ref = ?, photo_file_id = NULL
+                WHERE telegram_id = ?
+            """, (photo_ref, thumb_ref, telegram_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении фото пользователя {telegram_id}: {e}")
+            return False
+
+def get_photo_refs():
+    """
+    Множество всех ссылок на фото, которые есть в users (для очистки хранилища).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT photo_ref FROM users WHERE photo_ref IS NOT NULL
+            UNION SELECT photo_thumb_ref FROM users WHERE photo_thumb_ref IS NOT NULL
+        """)
+        return {row[0] for row in cursor.fetchall()}
+
+def get_all_users():
+    """
+    Возвращает список всех зарегистрированных пользователей, которым ещё можно писать.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT telegram_id FROM users WHERE is_active = 1")
+        return [row[0] for row in cursor.fetchall()]
+
+# Предпочтения по жилью
+def _upsert_housing_prefs(cursor, telegram_id, prefs):
+    cursor.execute("""
+        INSERT INTO housing_prefs (telegram_id, budget_min, budget_max, district, smoking, pets, move_in)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(telegram_id) DO UPDATE SET
+            budget_min = excluded.budget_min, budget_max = excluded.budget_max,
+            district = excluded.district, smoking = excluded.smoking,
+            pets = excluded.pets, move_in = excluded.move_in
+    """, (telegram_id, prefs['budget_min'], prefs['budget_max'], prefs['district'],
+          int(prefs['smoking']), int(prefs['pets']), prefs['move_in']))
+
+def set_housing_prefs(telegram_id, prefs):
+    """
+    Сохраняет предпочтения по жилью: JSON в users.housing_prefs и строку в housing_prefs
+    в одной транзакции. Возвращает обновлённую строку users или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE users SET housing_prefs = ? WHERE telegram_id = ?",
+                           (prefs_to_json(prefs), telegram_id))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return None
+            _upsert_housing_prefs(cursor, telegram_id, prefs)
+            cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+            user = cursor.fetchone()
+            conn.commit()
+            logging.info(f"Пользователь {telegram_id} обновил предпочтения по жилью.")
+            return user
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Ошибка при сохранении предпочтений {telegram_id}: {e}")
+            return None
+
+# Дата заезда для сравнения: "как можно скорее" (MOVE_IN_ASAP) - это сегодня
+_MOVE_IN_DATE = "CASE move_in WHEN ? THEN DATE('now') ELSE move_in END"
+
+def get_compatible_ids(telegram_id):
+    """
+    Возвращает отсортированный список telegram_id пользователей, совместимых по жилью:
+    бюджеты пересекаются, район совпадает (или одному из них район не важен),
+    одинаковое отношение к курению и животным, даты заезда отличаются не больше
+    чем на MOVE_IN_WINDOW_DAYS дней ("как можно скорее" - это сегодня).
+    Если у пользователя нет предпочтений, возвращает None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT budget_min, budget_max, district, smoking, pets, {_MOVE_IN_DATE} FROM housing_prefs WHERE telegram_id = ?",
+                       (MOVE_IN_ASAP, telegram_id))
+        me = cursor.fetchone()
+        if me is None:
+            return None
+        budget_min, budget_max, district, smoking, pets, move_in = me
+        conditions = "budget_min <= ? AND budget_max >= ?"
+        params = [budget_max, budget_min]
+        if district:
+            conditions = "district IN (?, '') AND " + conditions
+            params.insert(0, district)
+        cursor.execute(f"""
+            SELECT telegram_id FROM housing_prefs
+            WHERE {conditions}
+              AND smoking = ? AND pets = ?
+              AND {_MOVE_IN_DATE} BETWEEN DATE(?, ?) AND DATE(?, ?)
+              AND telegram_id != ?
+        """, (*params, smoking, pets, MOVE_IN_ASAP,
+              move_in, f"-{MOVE_IN_WINDOW_DAYS} days", move_in, f"+{MOVE_IN_WINDOW_DAYS} days", telegram_id))
+        # Сортируем в Python: ORDER BY telegram_id заставил бы SQLite обходить таблицу целиком вместо индекса
+        return sorted(row[0] for row in cursor.fetchall())
+
+# Функции для работы с лайками (без изменений)
+def add_like(from_id, to_id):
+    """
+    Добавляет лайк от одного пользователя другому.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO likes (from_id, to_id) VALUES (?, ?)", (from_id, to_id))
+            cursor.execute("UPDATE users SET likes_received = likes_received + 1 WHERE telegram_id = ?", (to_id,))
+            conn.commit()
+            logging.info(f"Пользователь {from_id} поставил лайк {to_id}.")
+            return True
+        except sqlite3.IntegrityError:
+            logging.warning(f"Лайк от {from_id} к {to_id} уже существует.")
+            return False
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при добавлении лайка: {e}")
+            return False
+
+def is_mutual_like(user1_id, user2_id):
+    """
+    Проверяет наличие взаимного лайка между двумя пользователями.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM likes WHERE from_id = ? AND to_id = ?", (user1_id, user2_id))
+        like1 = cursor.fetchone()
+        cursor.execute("SELECT 1 FROM likes WHERE from_id = ? AND to_id = ?", (user2_id, user1_id))
+        like2 = cursor.fetchone()
+        return like1 is not None and like2 is not None
+
+def like_and_check_mutual(from_id, to_id):
+    """
+    Ставит лайк и в той же транзакции проверяет взаимность.
+    Возвращает словарь:
+        is_new - лайк поставлен впервые,
+        is_mutual - у to_id уже есть лайк для from_id,
+        from_user, to_user - строки users обоих пользователей (или None);
+            в to_user уже учтён новый лайк (users.likes_received).
+    При ошибке БД возвращает None.
+    BEGIN IMMEDIATE сразу берёт блокировку на запись, поэтому два одновременных
+    встречных лайка не могут оба "не увидеть" друг друга.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("INSERT OR IGNORE INTO likes (from_id, to_id) VALUES (?, ?)", (from_id, to_id))
+            is_new = cursor.rowcount > 0
+            if is_new:
+                cursor.execute("UPDATE users SET likes_received = likes_received + 1 WHERE telegram_id = ?", (to_id,))
+            cursor.execute("SELECT 1 FROM likes WHERE from_id = ? AND to_id = ?", (to_id, from_id))
+            is_mutual = cursor.fetchone() is not None
+            cursor.execute("SELECT * FROM users WHERE telegram_id IN (?, ?)", (from_id, to_id))
+            users = {row[1]: row for row in cursor.fetchall()}
+            conn.commit()
+            if is_new:
+                logging.info(f"Пользователь {from_id} поставил лайк {to_id}.")
+            return {
+                "is_new": is_new,
+                "is_mutual": is_mutual,
+                "from_user": users.get(from_id),
+                "to_user": users.get(to_id),
+            }
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при добавлении лайка от {from_id} к {to_id}: {e}")
+            conn.rollback()
+            return None
+
+# Функции для работы с обращениями в поддержку
+def add_support_request(user_id, username, request_text, reason=None, assigned_admin=None):
+    """
+    Добавляет новое обращение в поддержку.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("INSERT INTO support_requests (user_id, username, request_text, reason, assigned_admin) VALUES (?, ?, ?, ?, ?)",
+                           (user_id, username, request_text, reason, assigned_admin))
+            conn.commit()
+            logging.info(f"Добавлено новое обращение от пользователя {user_id} (причина: {reason}, назначено: {assigned_admin}).")
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при добавлении обращения в поддержку: {e}")
+            return None
+
+def get_all_support_requests():
+    """
+    Возвращает все обращения в поддержку (без фильтрации по обработанности).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM support_requests ORDER BY timestamp DESC")
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при получении всех обращений: {e}")
+            return []
+
+def get_new_support_requests():
+    """
+    Возвращает список необработанных (is_processed = 0) обращений.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM support_requests WHERE is_processed = 0 ORDER BY timestamp DESC")
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при получении новых обращений: {e}")
+            return []
+
+def get_support_requests_for_admin(admin_id=None, reasons=None, include_processed=False):
+    """
+    Возвращает список обращений для указанного админа, включая не обработанные (is_processed = 0)
+    и отложенные (is_processed = 2), с возможностью фильтрации по причинам.
+    Если admin_id = None, возвращает обращения без привязки к админу (для главного админа).
+    Если include_processed = True, возвращает все обращения (включая обработанные),
+    соответствующие фильтрам.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query_parts = []
+            params = []
+
+            if admin_id is not None:
+                query_parts.append("assigned_admin = ?")
+                params.append(admin_id)
+
+            if not include_processed:
+                query_parts.append("is_processed IN (0, 2)") # Необработанные или отложенные
+
+            if reasons:
+                placeholders = ','.join(['?']*len(reasons))
+                query_parts.append(f"reason IN ({placeholders})")
+                params.extend(reasons)
+
+            query = "SELECT * FROM support_requests"
+            if query_parts:
+                query += " WHERE " + " AND ".join(query_parts)
+            query += " ORDER BY timestamp DESC"
+
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при получении обращений для админа {admin_id}: {e}")
+            return []
+
+def mark_support_request_processed(request_id):
+    """
+    Помечает обращение как обработанное (is_processed = 1).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE support_requests SET is_processed = 1 WHERE id = ?", (request_id,))
+            conn.commit()
+            logging.info(f"Обращение #{request_id} помечено как обработанное.")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при пометке обращения #{request_id} как обработанного: {e}")
+            conn.rollback()
+            return False
+
+def mark_support_request_deferred(request_id):
+    """
+    Помечает обращение как отложенное (is_processed = 2).
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE support_requests SET is_processed = 2 WHERE id = ?", (request_id,))
+            conn.commit()
+            logging.info(f"Обращение #{request_id} помечено как отложенное.")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при пометке обращения #{request_id} как отложенного: {e}")
+            conn.rollback()
+            return False
+
+def delete_support_request(request_id):
+    """
+    Удаляет обращение из базы данных.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM support_requests WHERE id = ?", (request_id,))
+            conn.commit()
+            logging.info(f"Обращение #{request_id} удалено.")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при удалении обращения #{request_id}: {e}")
+            conn.rollback()
+            return False
+
+def clear_support_requests():
+    """
+    Удаляет все обращения из базы данных.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM support_requests")
+            conn.commit()
+            logging.info("Все обращения в поддержку удалены.")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при очистке обращений: {e}")
+            conn.rollback()
+            return False
+
+def assign_admin_to_request(request_id, admin_id):
+    """
+    Назначает админа на конкретное обращение.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # Исправлено: условие WHERE assigned_admin IS NULL удалено,
+            # чтобы всегда обновлять назначенного админа, если функция вызывается.
+            # Если требуется назначение только для NULL, то нужно вернуть условие.
+            cursor.execute("UPDATE support_requests SET assigned_admin = ? WHERE id = ?", (admin_id, request_id))
+            conn.commit()
+            logging.info(f"Обращение #{request_id} назначено админу {admin_id}")
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при назначении админа #{admin_id} для обращения #{request_id}: {e}")
+            conn.rollback()
+            return False
+
+def get_support_request_by_id(request_id):
+    """
+    Возвращает информацию об обращении по его ID.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM support_requests WHERE id = ?", (request_id,))
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при получении обращения #{request_id}: {e}")
+            return None
+
+# Задания рассылки (строки broadcast_jobs: id, content, status, cursor, total, sent, failed,
+# created_by, status_chat_id, status_message_id, created_at, updated_at)
+def create_broadcast_job(content, created_by=None):
+    """
+    Создаёт задание рассылки для всех пользователей. content - JSON-строка.
+    Возвращает id задания или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO broadcast_jobs (content, total, created_by)
+                VALUES (?, (SELECT COUNT(*) FROM users WHERE is_active = 1), ?)
+            """, (content, created_by))
+            conn.commit()
+            logging.info(f"Создано задание рассылки #{cursor.lastrowid}.")
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при создании задания рассылки: {e}")
+            return None
+
+def get_broadcast_job(job_id):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+        return cursor.fetchone()
+
+def get_unfinished_broadcast_jobs():
+    """
+    Возвращает задания, которые ещё выполняются или стоят на паузе.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM broadcast_jobs WHERE status IN ('running', 'paused') ORDER BY id")
+        return cursor.fetchall()
+
+def get_broadcast_recipients(after_id=0, limit=100):
+    """
+    Следующая порция получателей рассылки: [(users.id, telegram_id)] с id больше after_id.
+    Получатели читаются порциями по первичному ключу, без загрузки всего списка.
+    Неактивные пользователи (заблокировали бота) пропускаются.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, telegram_id FROM users WHERE is_active = 1 AND id > ? ORDER BY id LIMIT ?", (after_id, limit))
+        return cursor.fetchall()
+
+def checkpoint_broadcast_job(job_id, cursor_id, sent, failed):
+    """
+    Сдвигает курсор задания и добавляет к счётчикам отправленных/неудачных.
+    Не трогает задание, если оно уже отменено. Возвращает обновлённую строку задания.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                UPDATE broadcast_jobs
+                SET cursor = ?, sent = sent + ?, failed = failed + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status != 'cancelled'
+            """, (cursor_id, sent, failed, job_id))
+            cursor.execute("SELECT * FROM broadcast_jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+            conn.commit()
+            return job
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении прогресса рассылки #{job_id}: {e}")
+            return None
+
+def set_broadcast_job_status(job_id, status, expected=None):
+    """
+    Меняет статус задания (running, paused, cancelled, done).
+    Если передан expected, статус меняется только из этих состояний.
+    Возвращает True, если задание обновлено.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            query = "UPDATE broadcast_jobs SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?"
+            params = [status, job_id]
+            if expected:
+                query += f" AND status IN ({', '.join('?' * len(expected))})"
+                params.extend(expected)
+            cursor.execute(query, params)
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при смене статуса рассылки #{job_id}: {e}")
+            return False
+
+def set_broadcast_job_status_message(job_id, chat_id, message_id):
+    """
+    Запоминает сообщение, в котором показывается прогресс задания.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("UPDATE broadcast_jobs SET status_chat_id = ?, status_message_id = ? WHERE id = ?",
+                           (chat_id, message_id, job_id))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении сообщения прогресса рассылки #{job_id}: {e}")
+            return False
+
+# Функции для работы с координатами пользователей
+def set_user_geo(telegram_id, latitude, longitude):
+    """
+    Сохраняет координаты пользователя для поиска рядом.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO user_geo (telegram_id, latitude, longitude, geohash) VALUES (?, ?, ?, ?)
+                ON CONFLICT(telegram_id) DO UPDATE SET latitude = excluded.latitude, longitude = excluded.longitude,
+                    geohash = excluded.geohash, updated_at = CURRENT_TIMESTAMP
+            """, (telegram_id, latitude, longitude, geohash.encode(latitude, longitude, GEOHASH_STORED_PRECISION)))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении координат пользователя {telegram_id}: {e}")
+            return False
+
+def get_nearby_users(latitude, longitude, radius_km):
+    """
+    Пользователи не дальше radius_km от точки: [(users.id, расстояние в км)], ближние первыми.
+    Кандидаты выбираются по индексу geohash диапазонами, покрывающими окрестность точки;
+    расстояние считается только для них.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    cos_lat = math.cos(math.radians(min(89.0, max(abs(south), abs(north)))))
+    lon_delta = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    # Окрестность через 180-й меридиан разбивается на две части
+    boxes = [(max(longitude - lon_delta, -180.0), min(longitude + lon_delta, 180.0))]
+    if longitude - lon_delta < -180.0:
+        boxes.append((longitude - lon_delta + 360.0, 180.0))
+    if longitude + lon_delta > 180.0:
+        boxes.append((-180.0, longitude + lon_delta - 360.0))
+
+    # В пределах радиуса поиска (единицы км) плоское приближение точнее 0,1%
+    km_per_degree_lon = KM_PER_DEGREE * math.cos(math.radians(latitude))
+    limit = radius_km * radius_km
+    result = []
+    with connection() as conn:
+        for west, east in boxes:
+            for start, end in geohash.covering_ranges(south, north, west, east):
+                for row_id, lat, lon in conn.execute("""
+                    SELECT u.id, g.latitude, g.longitude FROM user_geo g
+                    JOIN users u ON u.telegram_id = g.telegram_id
+                    WHERE g.geohash >= ? AND g.geohash < ?
+                """, (start, end)):
+                    dy = (lat - latitude) * KM_PER_DEGREE
+                    dx = ((lon - longitude + 180.0) % 360.0 - 180.0) * km_per_degree_lon
+                    distance = dx * dx + dy * dy
+                    if distance <= limit:
+                        result.append((row_id, math.sqrt(distance)))
+    result.sort(key=lambda item: item[1])
+    return result
+
+# Функции для работы с состояниями FSM
+def get_fsm_record(key):
+    """
+    Возвращает (state, data) для ключа FSM или None. data - JSON-строка или None.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,))
+        return cursor.fetchone()
+
+def save_fsm_records(records):
+    """
+    Сохраняет пачку записей FSM одной транзакцией. records - [(key, state, data)];
+    запись без состояния и данных удаляется. Возвращает True при успехе.
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("DELETE FROM fsm_storage WHERE key = ?",
+                               [(key,) for key, state, data in records if state is None and data is None])
+            cursor.executemany("""
+                INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data
+            """, [record for record in records if record[1] is not None or record[2] is not None])
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка при сохранении состояний FSM: {e}")
+            return False
+
+# Функции для работы с рассылками (УДАЛЕНЫ)
+# def save_broadcast_content(content_type, file_id=None, text_content=None, caption=None):
+#     """
+#     Сохраняет контент рассылки в базу данных.
+#     """
+#     with sqlite3.connect("database.db") as conn:
+#         cursor = conn.cursor()
+#         try:
+#             cursor.execute("INSERT INTO broadcast_content (content_type, file_id, text_content, caption) VALUES (?, ?, ?, ?)",
+#                            (content_type, file_id, text_content, caption))
+#             conn.commit()
+#             logging.info("Контент рассылки сохранён.")
+#             return True
+#         except sqlite3.Error as e:
+#             logging.error(f"Ошибка при сохранении контента рассылки: {e}")
+#             return False
+
+# def get_last_broadcast_content():
+#     """
+#     Возвращает последний сохраненный контент для рассылки.
+#     """
+#     with sqlite3.connect("database.db") as conn:
+#         cursor = conn.cursor()
+#         try:
+#             cursor.execute("SELECT content_type, file_id, text_content, caption FROM broadcast_content ORDER BY timestamp DESC LIMIT 1")
+#             return cursor.fetchone()
+#         except sqlite3.Error as e:
+#             logging.error(f"Ошибка при получении последнего контента рассылки: {e}")
+#             return None
+
+# def clear_broadcast_content():
+#     """
+#     Удаляет весь сохраненный контент рассылки.
+#     """
+#     with sqlite3.connect("database.db") as conn:
+#         cursor = conn.cursor()
+#         try:
+#             cursor.execute("DELETE FROM broadcast_content")
+#             conn.commit()
+#             logging.info("Весь контент рассылки удален.")
+#             return True
+#         except sqlite3.Error as e:
+#             logging.error(f"Ошибка при очистке контента рассылки: {e}")
 #             return False
\ No newline at end of file
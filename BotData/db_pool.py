@@ -0,0 +1,151 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Пул долгоживущих соединений с SQLite.
+# Раньше каждая функция открывала новое соединение с "database.db", и каждый запрос
+# платил за открытие файла, разбор схемы и настройку журнала. Теперь соединения
+# создаются один раз, настраиваются PRAGMA и переиспользуются.
+
+
+class ConnectionPool:
+    """
+    Пул соединений с одной базой SQLite.
+    Соединение выдаётся через контекстный менеджер connection(): при выходе без ошибки
+    транзакция фиксируется, при ошибке откатывается, а соединение возвращается в пул.
+    """
+
+    def __init__(self, path="database.db", size=4, busy_timeout=5000, cache_size=-16000,
+                 mmap_size=64 * 1024 * 1024, cached_statements=256):
+        self.path = path
+        self.size = size
+        self.busy_timeout = busy_timeout  # мс
+        self.cache_size = cache_size  # отрицательное значение - размер в КиБ
+        self.mmap_size = mmap_size  # байт
+        self.cached_statements = cached_statements  # кэш подготовленных выражений на соединение
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        """
+        Открывает новое соединение и применяет к нему настройки.
+        """
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Пул соединений закрыт.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+        # Все соединения заняты - ждём, пока какое-нибудь освободится
+        try:
+            return self._idle.get(timeout=self.busy_timeout / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Нет свободных соединений в пуле.")
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдаёт соединение из пула на время блока with.
+        """
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """
+        Закрывает все свободные соединения. Занятые закроются при возврате в пул.
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        logging.info(f"Пул соединений с {self.path} закрыт.")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_options = {}
+
+
+def configure(**options):
+    """
+    Задаёт параметры пула (path, size, busy_timeout, cache_size, mmap_size, cached_statements).
+    Должна вызываться до первого обращения к БД.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        _pool_options.update(options)
+
+
+def get_pool():
+    """
+    Возвращает общий пул, создавая его при первом обращении.
+    Путь к базе берётся из DB_PATH (по умолчанию "database.db"), размер пула - из DB_POOL_SIZE.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = {
+                    "path": os.getenv("DB_PATH", "database.db"),
+                    "size": int(os.getenv("DB_POOL_SIZE", "4")),
+                }
+                options.update(_pool_options)
+                _pool = ConnectionPool(**options)
+    return _pool
+
+
+def connection():
+    """
+    Соединение из общего пула: with connection() as conn: ...
+    """
+    return get_pool().connection()
+
+
+def close_pool():
+    """
+    Закрывает общий пул (при остановке бота).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,92 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+import numpy as np
+
+# Компактные множества "кому пользователь уже поставил лайк".
+# Вместо анти-join'а NOT IN (SELECT to_id FROM likes ...) в каждом запросе ленты
+# список лайков загружается один раз, хранится отсортированным array('q')
+# (8 байт на лайк) и дополняется при каждом новом лайке.
+
+
+class LikedSet:
+    """
+    Отсортированный массив telegram_id с проверкой принадлежности за O(log n).
+    """
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids=()):
+        self._ids = array('q', sorted(set(ids)))
+
+    def __contains__(self, telegram_id):
+        i = bisect_left(self._ids, telegram_id)
+        return i < len(self._ids) and self._ids[i] == telegram_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, telegram_id):
+        i = bisect_left(self._ids, telegram_id)
+        if i == len(self._ids) or self._ids[i] != telegram_id:
+            self._ids.insert(i, telegram_id)
+
+    def contains_many(self, telegram_ids):
+        """
+        Векторная проверка: булев массив "telegram_id уже лайкнут" для массива NumPy int64.
+        """
+        ids = np.frombuffer(self._ids, dtype=np.int64) if len(self._ids) else np.empty(0, dtype=np.int64)
+        positions = np.searchsorted(ids, telegram_ids)
+        found = np.zeros(len(telegram_ids), dtype=bool)
+        inside = positions < len(ids)
+        found[inside] = ids[positions[inside]] == telegram_ids[inside]
+        return found
+
+    @property
+    def nbytes(self):
+        return self._ids.itemsize * len(self._ids)
+
+
+class ExclusionRegistry:
+    """
+    LikedSet для каждого пользователя, которые недавно искали анкеты.
+    Количество хранимых множеств ограничено, давно не использованные вытесняются
+    и при следующем поиске загружаются из БД заново.
+    """
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._sets = OrderedDict()  # telegram_id -> LikedSet
+
+    def get(self, telegram_id):
+        liked = self._sets.get(telegram_id)
+        if liked is not None:
+            self._sets.move_to_end(telegram_id)
+        return liked
+
+    def put(self, telegram_id, liked):
+        self._sets[telegram_id] = liked
+        self._sets.move_to_end(telegram_id)
+        while len(self._sets) > self.maxsize:
+            self._sets.popitem(last=False)
+
+    def add(self, from_id, to_id):
+        """
+        Учитывает новый лайк. Если множество ещё не загружено, оно загрузится из БД уже с ним.
+        """
+        liked = self._sets.get(from_id)
+        if liked is not None:
+            liked.add(to_id)
+
+    def invalidate(self, telegram_id):
+        self._sets.pop(telegram_id, None)
+
+    def clear(self):
+        self._sets.clear()
+
+    def stats(self):
+        return {
+            "users": len(self._sets),
+            "likes": sum(len(liked) for liked in self._sets.values()),
+            "bytes": sum(liked.nbytes for liked in self._sets.values()),
+        }
@@ -0,0 +1,303 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from copy import copy
+from itertools import islice
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from BotData.database_async import get_fsm_record, save_fsm_records
+
+# Хранилище состояний FSM в SQLite-файле бота (таблица fsm_storage).
+# С MemoryStorage регистрация, поиск и черновик рассылки пропадали при перезапуске.
+# Чтобы не добавлять запрос к БД в каждый state.update_data:
+#   - записи читаются и меняются в памяти (горячий слой на FSM_HOT_KEYS ключей);
+#     из БД ключ читается только при первом обращении после запуска;
+#   - изменённые ключи копятся и раз в FSM_FLUSH_INTERVAL секунд пишутся одной транзакцией,
+#     так что ключ попадает в БД не чаще раза за интервал, сколько бы раз его ни меняли;
+#   - данные хранятся в компактном JSON (без пробелов, UTF-8 без экранирования).
+# При остановке бота (close) несохранённые изменения записываются сразу.
+#
+# CompactMemoryStorage - замена MemoryStorage без БД для случаев, когда переживать перезапуск
+# не нужно. В отличие от MemoryStorage брошенные сессии не остаются в памяти навсегда:
+# сессия, к которой не обращались FSM_SESSION_TTL секунд, удаляется, а при превышении
+# FSM_MEMORY_BUDGET байт вытесняются самые давние сессии.
+# Какое хранилище использовать, задаёт FSM_STORAGE: sqlite (по умолчанию) или memory.
+
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_HOT_KEYS = int(os.getenv("FSM_HOT_KEYS", "10000"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1"))
+FSM_SESSION_TTL = float(os.getenv("FSM_SESSION_TTL", str(24 * 3600)))
+FSM_MEMORY_BUDGET = int(os.getenv("FSM_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+RECORD_OVERHEAD = 400  # примерный размер ключа, записи и пустого словаря в байтах
+
+
+def _key_string(key):
+    return (f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:"
+            f"{key.business_connection_id or ''}:{key.destiny}")
+
+
+def _dumps(data):
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Record:
+    __slots__ = ("state", "data")
+
+    def __init__(self, state=None, data=None):
+        self.state = state
+        self.data = data or {}
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище FSM с горячим слоем в памяти и отложенной пачечной записью в SQLite.
+    """
+
+    def __init__(self, hot_keys=FSM_HOT_KEYS, flush_interval=FSM_FLUSH_INTERVAL):
+        self.hot_keys = hot_keys
+        self.flush_interval = flush_interval
+        self._hot = OrderedDict()  # StorageKey -> _Record
+        self._dirty = set()  # ключи, изменённые после последней записи
+        self._flush_task = None
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.written = 0
+
+    async def _record(self, key):
+        record = self._hot.get(key)
+        if record is not None:
+            self.hits += 1
+            self._hot.move_to_end(key)
+            return record
+        self.misses += 1
+        row = await get_fsm_record(_key_string(key))
+        record = self._hot.get(key)  # ключ могли записать, пока шёл запрос
+        if record is None:
+            record = _Record(row[0], json.loads(row[1]) if row and row[1] else None) if row else _Record()
+            self._hot[key] = record
+            self._evict(keep=key)
+        return record
+
+    def _evict(self, keep=None):
+        """
+        Вытесняет самые давние ключи сверх hot_keys. Несохранённые ключи и keep не вытесняются.
+        """
+        excess = len(self._hot) - self.hot_keys
+        if excess <= 0:
+            return
+        # Идём от самых давних ключей и останавливаемся на excess-м вытесняемом,
+        # а не перебираем весь горячий слой
+        evictable = (key for key in self._hot if key not in self._dirty and key != keep)
+        for key in list(islice(evictable, excess)):
+            del self._hot[key]
+
+    def _touch(self, key):
+        self._dirty.add(key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        except asyncio.CancelledError:
+            return
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """
+        Записывает все изменённые ключи одной транзакцией.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        records = []
+        for key in dirty:
+            record = self._hot[key]
+            try:
+                records.append((_key_string(key), record.state, _dumps(record.data)))
+            except (TypeError, ValueError) as e:
+                logging.error(f"Данные FSM {key} не сериализуются в JSON и не будут сохранены: {e}")
+        if not await save_fsm_records(records):
+            self._dirty |= dirty  # попробуем ещё раз при следующей записи
+            self._touch(next(iter(dirty)))
+            return
+        self.flushes += 1
+        self.written += len(records)
+        self._evict()
+
+    async def set_state(self, key, state=None):
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(key)
+
+    async def get_state(self, key):
+        return (await self._record(key)).state
+
+    async def set_data(self, key, data):
+        record = await self._record(key)
+        record.data = data.copy()
+        self._touch(key)
+
+    async def get_data(self, key):
+        return (await self._record(key)).data.copy()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def stats_text(self):
+        stats = self.stats()
+        return (f"В памяти: {stats['hot']}, не записано: {stats['dirty']}\n"
+                f"Чтений из памяти: {stats['hits']}, из БД: {stats['misses']}\n"
+                f"Записей в БД: {stats['flushes']} ({stats['written']} ключей)")
+
+    def stats(self):
+        return {
+            "hot": len(self._hot),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "flushes": self.flushes,
+            "written": self.written,
+        }
+
+
+def _data_size(data):
+    """
+    Оценка памяти под данные сессии - длина их компактного JSON.
+    """
+    try:
+        encoded = _dumps(data)
+    except (TypeError, ValueError):
+        encoded = repr(data)
+    return len(encoded) if encoded else 0
+
+
+class _CompactRecord:
+    __slots__ = ("state", "data", "data_size", "expires")
+
+    def __init__(self, state, data, data_size, expires):
+        self.state = state
+        self.data = data
+        self.data_size = data_size
+        self.expires = expires
+
+    @property
+    def size(self):
+        return RECORD_OVERHEAD + len(self.state or "") + self.data_size
+
+
+class CompactMemoryStorage(BaseStorage):
+    """
+    Хранилище FSM в памяти с временем жизни сессий и ограничением по объёму.
+    """
+
+    def __init__(self, ttl=FSM_SESSION_TTL, budget=FSM_MEMORY_BUDGET):
+        self.ttl = ttl
+        self.budget = budget
+        self._records = OrderedDict()  # StorageKey -> _CompactRecord, от давних к недавним
+        self.bytes = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _get(self, key):
+        self._shrink()
+        record = self._records.get(key)
+        if record is None:
+            return None
+        record.expires = time.monotonic() + self.ttl
+        self._records.move_to_end(key)
+        return record
+
+    def _put(self, key, state, data, data_size):
+        old = self._records.pop(key, None)
+        if old is not None:
+            self.bytes -= old.size
+        if state is None and not data:
+            return  # пустая сессия не хранится
+        record = _CompactRecord(state, data, data_size, time.monotonic() + self.ttl)
+        self._records[key] = record
+        self.bytes += record.size
+        self._shrink()
+
+    def _shrink(self):
+        """
+        Удаляет просроченные сессии и вытесняет давние, пока объём выше бюджета.
+        Сессии упорядочены по последнему обращению, а TTL у всех один, поэтому
+        просроченные всегда в начале.
+        """
+        now = time.monotonic()
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.expires <= now:
+                self.expired += 1
+            elif self.bytes > self.budget and len(self._records) > 1:
+                self.evicted += 1
+            else:
+                break
+            del self._records[key]
+            self.bytes -= record.size
+
+    async def set_state(self, key, state=None):
+        state = state.state if isinstance(state, State) else state
+        record = self._get(key)
+        if record is None:
+            self._put(key, state, {}, 0)
+        else:
+            self._put(key, state, record.data, record.data_size)
+
+    async def get_state(self, key):
+        record = self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key, data):
+        record = self._get(key)
+        self._put(key, record.state if record else None, data.copy(), _data_size(data))
+
+    async def get_data(self, key):
+        record = self._get(key)
+        return record.data.copy() if record else {}
+
+    async def get_value(self, storage_key, dict_key, default=None):
+        record = self._get(storage_key)
+        return copy(record.data.get(dict_key, default)) if record else default
+
+    async def close(self):
+        pass
+
+    def stats_text(self):
+        stats = self.stats()
+        return (f"Сессий в памяти: {stats['sessions']}, {stats['bytes'] // 1024} КиБ "
+                f"из {stats['budget'] // 1024} КиБ\n"
+                f"Удалено по времени: {stats['expired']}, вытеснено: {stats['evicted']}")
+
+    def stats(self):
+        return {
+            "sessions": len(self._records),
+            "bytes": self.bytes,
+            "budget": self.budget,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+def create_storage(kind=FSM_STORAGE):
+    """
+    Хранилище FSM, выбранное в FSM_STORAGE.
+    """
+    if kind == "memory":
+        return CompactMemoryStorage()
+    if kind != "sqlite":
+        logging.warning(f"Неизвестное FSM_STORAGE={kind}, используется sqlite.")
+    return SQLiteStorage()
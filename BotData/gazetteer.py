@@ -0,0 +1,195 @@
+import csv
+import math
+import os
+import re
+from collections import namedtuple
+
+from BotData.cache import TTLCache
+from BotData.geohash import encode as geohash
+
+# Офлайн-геокодер по справочнику городов BotData/gazetteer.csv
+# (название, другие названия через "|", область, округ, страна, широта, долгота).
+# Раньше город по координатам и координаты по названию запрашивались у Nominatim по сети,
+# синхронно, прямо из обработчиков. Теперь:
+#   - ближайший город ищется в KD-дереве по точкам на единичной сфере (так расстояния
+#     корректны и у полюсов, и через 180-й меридиан); если он дальше CITY_MAX_DISTANCE_KM,
+#     место считается неизвестным - в справочнике только крупные города, и точку в глуши
+#     не стоит приписывать городу за сотни километров;
+#   - город по названию - в словаре нормализованных названий (регистр, ё/е, дефисы, "г.").
+# Справочник загружается один раз при импорте; оба поиска занимают микросекунды.
+#
+# Названия сравниваются по транслитерированному ключу (translit_key), поэтому "Almaty",
+# "Алматы" и "Алма-Ата" находят один город, а "Ekaterinburg" - "Екатеринбург".
+# Ответы city_at/city_named кэшируются в LRU: точки - по geohash точности GEOHASH_PRECISION
+# (соседи по общежитию присылают координаты в сотне метров друг от друга),
+# названия - по ключу translit_key.
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(__file__), "gazetteer.csv"))
+EARTH_RADIUS_KM = 6371.0
+CITY_MAX_DISTANCE_KM = float(os.getenv("CITY_MAX_DISTANCE_KM", "50"))
+GEOHASH_PRECISION = int(os.getenv("GEOHASH_PRECISION", "6"))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+
+City = namedtuple("City", "name state region country latitude longitude")
+
+_CITY_PREFIX = re.compile(r"^(г|гор|город|city of)\.?\s+")
+_NOT_WORD = re.compile(r"[^\w]+")
+
+_CYRILLIC = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "h", "ц": "c", "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "",
+    "ы": "i", "ь": "", "э": "e", "ю": "u", "я": "a",
+    # казахские и украинские буквы
+    "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u", "һ": "h", "і": "i",
+    "ї": "i", "є": "e", "ґ": "g",
+}
+# Разные латинские записи одного звука: Yekaterinburg/Ekaterinburg, Kiev/Kiyev, Almaty/Almati
+_LATIN = [("kh", "h"), ("ts", "c"), ("ya", "a"), ("yu", "u"), ("ye", "e"), ("yo", "o"),
+          ("y", "i"), ("j", "i"), ("x", "ks"), ("w", "v"), ("q", "k")]
+_REPEATS = re.compile(r"(.)\1+")
+
+
+def normalize_name(name):
+    """
+    Ключ для поиска по названию: "г. Алма-Ата" -> "алма ата".
+    """
+    name = name.casefold().replace("ё", "е").strip()
+    name = _CITY_PREFIX.sub("", name)
+    return _NOT_WORD.sub(" ", name).strip()
+
+
+def translit_key(name):
+    """
+    Ключ названия, не зависящий от алфавита и варианта транслитерации: "Алма-Ата" -> "alma ata".
+    """
+    key = "".join(_CYRILLIC.get(char, char) for char in normalize_name(name))
+    for latin, replacement in _LATIN:
+        key = key.replace(latin, replacement)
+    return _REPEATS.sub(r"\1", key)
+
+
+def _to_xyz(latitude, longitude):
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+class KDTree:
+    """
+    KD-дерево по трёхмерным точкам. Узел - кортеж (индекс точки, ось, левое поддерево, правое).
+    """
+
+    def __init__(self, points):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices, depth):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        middle = len(indices) // 2
+        return (indices[middle], axis,
+                self._build(indices[:middle], depth + 1),
+                self._build(indices[middle + 1:], depth + 1))
+
+    def nearest(self, point):
+        """
+        Возвращает (индекс ближайшей точки, квадрат расстояния до неё) или (None, inf).
+        """
+        best, best_dist = None, math.inf
+        stack = [(self.root, 0.0)]  # (узел, квадрат расстояния до плоскости, отделяющей его от точки)
+        while stack:
+            node, plane_dist = stack.pop()
+            if node is None or plane_dist >= best_dist:
+                continue
+            index, axis, left, right = node
+            candidate = self.points[index]
+            dist = ((candidate[0] - point[0]) ** 2 + (candidate[1] - point[1]) ** 2
+                    + (candidate[2] - point[2]) ** 2)
+            if dist < best_dist:
+                best, best_dist = index, dist
+            diff = point[axis] - candidate[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Дальнее поддерево проверится после ближнего и только если плоскость ближе лучшей точки
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        return best, best_dist
+
+
+class Gazetteer:
+    """
+    Справочник городов с поиском ближайшего города и поиском по названию.
+    """
+
+    def __init__(self, cities, aliases):
+        self.cities = cities
+        self.tree = KDTree([_to_xyz(city.latitude, city.longitude) for city in cities])
+        self.names = {}  # translit_key названия -> индекс города
+        for index, city in enumerate(cities):
+            for name in (city.name, *aliases[index]):
+                self.names.setdefault(translit_key(name), index)  # при совпадении побеждает город выше в файле
+
+    @classmethod
+    def from_csv(cls, path=GAZETTEER_PATH):
+        cities, aliases = [], []
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                cities.append(City(row["name"], row["state"], row["region"], row["country"],
+                                   float(row["latitude"]), float(row["longitude"])))
+                aliases.append([alias for alias in row["aliases"].split("|") if alias])
+        return cls(cities, aliases)
+
+    def nearest(self, latitude, longitude):
+        """
+        Ближайший к точке город и расстояние до него в км.
+        """
+        index, chord = self.tree.nearest(_to_xyz(latitude, longitude))
+        if index is None:
+            return None, math.inf
+        distance = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(chord) / 2))
+        return self.cities[index], distance
+
+    def lookup(self, name):
+        """
+        Город по названию или None. "Алматы, Казахстан" ищется как "Алматы".
+        """
+        index = self.names.get(translit_key(name))
+        if index is None and "," in name:
+            index = self.names.get(translit_key(name.split(",", 1)[0]))
+        return self.cities[index] if index is not None else None
+
+
+gazetteer = Gazetteer.from_csv()
+
+# Справочник не меняется во время работы, поэтому записи кэшей не устаревают
+point_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=math.inf)
+name_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, ttl=math.inf)
+_MISSING = object()
+
+
+def city_at(latitude, longitude):
+    """
+    Ближайший город для точки или None, если ближе CITY_MAX_DISTANCE_KM городов нет.
+    Точки одной ячейки geohash получают один ответ.
+    """
+    key = geohash(latitude, longitude, GEOHASH_PRECISION)
+    city = point_cache.get(key, _MISSING)
+    if city is _MISSING:
+        city, distance = gazetteer.nearest(latitude, longitude)
+        if distance > CITY_MAX_DISTANCE_KM:
+            city = None
+        point_cache.set(key, city)
+    return city
+
+
+def city_named(name):
+    """
+    Город по названию или None (отсутствие тоже кэшируется).
+    """
+    key = translit_key(name)
+    city = name_cache.get(key, _MISSING)
+    if city is _MISSING:
+        city = gazetteer.lookup(name)
+        name_cache.set(key, city)
+    return city
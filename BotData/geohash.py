@@ -0,0 +1,82 @@
+# Geohash: точка кодируется строкой, и у близких точек общий префикс.
+# Ячейка точности 5 - примерно 4,9 x 4,9 км, 6 - 1,2 x 0,6 км, 7 - 153 x 153 м.
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude, longitude, precision=6):
+    """
+    Geohash точки длиной precision символов.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits, value, even = 0, 0, True  # чётные биты - долгота, нечётные - широта
+    while len(chars) < precision:
+        if even:
+            middle = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= middle:
+                value = value * 2 + 1
+                lon_range[0] = middle
+            else:
+                value *= 2
+                lon_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                value = value * 2 + 1
+                lat_range[0] = middle
+            else:
+                value *= 2
+                lat_range[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """
+    Размер ячейки в градусах: (по широте, по долготе).
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_ranges(south, north, west, east, max_cells=128):
+    """
+    Диапазоны строк [(от, до)) geohash, которые покрывают прямоугольник.
+    Берётся самая мелкая точность, при которой ячеек не больше max_cells; соседние по
+    порядку ячейки одного родителя склеиваются в один диапазон. Прямоугольник не должен
+    пересекать 180-й меридиан.
+    """
+    precision = 1
+    for candidate in range(1, 10):
+        lat_step, lon_step = cell_size(candidate)
+        rows = int((north + 90) // lat_step) - int((south + 90) // lat_step) + 1
+        cols = int((east + 180) // lon_step) - int((west + 180) // lon_step) + 1
+        if rows * cols > max_cells:
+            break
+        precision = candidate
+    lat_step, lon_step = cell_size(precision)
+    cells = set()
+    lat = (south + 90) // lat_step * lat_step - 90
+    while lat <= north:
+        lon = (west + 180) // lon_step * lon_step - 180
+        while lon <= east:
+            cells.add(encode(min(lat + lat_step / 2, 90.0), min(lon + lon_step / 2, 180.0), precision))
+            lon += lon_step
+        lat += lat_step
+
+    ranges = []
+    for cell in sorted(cells):
+        if ranges:
+            start, last = ranges[-1]
+            if last[:-1] == cell[:-1] and _BASE32.index(cell[-1]) == _BASE32.index(last[-1]) + 1:
+                ranges[-1] = (start, cell)
+                continue
+        ranges.append((cell, cell))
+    # "~" больше любого символа base32, поэтому [start, last + "~") - все хэши с префиксами от start до last
+    return [(start, last + "~") for start, last in ranges]
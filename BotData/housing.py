@@ -0,0 +1,108 @@
+import json
+from datetime import datetime
+
+# Предпочтения по жилью.
+# Хранятся в двух местах: JSON в users.housing_prefs (для показа анкеты и ранжирования)
+# и строка в таблице housing_prefs с индексами под поиск совместимых соседей.
+# Поля:
+#   budget_min, budget_max - бюджет в тенге в месяц,
+#   district - район ("" - любой),
+#   smoking - курит ли пользователь,
+#   pets - есть питомец или не против питомцев,
+#   move_in - желаемая дата заезда (YYYY-MM-DD) или MOVE_IN_ASAP - "как можно скорее";
+#     такая дата при подборе соседей считается сегодняшней, сколько бы времени ни прошло.
+
+DISTRICTS = ['Алатауский', 'Алмалинский', 'Ауэзовский', 'Бостандыкский',
+             'Жетысуский', 'Медеуский', 'Наурызбайский', 'Турксибский']
+ANY_DISTRICT = 'Любой'
+
+NO_BUDGET_LIMIT = 10 ** 9  # верхняя граница бюджета, если пользователь её не указал
+MOVE_IN_WINDOW_DAYS = 30  # насколько могут расходиться даты заезда у совместимых соседей
+MOVE_IN_ASAP = 'asap'
+
+
+def parse_budget(text):
+    """
+    Разбирает бюджет вида "80000-150000", "до 120000" или одно число.
+    Возвращает (budget_min, budget_max) или None, если разобрать не удалось.
+    """
+    if not text:
+        return None
+    text = text.lower().replace(' ', '').replace('тг', '').replace('₸', '')
+    try:
+        if text.startswith('до'):
+            return 0, int(text[2:])
+        if text.startswith('от'):
+            return int(text[2:]), NO_BUDGET_LIMIT
+        if '-' in text:
+            low, high = text.split('-', 1)
+            low, high = int(low), int(high)
+            return (low, high) if low <= high else (high, low)
+        value = int(text)
+        return value, value
+    except ValueError:
+        return None
+
+
+def parse_move_in(text):
+    """
+    Разбирает дату заезда в формате ДД.ММ.ГГГГ. Возвращает строку YYYY-MM-DD или None.
+    """
+    if not text:
+        return None
+    try:
+        return datetime.strptime(text.strip(), '%d.%m.%Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+def make_prefs(budget_min, budget_max, district, smoking, pets, move_in=None):
+    """
+    Собирает словарь предпочтений в едином формате. move_in=None - "как можно скорее".
+    """
+    return {
+        'budget_min': budget_min if budget_min is not None else 0,
+        'budget_max': budget_max if budget_max is not None else NO_BUDGET_LIMIT,
+        'district': '' if district in (None, ANY_DISTRICT) else district,
+        'smoking': bool(smoking),
+        'pets': bool(pets),
+        'move_in': move_in or MOVE_IN_ASAP,
+    }
+
+
+def prefs_to_json(prefs):
+    return json.dumps(prefs, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+
+
+def prefs_from_json(text):
+    """
+    Возвращает словарь предпочтений из users.housing_prefs или None.
+    """
+    if not text:
+        return None
+    try:
+        prefs = json.loads(text)
+    except ValueError:
+        return None
+    return prefs if isinstance(prefs, dict) and 'budget_min' in prefs else None
+
+
+def describe(prefs):
+    """
+    Текст о предпочтениях для анкеты.
+    """
+    if prefs['budget_max'] >= NO_BUDGET_LIMIT:
+        budget = f"от {prefs['budget_min']} тг" if prefs['budget_min'] else "не важен"
+    else:
+        budget = f"{prefs['budget_min']}–{prefs['budget_max']} тг"
+    if prefs['move_in'] == MOVE_IN_ASAP:
+        move_in = "как можно скорее"
+    else:
+        move_in = "с " + datetime.strptime(prefs['move_in'], '%Y-%m-%d').strftime('%d.%m.%Y')
+    return (
+        f"<b>Бюджет:</b> {budget}\n"
+        f"<b>Район:</b> {prefs['district'] or ANY_DISTRICT}\n"
+        f"<b>Курение:</b> {'курю' if prefs['smoking'] else 'не курю'}\n"
+        f"<b>Животные:</b> {'есть / не против' if prefs['pets'] else 'без животных'}\n"
+        f"<b>Заезд:</b> {move_in}"
+    )
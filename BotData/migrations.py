@@ -0,0 +1,321 @@
+import sqlite3
+import logging
+
+# Версионированные миграции схемы БД.
+# Текущая версия хранится в таблице schema_version. Каждая миграция - это функция,
+# которая получает соединение и выполняется в отдельной транзакции (BEGIN IMMEDIATE),
+# поэтому бот можно обновлять прямо на рабочей базе: при старте применяются только
+# те шаги, которых ещё нет в schema_version.
+# Новые изменения схемы добавляются ТОЛЬКО новым шагом в конец MIGRATIONS.
+
+
+def _column_names(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _baseline(conn):
+    """
+    Исходные таблицы бота.
+    """
+    # Таблица пользователей
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        telegram_id INTEGER UNIQUE,
+                        name TEXT,
+                        age INTEGER,
+                        gender TEXT,
+                        university TEXT,
+                        description TEXT,
+                        photo TEXT,
+                        housing_prefs TEXT,
+                        registered_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )''')
+
+    # Таблица для хранения города (Алматы)
+    conn.execute('''CREATE TABLE IF NOT EXISTS location (
+                        telegram_id INTEGER PRIMARY KEY,
+                        city TEXT DEFAULT 'Алматы'
+                    )''')
+
+    # Таблица лайков
+    conn.execute('''CREATE TABLE IF NOT EXISTS likes (
+                        from_id INTEGER,
+                        to_id INTEGER,
+                        PRIMARY KEY (from_id, to_id)
+                    )''')
+
+    # Таблица обращений в поддержку
+    conn.execute('''CREATE TABLE IF NOT EXISTS support_requests (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        username TEXT,
+                        request_text TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        is_processed INTEGER DEFAULT 0, -- 0: не обработано, 1: обработано, 2: отложено
+                        reason TEXT,
+                        assigned_admin INTEGER
+                    )''')
+
+
+def _users_housing_prefs_and_registered_at(conn):
+    """
+    Старые базы были созданы без users.housing_prefs и users.registered_at.
+    """
+    columns = _column_names(conn, "users")
+    if "housing_prefs" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN housing_prefs TEXT")
+    if "registered_at" not in columns:
+        # ALTER TABLE не позволяет DEFAULT CURRENT_TIMESTAMP, поэтому заполняем вручную,
+        # а add_user передаёт время регистрации явно.
+        conn.execute("ALTER TABLE users ADD COLUMN registered_at DATETIME")
+        conn.execute("UPDATE users SET registered_at = CURRENT_TIMESTAMP WHERE registered_at IS NULL")
+
+
+def _drop_broadcast_content(conn):
+    """
+    Контент рассылки хранится в FSM, таблица broadcast_content больше не используется.
+    """
+    conn.execute("DROP TABLE IF EXISTS broadcast_content")
+
+
+def _performance_indexes(conn):
+    """
+    Индексы под горячие фильтры.
+    """
+    # Лента поиска: WHERE gender = ? AND id > ? ORDER BY id (id - это rowid, он уже входит в индекс)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_gender ON users(gender)")
+    # Кто лайкнул пользователя: WHERE to_id = ? (from_id в индексе - чтобы не ходить в таблицу)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_likes_to_id ON likes(to_id, from_id)")
+    # Новые/отложенные обращения: WHERE is_processed ... ORDER BY timestamp
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_support_requests_status ON support_requests(is_processed, timestamp)")
+    # Обращения конкретного админа
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_support_requests_admin ON support_requests(assigned_admin, is_processed, timestamp)")
+
+
+def _housing_prefs_table(conn):
+    """
+    Структурированные предпочтения по жилью (см. BotData/housing.py) с индексами
+    под поиск совместимых соседей: район - равенство, бюджет - пересечение диапазонов.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS housing_prefs (
+                        telegram_id INTEGER PRIMARY KEY,
+                        budget_min INTEGER NOT NULL,
+                        budget_max INTEGER NOT NULL,
+                        district TEXT NOT NULL DEFAULT '', -- '': любой район
+                        smoking INTEGER NOT NULL,
+                        pets INTEGER NOT NULL,
+                        move_in DATE NOT NULL
+                    )''')
+    # Совместимые по району: WHERE district IN (?, '') AND budget_min <= ? ...
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_housing_prefs_district ON housing_prefs(district, budget_min)")
+    # Без ограничения по району: WHERE budget_min <= ? ...
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_housing_prefs_budget ON housing_prefs(budget_min, budget_max)")
+    # Переносим предпочтения, которые уже лежат в users.housing_prefs в этом формате
+    conn.execute('''INSERT OR IGNORE INTO housing_prefs
+                        (telegram_id, budget_min, budget_max, district, smoking, pets, move_in)
+                    SELECT telegram_id,
+                           json_extract(housing_prefs, '$.budget_min'),
+                           json_extract(housing_prefs, '$.budget_max'),
+                           COALESCE(json_extract(housing_prefs, '$.district'), ''),
+                           COALESCE(json_extract(housing_prefs, '$.smoking'), 0),
+                           COALESCE(json_extract(housing_prefs, '$.pets'), 0),
+                           COALESCE(json_extract(housing_prefs, '$.move_in'), DATE('now'))
+                    FROM users
+                    WHERE json_valid(housing_prefs)
+                      AND json_extract(housing_prefs, '$.budget_min') IS NOT NULL
+                      AND json_extract(housing_prefs, '$.budget_max') IS NOT NULL''')
+
+
+def _broadcast_jobs_table(conn):
+    """
+    Задания рассылки (App/broadcast.py): контент, курсор по users.id и счётчики,
+    чтобы рассылка переживала перезапуск бота.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        content TEXT NOT NULL, -- JSON: type, text, file_id, caption
+                        status TEXT NOT NULL DEFAULT 'running', -- running, paused, cancelled, done
+                        cursor INTEGER NOT NULL DEFAULT 0, -- users.id последнего обработанного получателя
+                        total INTEGER NOT NULL DEFAULT 0,
+                        sent INTEGER NOT NULL DEFAULT 0,
+                        failed INTEGER NOT NULL DEFAULT 0,
+                        created_by INTEGER,
+                        status_chat_id INTEGER, -- сообщение с прогрессом у админа
+                        status_message_id INTEGER,
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    # Незавершённые задания при старте бота: WHERE status IN ('running', 'paused')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)")
+
+
+def _users_is_active(conn):
+    """
+    users.is_active: 0 - пользователь заблокировал бота или удалил аккаунт
+    (постоянная ошибка доставки), такие анкеты не попадают в поиск и рассылки.
+    """
+    columns = _column_names(conn, "users")
+    if "is_active" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1")
+    if "inactive_at" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN inactive_at DATETIME")
+    # Лента поиска: WHERE gender = ? AND is_active = 1 AND id > ? ORDER BY id
+    conn.execute("DROP INDEX IF EXISTS idx_users_gender")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_gender_active ON users(gender, is_active)")
+    # Рассылки и список пользователей: WHERE is_active = 1 AND id > ? ORDER BY id
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active)")
+
+
+def _users_likes_received(conn):
+    """
+    users.likes_received - счётчик полученных лайков. Увеличивается вместе со вставкой
+    лайка, чтобы уведомлениям не нужен был COUNT(*) по likes.
+    """
+    if "likes_received" not in _column_names(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN likes_received INTEGER NOT NULL DEFAULT 0")
+    conn.execute("UPDATE users SET likes_received = (SELECT COUNT(*) FROM likes WHERE likes.to_id = users.telegram_id)")
+
+
+def _users_photo_file_id(conn):
+    """
+    users.photo_file_id - file_id, который Telegram вернул после первой загрузки фото анкеты.
+    Повторные отправки используют его вместо повторной загрузки байтов.
+    """
+    if "photo_file_id" not in _column_names(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN photo_file_id TEXT")
+
+
+def _users_photo_ref(conn):
+    """
+    users.photo_ref - ссылка (SHA-256) на фото в хранилище BotData/photo_store.py.
+    Сами байты фото в БД не хранятся.
+    """
+    if "photo_ref" not in _column_names(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN photo_ref TEXT")
+
+
+def _users_photo_thumb_ref(conn):
+    """
+    users.photo_thumb_ref - ссылка на миниатюру фото (BotData/photo_ingest.py).
+    """
+    if "photo_thumb_ref" not in _column_names(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN photo_thumb_ref TEXT")
+
+
+def _fsm_storage_table(conn):
+    """
+    Состояния FSM (BotData/fsm_storage.py): ключ StorageKey, имя состояния и данные в JSON.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS fsm_storage (
+                        key TEXT PRIMARY KEY,
+                        state TEXT,
+                        data TEXT
+                    ) WITHOUT ROWID''')
+
+
+def _user_geo_table(conn):
+    """
+    Координаты пользователей для поиска рядом. Индекс по geohash (с координатами,
+    чтобы не ходить в таблицу) позволяет выбирать точки в окрестности диапазонами строк.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS user_geo (
+                        telegram_id INTEGER PRIMARY KEY,
+                        latitude REAL NOT NULL,
+                        longitude REAL NOT NULL,
+                        geohash TEXT NOT NULL,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_geo_geohash ON user_geo(geohash, latitude, longitude)")
+
+
+# (версия, описание, функция). Порядок и номера версий менять нельзя.
+MIGRATIONS = [
+    (1, "baseline tables", _baseline),
+    (2, "users.housing_prefs and users.registered_at", _users_housing_prefs_and_registered_at),
+    (3, "drop broadcast_content", _drop_broadcast_content),
+    (4, "performance indexes", _performance_indexes),
+    (5, "housing_prefs table", _housing_prefs_table),
+    (6, "broadcast_jobs table", _broadcast_jobs_table),
+    (7, "users.is_active", _users_is_active),
+    (8, "users.likes_received", _users_likes_received),
+    (9, "users.photo_file_id", _users_photo_file_id),
+    (10, "users.photo_ref", _users_photo_ref),
+    (11, "users.photo_thumb_ref", _users_photo_thumb_ref),
+    (12, "fsm_storage table", _fsm_storage_table),
+    (13, "user_geo table", _user_geo_table),
+]
+
+
+def get_schema_version(conn):
+    """
+    Возвращает текущую версию схемы (0 для новой или старой неверсионированной базы).
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT,
+                        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn):
+    """
+    Применяет все ещё не применённые миграции по порядку. Возвращает итоговую версию схемы.
+    """
+    current = get_schema_version(conn)
+    conn.commit()
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+            current = version
+            logging.info(f"Миграция {version} ({name}) применена.")
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Ошибка при применении миграции {version} ({name}): {e}")
+            raise
+    return current
+
+
+# Запросы, для которых планировщик обязан использовать индекс: (индекс, запрос, параметры)
+INDEXED_QUERIES = [
+    ("idx_users_gender_active",
+     "SELECT * FROM users WHERE gender = ? AND is_active = 1 AND id > ? ORDER BY id LIMIT 1", ("Женский", 0)),
+    ("idx_users_active",
+     "SELECT id, telegram_id FROM users WHERE is_active = 1 AND id > ? ORDER BY id LIMIT 100", (0,)),
+    ("idx_likes_to_id",
+     "SELECT from_id FROM likes WHERE to_id = ?", (0,)),
+    ("idx_support_requests_status",
+     "SELECT * FROM support_requests WHERE is_processed = 0 ORDER BY timestamp DESC", ()),
+    ("idx_support_requests_admin",
+     "SELECT * FROM support_requests WHERE assigned_admin = ? AND is_processed IN (0, 2) ORDER BY timestamp DESC", (0,)),
+    ("idx_housing_prefs_district",
+     "SELECT telegram_id FROM housing_prefs WHERE district IN (?, '') AND budget_min <= ? AND budget_max >= ?",
+     ("Медеуский", 0, 0)),
+    ("idx_housing_prefs_budget",
+     "SELECT telegram_id FROM housing_prefs WHERE budget_min <= ? AND budget_max >= ?", (0, 0)),
+    ("idx_broadcast_jobs_status",
+     "SELECT * FROM broadcast_jobs WHERE status IN ('running', 'paused') ORDER BY id", ()),
+    ("idx_user_geo_geohash",
+     "SELECT u.id, g.latitude, g.longitude FROM user_geo g JOIN users u ON u.telegram_id = g.telegram_id "
+     "WHERE g.geohash >= ? AND g.geohash < ?", ("txwt", "txwt~")),
+]
+
+
+def check_query_plans(conn):
+    """
+    Проверяет через EXPLAIN QUERY PLAN, что горячие запросы используют свои индексы.
+    Возвращает список индексов, которые планировщик не выбрал.
+    """
+    missing = []
+    for index_name, query, params in INDEXED_QUERIES:
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+        if index_name not in plan:
+            logging.warning(f"Запрос не использует индекс {index_name}: {plan}")
+            missing.append(index_name)
+    return missing
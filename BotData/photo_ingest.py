@@ -0,0 +1,94 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Приём фото анкет.
+# Загруженное фото декодируется, поворачивается по EXIF, уменьшается до PHOTO_CARD_SIZE
+# по большей стороне и пережимается в JPEG без метаданных (EXIF с геометкой, ICC и т.п.);
+# из него же делается миниатюра PHOTO_THUMB_SIZE. В хранилище попадает уже результат.
+# Декодирование и сжатие занимают процессор на десятки миллисекунд, поэтому идут
+# в пуле процессов: цикл событий бота в это время обрабатывает другие апдейты.
+
+PHOTO_CARD_SIZE = int(os.getenv("PHOTO_CARD_SIZE", "1280"))
+PHOTO_THUMB_SIZE = int(os.getenv("PHOTO_THUMB_SIZE", "320"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+PHOTO_WORKERS = int(os.getenv("PHOTO_WORKERS", str(os.cpu_count() or 1)))
+MAX_PHOTO_PIXELS = 40_000_000  # больше - отказываемся декодировать (защита от "бомб")
+
+Image.MAX_IMAGE_PIXELS = MAX_PHOTO_PIXELS
+
+_pool = None
+
+
+def _flatten(image):
+    """
+    Приводит изображение к RGB; прозрачные области заливаются белым.
+    """
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def _encode(image, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def normalize(data, card_size=PHOTO_CARD_SIZE, thumb_size=PHOTO_THUMB_SIZE, quality=PHOTO_JPEG_QUALITY):
+    """
+    Возвращает (JPEG карточки, JPEG миниатюры) для байтов фото.
+    Выполняется в процессе пула; бросает исключение, если это не изображение.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG сразу декодируется в уменьшенном масштабе (не меньше card_size) - в разы быстрее
+        image.draft("RGB", (card_size, card_size))
+        image = _flatten(ImageOps.exif_transpose(image))
+    image.thumbnail((card_size, card_size), Image.LANCZOS)
+    card = _encode(image, quality)
+    image.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+    thumb = _encode(image, quality)
+    return card, thumb
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PHOTO_WORKERS)
+    return _pool
+
+
+async def normalize_photo(photo):
+    """
+    Нормализует фото (bytes, memoryview или файловый объект) в пуле процессов.
+    Возвращает (JPEG карточки, JPEG миниатюры) или None, если фото не удалось прочитать.
+    """
+    if photo is None:
+        return None
+    if hasattr(photo, "read"):
+        photo = photo.read()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), normalize, bytes(photo))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        logging.error(f"Не удалось обработать фото: {e}")
+        return None
+
+
+def shutdown():
+    """
+    Останавливает пул процессов обработки фото.
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
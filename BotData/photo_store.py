@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+# Хранилище фотографий анкет на диске, адресуемое по содержимому.
+# Файл называется SHA-256 своих байтов и лежит в PHOTO_DIR/ab/cd/<хэш>, поэтому
+# одинаковые загрузки хранятся один раз, а в БД (users.photo_ref) лежит только хэш -
+# страницы database.db не раздуваются блобами.
+# Чтение идёт через mmap: get() возвращает memoryview на отображённый файл без копирования
+# в память процесса. Файлы после записи не меняются, поэтому отображения можно кэшировать.
+
+PHOTO_DIR = os.getenv("PHOTO_DIR", "photos")
+MAPPED_FILES = 256  # сколько отображённых файлов держать открытыми
+
+
+class PhotoStore:
+    def __init__(self, root=PHOTO_DIR, mapped_files=MAPPED_FILES):
+        self.root = root
+        self.mapped_files = mapped_files
+        self._maps = OrderedDict()  # ref -> mmap
+        self.writes = 0
+        self.dedup_hits = 0
+
+    def path(self, ref):
+        return os.path.join(self.root, ref[:2], ref[2:4], ref)
+
+    def put(self, data):
+        """
+        Сохраняет байты фото (bytes или файловый объект) и возвращает ссылку - SHA-256 в hex.
+        Если такое фото уже есть, файл не пишется повторно.
+        """
+        if hasattr(data, "read"):
+            data = data.read()
+        ref = hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if os.path.exists(path):
+            self.dedup_hits += 1
+            return ref
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно переименовываем: читатель никогда не увидит недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.writes += 1
+        return ref
+
+    def get(self, ref):
+        """
+        Возвращает memoryview на содержимое фото (без копирования) или None, если файла нет.
+        """
+        mapped = self._maps.get(ref)
+        if mapped is None:
+            try:
+                with open(self.path(ref), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):  # ValueError - пустой файл
+                return None
+            self._maps[ref] = mapped
+            while len(self._maps) > self.mapped_files:
+                self._release(*self._maps.popitem(last=False))
+        else:
+            self._maps.move_to_end(ref)
+        return memoryview(mapped)
+
+    def exists(self, ref):
+        return os.path.exists(self.path(ref))
+
+    def remove_unreferenced(self, refs, min_age=24 * 3600):
+        """
+        Удаляет файлы, на которые не ссылается ни одна строка БД. refs - множество живых ссылок.
+        Файлы моложе min_age секунд не трогаются: фото могло быть сохранено в ходе регистрации,
+        которая ещё не записала ссылку в БД. Возвращает количество удалённых файлов.
+        """
+        removed = 0
+        now = time.time()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.startswith(".tmp-") or name in refs or now - os.path.getmtime(path) < min_age:
+                    continue
+                mapped = self._maps.pop(name, None)
+                if mapped is not None:
+                    self._release(name, mapped)
+                os.unlink(path)
+                removed += 1
+        if removed:
+            logging.info(f"Из хранилища фото удалено неиспользуемых файлов: {removed}.")
+        return removed
+
+    @staticmethod
+    def _release(ref, mapped):
+        try:
+            mapped.close()
+        except BufferError:
+            # На отображение ещё есть memoryview (фото сейчас отправляется) - закроется сборщиком мусора
+            pass
+
+    def stats(self):
+        return {"mapped": len(self._maps), "writes": self.writes, "dedup_hits": self.dedup_hits}
+
+
+photo_store = PhotoStore()
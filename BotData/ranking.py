@@ -0,0 +1,106 @@
+import json
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# Ранжирование кандидатов в ленте поиска.
+# Оценка считается векторно (NumPy) сразу по всему столбцовому снимку анкет
+# (BotData/snapshots.py), без циклов по строкам в Python.
+
+# Веса составляющих оценки
+WEIGHTS = {
+    "age": 1.0,         # близость возраста
+    "university": 0.5,  # тот же университет
+    "recency": 0.3,     # недавно зарегистрированные анкеты
+    "housing": 0.8,     # совпадение предпочтений по жилью
+}
+AGE_SCALE = 3.0  # разница в возрасте (лет), при которой оценка возраста падает вдвое
+RECENCY_HALF_LIFE = 14 * 24 * 3600  # секунд, за которые оценка новизны падает вдвое
+
+
+@lru_cache(maxsize=4096)
+def normalize_university(university):
+    """
+    Приводит название университета к виду для сравнения ("", если не указан).
+    """
+    return " ".join(str(university).casefold().split()) if university else ""
+
+
+@lru_cache(maxsize=65536)
+def housing_prefs_mask(housing_prefs):
+    """
+    Превращает users.housing_prefs в 64-битную маску признаков.
+    Поддерживается JSON-объект ({"pets": false, ...} -> признаки "pets=False")
+    или список через запятую. Каждый признак хэшируется в один из 64 битов.
+    Результат кэшируется: у многих анкет одинаковые наборы предпочтений.
+    """
+    if not housing_prefs:
+        return 0
+    try:
+        prefs = json.loads(housing_prefs)
+    except (TypeError, ValueError):
+        prefs = [part for part in str(housing_prefs).split(",")]
+    if isinstance(prefs, dict):
+        features = [f"{key}={value}" for key, value in prefs.items() if value is not None]
+    elif isinstance(prefs, list):
+        features = [str(item) for item in prefs]
+    else:
+        features = [str(prefs)]
+    mask = 0
+    for feature in features:
+        feature = feature.strip().casefold()
+        if feature:
+            mask |= 1 << (zlib.crc32(feature.encode()) % 64)
+    return mask
+
+
+def parse_timestamps(values):
+    """
+    Переводит строки DATETIME из SQLite в секунды от эпохи (NaN, если значения нет).
+    """
+    stamps = np.array([value.replace(" ", "T") if value else "NaT" for value in values], dtype="datetime64[s]")
+    seconds = stamps.astype(np.int64).astype(np.float64)
+    seconds[np.isnat(stamps)] = np.nan
+    return seconds
+
+
+def score(snapshot, viewer, now):
+    """
+    Возвращает массив оценок для всех анкет снимка с точки зрения viewer
+    (строка users). now - момент, от которого считается новизна; в пределах
+    одной сессии поиска он не меняется, чтобы порядок был стабильным.
+    """
+    scores = np.zeros(len(snapshot), dtype=np.float64)
+
+    viewer_age = viewer[3]
+    if viewer_age is not None:
+        age_diff = np.abs(snapshot.ages - float(viewer_age))
+        scores += WEIGHTS["age"] * np.nan_to_num(1.0 / (1.0 + age_diff / AGE_SCALE))
+
+    viewer_university = snapshot.university_codes_by_name.get(normalize_university(viewer[5]), 0)
+    if viewer_university:
+        scores += WEIGHTS["university"] * (snapshot.university_codes == viewer_university)
+
+    age_seconds = np.maximum(now - snapshot.registered_at, 0.0)
+    scores += WEIGHTS["recency"] * np.nan_to_num(np.exp2(-age_seconds / RECENCY_HALF_LIFE))
+
+    viewer_mask = housing_prefs_mask(viewer[8])
+    if viewer_mask:
+        common = np.bitwise_count(snapshot.prefs_masks & np.uint64(viewer_mask))
+        scores += WEIGHTS["housing"] * common / bin(viewer_mask).count("1")
+
+    return scores
+
+
+def top_k(scores, row_ids, valid, limit):
+    """
+    Индексы limit лучших анкет среди valid: по убыванию оценки, при равенстве - по id.
+    """
+    candidates = np.flatnonzero(valid)
+    if len(candidates) > limit:
+        # Порог - limit-я по величине оценка; всё, что не ниже порога, сортируем точно
+        threshold = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+        candidates = candidates[scores[candidates] >= threshold]
+    order = np.lexsort((row_ids[candidates], -scores[candidates]))
+    return candidates[order[:limit]]
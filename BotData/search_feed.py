@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import numpy as np
+
+import BotData.database_function as db
+from BotData.database_async import (
+    run_db, get_liked_set, get_compatible_set, get_user_by_id, get_nearby_users, snapshots
+)
+from BotData.ranking import score, top_k
+from BotData.snapshots import CandidateSnapshot
+
+# Лента поиска поверх общих снимков кандидатов (BotData/snapshots.py).
+# Анкеты показываются в порядке оценки ранжирования (BotData/ranking.py): по убыванию
+# оценки, при равенстве - по users.id. Сессия хранит в FSM только небольшой словарь:
+#   gender - пол, который ищет пользователь,
+#   now - момент начала поиска (от него считается новизна анкет, чтобы порядок не "плыл"),
+#   score, cursor - оценка и users.id последней показанной анкеты (keyset-курсор),
+#   origin, radius - для поиска рядом: точка [широта, долгота] и радиус в км.
+# В поиске рядом кандидаты берутся из геоиндекса (user_geo), а оценка - минус расстояние,
+# так что ближние анкеты идут первыми, а keyset-курсор работает так же.
+# Порядок не зависит от версии снимка, поэтому после регистрации новых анкет
+# лента продолжается с того же места.
+
+_build_locks = {}
+
+
+def new_feed(gender, origin=None, radius=None):
+    """
+    Состояние ленты для нового поиска. origin и radius задают поиск в радиусе radius км от origin.
+    """
+    feed = {"gender": gender, "now": time.time(), "score": None, "cursor": 0}
+    if radius:
+        feed.update(origin=list(origin), radius=radius)
+    return feed
+
+
+def _build_snapshot(gender):
+    return CandidateSnapshot(gender, db.get_candidate_columns(gender))
+
+
+async def get_snapshot(gender):
+    """
+    Возвращает актуальный снимок для пола, при необходимости строя его в потоке БД.
+    Одновременные поиски ждут одно построение, а не запускают своё.
+    """
+    snapshot = snapshots.get(gender)
+    if snapshot is not None:
+        return snapshot
+    lock = _build_locks.setdefault(gender, asyncio.Lock())
+    async with lock:
+        snapshot = snapshots.get(gender)
+        if snapshot is None:
+            generation = snapshots.generation(gender)
+            snapshot = snapshots.install(await run_db(_build_snapshot, gender), generation)
+    return snapshot
+
+
+async def _nearby_scores(snapshot, origin, radius):
+    """
+    Оценки для поиска рядом: минус расстояние до анкет в радиусе, остальные анкеты исключаются.
+    """
+    nearby = await get_nearby_users(origin[0], origin[1], radius)
+    scores = np.full(len(snapshot), -np.inf)
+    valid = np.zeros(len(snapshot), dtype=bool)
+    if nearby:
+        row_ids = np.fromiter((row_id for row_id, _ in nearby), dtype=np.int64, count=len(nearby))
+        distances = np.fromiter((distance for _, distance in nearby), dtype=np.float64, count=len(nearby))
+        # Снимок упорядочен по users.id; анкеты другого пола и неактивные в нём отсутствуют
+        positions = np.minimum(np.searchsorted(snapshot.row_ids, row_ids), len(snapshot) - 1)
+        found = snapshot.row_ids[positions] == row_ids
+        scores[positions[found]] = -distances[found]
+        valid[positions[found]] = True
+    return scores, valid
+
+
+async def next_steps(user_id, feed, limit=1):
+    """
+    Возвращает следующие limit анкет из ленты, для каждой - вместе с состоянием ленты
+    после неё: [(строка users, состояние ленты)]. Нужно, чтобы анкеты можно было
+    подготовить заранее, а состояние в FSM сдвигать по мере показа.
+    Пропускает самого пользователя, тех, кому он уже поставил лайк, и, если у него
+    заданы предпочтения по жилью, - несовместимых с ним (анкеты без предпочтений остаются).
+    """
+    snapshot = await get_snapshot(feed["gender"])
+    liked = await get_liked_set(user_id)
+    viewer = await get_user_by_id(user_id)
+    if viewer is None or not len(snapshot):
+        return []
+
+    if feed.get("radius"):
+        scores, valid = await _nearby_scores(snapshot, feed["origin"], feed["radius"])
+    else:
+        scores = score(snapshot, viewer, feed["now"])
+        valid = np.ones(len(snapshot), dtype=bool)
+    valid &= (snapshot.telegram_ids != user_id) & ~liked.contains_many(snapshot.telegram_ids)
+    compatible = await get_compatible_set(user_id)
+    if compatible is not None:
+        valid &= ~snapshot.has_prefs | compatible.contains_many(snapshot.telegram_ids)
+    if feed["score"] is not None:
+        # Только анкеты строго после курсора в порядке (оценка по убыванию, id по возрастанию)
+        valid &= (scores < feed["score"]) | ((scores == feed["score"]) & (snapshot.row_ids > feed["cursor"]))
+
+    result = []
+    for index in top_k(scores, snapshot.row_ids, valid, limit):
+        state = dict(feed, score=float(scores[index]), cursor=int(snapshot.row_ids[index]))
+        row = await get_user_by_id(int(snapshot.telegram_ids[index]))
+        if row:
+            result.append((row, state))
+    return result
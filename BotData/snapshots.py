@@ -0,0 +1,93 @@
+import numpy as np
+
+from BotData.ranking import normalize_university, housing_prefs_mask, parse_timestamps
+
+# Общие для всего процесса снимки кандидатов для ленты поиска.
+# Раньше каждая сессия поиска хранила в FSM собственную копию всех подходящих строк users.
+# Теперь для каждого пола есть один неизменяемый столбцовый снимок (массивы NumPy,
+# по возрастанию users.id): по нему лента и ранжирование (BotData/ranking.py) работают
+# векторно, а сессия хранит только свой курсор.
+
+
+class CandidateSnapshot:
+    """
+    Неизменяемый снимок анкет одного пола. После создания массивы не меняются,
+    поэтому его безопасно читать из любого количества сессий.
+    """
+    __slots__ = ("gender", "version", "row_ids", "telegram_ids", "ages", "university_codes",
+                 "university_codes_by_name", "registered_at", "prefs_masks", "has_prefs")
+
+    def __init__(self, gender, rows):
+        """
+        rows - строки (id, telegram_id, age, university, registered_at, housing_prefs, has_prefs).
+        Версию присваивает SnapshotRegistry.install().
+        """
+        self.gender = gender
+        self.version = 0
+        self.row_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.telegram_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        self.ages = np.array([row[2] if row[2] is not None else np.nan for row in rows], dtype=np.float32)
+        # Университеты кодируются числами, 0 - не указан
+        self.university_codes_by_name = {}
+        codes = []
+        for row in rows:
+            name = normalize_university(row[3])
+            codes.append(self.university_codes_by_name.setdefault(name, len(self.university_codes_by_name) + 1) if name else 0)
+        self.university_codes = np.array(codes, dtype=np.int32)
+        self.registered_at = parse_timestamps([row[4] for row in rows])
+        self.prefs_masks = np.array([housing_prefs_mask(row[5]) for row in rows], dtype=np.uint64)
+        # Есть ли у анкеты строка в housing_prefs (участвует ли она в проверке совместимости)
+        self.has_prefs = np.array([bool(row[6]) for row in rows], dtype=bool)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   ("row_ids", "telegram_ids", "ages", "university_codes", "registered_at", "prefs_masks", "has_prefs"))
+
+
+class SnapshotRegistry:
+    """
+    Текущие снимки по полу. При регистрации снимок соответствующего пола сбрасывается
+    и при следующем поиске строится заново с новой версией.
+    """
+
+    def __init__(self):
+        self._snapshots = {}  # gender -> CandidateSnapshot
+        self._version = 0
+        self._generations = {}  # gender -> счётчик сбросов
+
+    def generation(self, gender):
+        """
+        Номер сброса снимка для пола. Запоминается перед чтением строк из БД и передаётся
+        в install(), чтобы снимок, прочитанный до регистрации новой анкеты, не стал текущим.
+        """
+        return self._generations.get(gender, 0)
+
+    def get(self, gender):
+        return self._snapshots.get(gender)
+
+    def install(self, snapshot, generation=None):
+        """
+        Делает снимок текущим для его пола и присваивает ему новую версию.
+        Если с момента generation снимок сбрасывался, снимок не запоминается как текущий.
+        """
+        self._version += 1
+        snapshot.version = self._version
+        if generation is None or generation == self.generation(snapshot.gender):
+            self._snapshots[snapshot.gender] = snapshot
+        return snapshot
+
+    def invalidate(self, gender=None):
+        genders = list(self._snapshots) if gender is None else [gender]
+        for gender in genders:
+            self._snapshots.pop(gender, None)
+            self._generations[gender] = self.generation(gender) + 1
+
+    def stats(self):
+        return {
+            gender: {"version": snapshot.version, "size": len(snapshot), "bytes": snapshot.nbytes}
+            for gender, snapshot in self._snapshots.items()
+        }
@@ -0,0 +1,68 @@
+"""
+Сравнение пула соединений (BotData/db_pool.py) с прежней схемой
+"новое соединение на каждый вызов".
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_db_pool
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from BotData import db_pool
+
+USERS = 10_000
+QUERIES = 20_000
+
+
+def fill(path):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""CREATE TABLE users (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            telegram_id INTEGER UNIQUE,
+                            name TEXT, age INTEGER, gender TEXT,
+                            university TEXT, description TEXT, photo TEXT)""")
+        conn.executemany(
+            "INSERT INTO users (telegram_id, name, age, gender) VALUES (?, ?, ?, ?)",
+            ((1_000_000 + i, f"user{i}", 18 + i % 30, "Мужской" if i % 2 else "Женский") for i in range(USERS)),
+        )
+
+
+def connect_per_call(path, ids):
+    for telegram_id in ids:
+        with sqlite3.connect(path) as conn:
+            conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+        conn.close()
+
+
+def pooled(pool, ids):
+    for telegram_id in ids:
+        with pool.connection() as conn:
+            conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
+
+
+def measure(name, func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<20} {elapsed:8.3f} с  {QUERIES / elapsed:10.0f} запросов/с  {elapsed / QUERIES * 1e6:8.1f} мкс/запрос")
+    return elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fill(path)
+        ids = [1_000_000 + random.randrange(USERS) for _ in range(QUERIES)]
+
+        base = measure("connect-per-call", connect_per_call, path, ids)
+        pool = db_pool.ConnectionPool(path=path, size=1)
+        fast = measure("pool", pooled, pool, ids)
+        pool.close()
+        print(f"Ускорение: x{base / fast:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Поиск анкет рядом: расстояние до каждой строки user_geo (полный проход) против
+выборки по индексу geohash (get_nearby_users).
+Синтетический набор: 100 000 пользователей в Алматы - половина равномерно по городу,
+половина вокруг нескольких университетских кампусов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_geo
+"""
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from BotData import db_pool
+from BotData import database_function as db
+from BotData.geohash import encode
+
+USERS = 100_000
+QUERIES = 200
+RADII = (1, 3, 5)
+CITY = (43.15, 43.35, 76.75, 77.10)  # юг, север, запад, восток
+CAMPUSES = [(43.2220, 76.8512), (43.2389, 76.9286), (43.2567, 76.9286), (43.2075, 76.6690)]
+
+
+def fill(path):
+    random.seed(1)
+    db_pool.configure(path=path, size=1)
+    db.create_tables()
+    south, north, west, east = CITY
+    points = []
+    for i in range(USERS):
+        if i % 2:
+            lat, lon = random.uniform(south, north), random.uniform(west, east)
+        else:
+            lat, lon = random.choice(CAMPUSES)
+            lat, lon = lat + random.gauss(0, 0.01), lon + random.gauss(0, 0.014)
+        points.append((i + 1, lat, lon))
+    with sqlite3.connect(path) as conn:
+        conn.executemany(
+            "INSERT INTO users (telegram_id, name, age, gender) VALUES (?, ?, ?, ?)",
+            ((i, f"user{i}", 18 + i % 30, "Женский" if i % 2 else "Мужской") for i, _, _ in points),
+        )
+        conn.executemany(
+            "INSERT INTO user_geo (telegram_id, latitude, longitude, geohash) VALUES (?, ?, ?, ?)",
+            ((i, lat, lon, encode(lat, lon, db.GEOHASH_STORED_PRECISION)) for i, lat, lon in points),
+        )
+        conn.execute("ANALYZE")
+    print(f"Пользователей с координатами: {USERS}")
+
+
+def full_scan(latitude, longitude, radius_km):
+    """
+    Прежний подход: расстояние до каждой строки (та же формула, что в get_nearby_users).
+    """
+    km_per_degree_lon = db.KM_PER_DEGREE * math.cos(math.radians(latitude))
+    result = []
+    with db_pool.connection() as conn:
+        for row_id, lat, lon in conn.execute("""
+            SELECT u.id, g.latitude, g.longitude FROM user_geo g
+            JOIN users u ON u.telegram_id = g.telegram_id
+        """):
+            dy = (lat - latitude) * db.KM_PER_DEGREE
+            dx = (lon - longitude) * km_per_degree_lon
+            distance = math.sqrt(dx * dx + dy * dy)
+            if distance <= radius_km:
+                result.append((row_id, distance))
+    result.sort(key=lambda item: item[1])
+    return result
+
+
+def measure(search, origins, radius):
+    start = time.perf_counter()
+    found = 0
+    results = []
+    for latitude, longitude in origins:
+        result = search(latitude, longitude, radius)
+        found += len(result)
+        results.append(result)
+    return (time.perf_counter() - start) / len(origins) * 1000, found / len(origins), results
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        fill(os.path.join(tmp, "bench.db"))
+        random.seed(2)
+        south, north, west, east = CITY
+        origins = [(random.uniform(south, north), random.uniform(west, east)) for _ in range(QUERIES)]
+        scan_origins = origins[:QUERIES // 10]  # полный проход медленный, ему хватит меньшей выборки
+        for radius in RADII:
+            scan_ms, _, scan_results = measure(full_scan, scan_origins, radius)
+            index_ms, found, index_results = measure(db.get_nearby_users, origins, radius)
+            assert [{row_id for row_id, _ in r} for r in scan_results] == \
+                   [{row_id for row_id, _ in r} for r in index_results[:len(scan_origins)]]
+            print(f"радиус {radius} км: в среднем {found:.0f} анкет; "
+                  f"полный проход {scan_ms:.1f} мс, индекс geohash {index_ms:.2f} мс "
+                  f"(в {scan_ms / index_ms:.0f} раз быстрее)")
+        db_pool.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Пропускная способность нормализации фото (BotData/photo_ingest.py):
+изображений в секунду в одном процессе и в пуле процессов, в пересчёте на ядро.
+Синтетический набор: JPEG 3000x4000 (как с камеры телефона) с EXIF и PNG 1200x1200
+с прозрачностью.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_photos
+"""
+import io
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from BotData.photo_ingest import normalize
+
+IMAGES = 48
+WORKERS = os.cpu_count() or 1
+
+
+def make_image(seed, size, mode):
+    rnd = random.Random(seed)
+    image = Image.new(mode, size, (rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rnd.randrange(size[0]), rnd.randrange(size[1])
+        draw.ellipse((x, y, x + rnd.randrange(50, 600), y + rnd.randrange(50, 600)),
+                     fill=tuple(rnd.randrange(256) for _ in mode))
+    return image
+
+
+def make_set():
+    images = []
+    for i in range(IMAGES):
+        buffer = io.BytesIO()
+        if i % 4 == 3:
+            make_image(i, (1200, 1200), "RGBA").save(buffer, "PNG")
+        else:
+            exif = Image.Exif()
+            exif[0x0112] = 6  # Orientation: повернуть на 90°
+            make_image(i, (4000, 3000), "RGB").save(buffer, "JPEG", quality=92, exif=exif)
+        images.append(buffer.getvalue())
+    total = sum(map(len, images)) / 2 ** 20
+    print(f"Изображений: {IMAGES}, исходный объём: {total:.1f} МБ")
+    return images
+
+
+def run_serial(images):
+    start = time.perf_counter()
+    out = [normalize(data) for data in images]
+    return time.perf_counter() - start, out
+
+
+def run_pool(images, workers):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(normalize, images[:workers]))  # прогрев процессов
+        start = time.perf_counter()
+        out = list(pool.map(normalize, images))
+        return time.perf_counter() - start, out
+
+
+def main():
+    images = make_set()
+    elapsed, out = run_serial(images)
+    cards = sum(len(card) for card, _ in out) / 2 ** 20
+    thumbs = sum(len(thumb) for _, thumb in out) / 2 ** 20
+    print(f"После нормализации: карточки {cards:.1f} МБ, миниатюры {thumbs:.2f} МБ")
+    print(f"1 процесс:        {IMAGES / elapsed:7.1f} изобр./с")
+    elapsed, _ = run_pool(images, WORKERS)
+    rate = IMAGES / elapsed
+    print(f"пул, {WORKERS} процессов: {rate:7.1f} изобр./с, {rate / WORKERS:.1f} изобр./с на ядро")
+
+
+if __name__ == "__main__":
+    main()
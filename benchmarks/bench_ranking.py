@@ -0,0 +1,60 @@
+"""
+Задержка ранжирования ленты (BotData/ranking.py): оценка всего снимка кандидатов
+и выбор следующей анкеты, как это делает search_feed.next_steps на каждое нажатие.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ranking
+"""
+import json
+import random
+import time
+
+import numpy as np
+
+from BotData.exclusion import LikedSet
+from BotData.ranking import score, top_k
+from BotData.snapshots import CandidateSnapshot
+
+SIZES = (1_000, 10_000, 100_000)
+REPEATS = 200
+UNIVERSITIES = ["КазНУ", "КБТУ", "МУИТ", "Satbayev University", "SDU", "AlmaU", None]
+
+
+def make_rows(count):
+    random.seed(count)
+    rows = []
+    for i in range(1, count + 1):
+        prefs = {"smoking": random.random() < 0.2, "pets": random.random() < 0.3,
+                 "district": random.choice(["Бостандыкский", "Алмалинский", "Медеуский", "Ауэзовский"])}
+        registered = f"2025-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00"
+        rows.append((i, 10_000_000 + i, random.randint(17, 35), random.choice(UNIVERSITIES),
+                     registered, json.dumps(prefs, ensure_ascii=False), True))
+    return rows
+
+
+def main():
+    viewer = (0, 1, "viewer", 20, "Мужской", "КБТУ", None, None,
+              json.dumps({"smoking": False, "pets": True, "district": "Медеуский"}, ensure_ascii=False), None)
+    now = time.time()
+    for size in SIZES:
+        start = time.perf_counter()
+        snapshot = CandidateSnapshot("Женский", make_rows(size))
+        build = time.perf_counter() - start
+        liked = LikedSet(random.sample(snapshot.telegram_ids.tolist(), size // 10))
+
+        start = time.perf_counter()
+        last_score, cursor = None, 0
+        for _ in range(REPEATS):
+            scores = score(snapshot, viewer, now)
+            valid = (snapshot.telegram_ids != viewer[1]) & ~liked.contains_many(snapshot.telegram_ids)
+            if last_score is not None:
+                valid &= (scores < last_score) | ((scores == last_score) & (snapshot.row_ids > cursor))
+            index = top_k(scores, snapshot.row_ids, valid, 1)[0]
+            last_score, cursor = float(scores[index]), int(snapshot.row_ids[index])
+        elapsed = (time.perf_counter() - start) / REPEATS
+        print(f"{size:>7} кандидатов: снимок {build * 1000:7.1f} мс, "
+              f"оценка + выбор {elapsed * 1e6:8.1f} мкс/запрос ({elapsed / size * 1e9:5.1f} нс/кандидат)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,36 +7,49 @@ import os
 import asyncio
 from aiogram import Bot, Dispatcher, types, F, Router
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
-from aiogram.filters.state import State, StatesGroup
+from aiogram.filters.state import State, StatesGroup, StateFilter
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.exceptions import TelegramBadRequest
 from dotenv import load_dotenv
 
-from BotData.database_function import (
-    add_user, get_users_by_gender, user_exists, add_like, is_mutual_like,
+# Загружаем .env до импорта модулей бота: они читают свои настройки (FSM_STORAGE,
+# DB_POOL_SIZE, PHOTO_* и т.д.) из окружения при импорте
+load_dotenv()
+
+from BotData.database_async import (
+    add_user, user_exists, like_and_check_mutual,
     get_user_by_id, get_new_support_requests, get_all_support_requests,
     clear_support_requests, mark_support_request_processed, create_tables,
     get_all_users, assign_admin_to_request, get_support_requests_for_admin,
     add_support_request, mark_support_request_deferred, delete_support_request,
-    get_support_request_by_id # Эти функции удалены: save_broadcast_content, get_last_broadcast_content, clear_broadcast_content
+    get_support_request_by_id, set_housing_prefs, get_broadcast_job, reactivate_user, collect_photo_garbage, set_user_geo, profile_cache, liked_sets, snapshots, shutdown as shutdown_db # Эти функции удалены: save_broadcast_content, get_last_broadcast_content, clear_broadcast_content
 )
 
+from BotData.search_feed import new_feed
+from BotData.photo_ingest import shutdown as shutdown_photo_pool
+from BotData.fsm_storage import create_storage
+from BotData.gazetteer import point_cache, name_cache
+from App.outbox import setup_outbox, outbox_priority, outbox, MATCH, ADMIN
+from App.notifications import like_notifier
+from App.carousel import profile_text as build_profile_text, render_card, show_card, carousel_stats
+from App.lookahead import Lookahead
+from App.broadcast import create_job, pause_job, resume_job, cancel_job, show_job, resume_jobs, stop_jobs
+from BotData.housing import DISTRICTS, ANY_DISTRICT, parse_budget, parse_move_in, make_prefs
+
 from App.admin_keyboards import (
     admin, support_admin_menu, filter_menu, broadcast_confirm_keyboard, # Добавлена broadcast_confirm_keyboard
     request_actions_keyboard, confirm_clear_requests_keyboard, support_reason_keyboard
 )
 
-# Загружаем токен из .env
-load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
+NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", "3"))
 print("TOKEN:", TOKEN)
 
-# Инициализация бота
-bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+# Инициализация бота. Все исходящие сообщения идут через диспетчер с лимитами и приоритетами (App/outbox.py)
+bot = setup_outbox(Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)))
+storage = create_storage()  # SQLite или память с ограничением объёма, см. FSM_STORAGE (BotData/fsm_storage.py)
 dp = Dispatcher(storage=storage)
 router = Router()
 dp.include_router(router)
@@ -66,6 +79,13 @@ class RegistrationStates(StatesGroup):
     waiting_for_description = State()
     waiting_for_photo = State()
 
+class HousingStates(StatesGroup):
+    waiting_for_budget = State()
+    waiting_for_district = State()
+    waiting_for_smoking = State()
+    waiting_for_pets = State()
+    waiting_for_move_in = State()
+
 class SupportStates(StatesGroup):
     waiting_for_reason = State()
     waiting_for_support_description = State()
@@ -81,8 +101,33 @@ gender_keyboard = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='Мужской'), KeyboardButton(text='Женский')]
 ], resize_keyboard=True)
 
+district_keyboard = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text=DISTRICTS[i]), KeyboardButton(text=DISTRICTS[i + 1])] for i in range(0, len(DISTRICTS), 2)
+] + [[KeyboardButton(text=ANY_DISTRICT)], [KeyboardButton(text='Главное меню')]], resize_keyboard=True)
+
+smoking_keyboard = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text='Курю'), KeyboardButton(text='Не курю')],
+    [KeyboardButton(text='Главное меню')]
+], resize_keyboard=True)
+
+pets_keyboard = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text='Есть питомец / не против'), KeyboardButton(text='Без животных')],
+    [KeyboardButton(text='Главное меню')]
+], resize_keyboard=True)
+
+move_in_keyboard = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text='Как можно скорее')],
+    [KeyboardButton(text='Главное меню')]
+], resize_keyboard=True)
+
+settings_keyboard = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text='🏠 Предпочтения по жилью')],
+    [KeyboardButton(text='Главное меню')]
+], resize_keyboard=True)
+
 main_menu_keyboard = ReplyKeyboardMarkup(keyboard=[
     [KeyboardButton(text='❤️ Искать сожителя')],
+    [KeyboardButton(text='📍 Искать рядом', request_location=True)],
     [KeyboardButton(text='✍️ Моя анкета')],
     [KeyboardButton(text='⚙️ Настройки')],
     [KeyboardButton(text='❓ Поддержка')]
@@ -111,13 +156,7 @@ async def send_profile(chat_id, user_data, keyboard, message_id=None):
         await bot.send_message(chat_id, "Анкета не найдена.")
         return
 
-    profile_text = (
-        f"<b>Имя:</b> {user_data[2]}\n"
-        f"<b>Возраст:</b> {user_data[3]}\n"
-        f"<b>Пол:</b> {user_data[4]}\n"
-        f"<b>Университет:</b> {user_data[5] or 'Не указан'}\n"
-        f"<b>О себе:</b> {user_data[6] or 'Не указано'}"
-    )
+    profile_text = build_profile_text(user_data)
 
     if user_data[7]: # photo
         try:
@@ -154,10 +193,12 @@ async def send_profile(chat_id, user_data, keyboard, message_id=None):
 
 @router.message(F.text == "/start")
 async def start(message: types.Message, state: FSMContext):
-    if not user_exists(message.from_user.id):
+    if not await user_exists(message.from_user.id):
         await message.answer("Привет! Давай создадим твою анкету. Как тебя зовут?")
         await state.set_state(RegistrationStates.waiting_for_name)
     else:
+        # Пользователь мог быть помечен неактивным, пока бот был у него заблокирован
+        await reactivate_user(message.from_user.id)
         await message.answer("С возвращением! Что хочешь сделать?", reply_markup=main_menu_keyboard)
         await state.clear()
 
@@ -203,6 +244,96 @@ async def process_description(message: types.Message, state: FSMContext):
         await message.answer("Описание слишком длинное. Пожалуйста, сократите его до 200 символов.")
         return
     await state.update_data(description=description)
+    await ask_budget(message, state)
+
+# --- ПРЕДПОЧТЕНИЯ ПО ЖИЛЬЮ (при регистрации и из настроек) ---
+
+# Кнопки меню регистрируются раньше шагов анкеты по жилью, чтобы из неё можно было выйти
+@router.message(F.text == '⚙️ Настройки')
+async def settings(message: types.Message, state: FSMContext):
+    await state.clear()
+    await message.answer("Что хочешь изменить?", reply_markup=settings_keyboard)
+
+@router.message(F.text == '🏠 Предпочтения по жилью')
+async def edit_housing_prefs(message: types.Message, state: FSMContext):
+    if not await user_exists(message.from_user.id):
+        await message.answer("Ваша анкета не найдена. Нажмите /start для регистрации.")
+        return
+    await state.set_data({'editing_housing': True})
+    await ask_budget(message, state)
+
+@router.message(F.text == 'Главное меню')
+async def back_to_main_menu(message: types.Message, state: FSMContext):
+    await state.clear()
+    await message.answer("Вы вернулись в главное меню.", reply_markup=main_menu_keyboard)
+
+
+async def ask_budget(message: types.Message, state: FSMContext):
+    await message.answer("Какой у тебя бюджет на жильё в месяц (тенге)? Например: 80000-150000 или до 120000. "
+                         "(Напиши 'Пропустить', если не важно)", reply_markup=back_to_menu_keyboard)
+    await state.set_state(HousingStates.waiting_for_budget)
+
+@router.message(HousingStates.waiting_for_budget)
+async def process_budget(message: types.Message, state: FSMContext):
+    if not message.text:
+        await message.answer("Напиши бюджет текстом, например: 80000-150000.")
+        return
+    if message.text.lower() == 'пропустить':
+        budget = (None, None)
+    else:
+        budget = parse_budget(message.text)
+        if budget is None:
+            await message.answer("Не получилось разобрать бюджет. Напиши, например, 80000-150000.")
+            return
+    await state.update_data(budget_min=budget[0], budget_max=budget[1])
+    await message.answer("В каком районе хочешь жить?", reply_markup=district_keyboard)
+    await state.set_state(HousingStates.waiting_for_district)
+
+@router.message(HousingStates.waiting_for_district)
+async def process_district(message: types.Message, state: FSMContext):
+    if message.text not in DISTRICTS and message.text != ANY_DISTRICT:
+        await message.answer("Пожалуйста, выберите район, используя кнопки.")
+        return
+    await state.update_data(district=message.text)
+    await message.answer("Ты куришь?", reply_markup=smoking_keyboard)
+    await state.set_state(HousingStates.waiting_for_smoking)
+
+@router.message(HousingStates.waiting_for_smoking)
+async def process_smoking(message: types.Message, state: FSMContext):
+    if message.text not in ['Курю', 'Не курю']:
+        await message.answer("Пожалуйста, ответьте, используя кнопки.")
+        return
+    await state.update_data(smoking=message.text == 'Курю')
+    await message.answer("Как насчёт домашних животных?", reply_markup=pets_keyboard)
+    await state.set_state(HousingStates.waiting_for_pets)
+
+@router.message(HousingStates.waiting_for_pets)
+async def process_pets(message: types.Message, state: FSMContext):
+    if message.text not in ['Есть питомец / не против', 'Без животных']:
+        await message.answer("Пожалуйста, ответьте, используя кнопки.")
+        return
+    await state.update_data(pets=message.text != 'Без животных')
+    await message.answer("С какого числа хочешь заехать? Напиши дату в формате ДД.ММ.ГГГГ.", reply_markup=move_in_keyboard)
+    await state.set_state(HousingStates.waiting_for_move_in)
+
+@router.message(HousingStates.waiting_for_move_in)
+async def process_move_in(message: types.Message, state: FSMContext):
+    if message.text == 'Как можно скорее':
+        move_in = None
+    else:
+        move_in = parse_move_in(message.text)
+        if move_in is None:
+            await message.answer("Пожалуйста, напишите дату в формате ДД.ММ.ГГГГ.")
+            return
+    data = await state.get_data()
+    housing_prefs = make_prefs(data['budget_min'], data['budget_max'], data['district'],
+                               data['smoking'], data['pets'], move_in)
+    if data.get('editing_housing'):
+        await set_housing_prefs(message.from_user.id, housing_prefs)
+        await message.answer("Предпочтения по жилью обновлены!", reply_markup=main_menu_keyboard)
+        await state.clear()
+        return
+    await state.update_data(housing_prefs=housing_prefs)
     await message.answer("Отправь своё фото.", reply_markup=ReplyKeyboardRemove())
     await state.set_state(RegistrationStates.waiting_for_photo)
 
@@ -210,14 +341,15 @@ async def process_description(message: types.Message, state: FSMContext):
 async def process_photo(message: types.Message, state: FSMContext):
     photo_id = message.photo[-1].file_id
     user_data = await state.get_data()
-    add_user(
+    await add_user(
         message.from_user.id,
         user_data['name'],
         user_data['age'],
         user_data['gender'],
         user_data['university'],
         user_data['description'],
-        photo_id
+        photo_id,
+        user_data.get('housing_prefs')
     )
     await message.answer("Анкета создана! Что хочешь сделать?", reply_markup=main_menu_keyboard)
     await state.clear()
@@ -226,93 +358,131 @@ async def process_photo(message: types.Message, state: FSMContext):
 async def process_photo_invalid(message: types.Message):
     await message.answer("Пожалуйста, отправьте фотографию.")
 
-@router.message(F.text == 'Главное меню')
-async def back_to_main_menu(message: types.Message, state: FSMContext):
-    await state.clear()
-    await message.answer("Вы вернулись в главное меню.", reply_markup=main_menu_keyboard)
-
 @router.message(F.text == '✍️ Моя анкета')
 async def my_profile(message: types.Message):
     user_id = message.from_user.id
-    user_data = get_user_by_id(user_id)
+    user_data = await get_user_by_id(user_id)
     if user_data:
         await send_profile(user_id, user_data, profile_keyboard)
     else:
         await message.answer("Ваша анкета не найдена. Возможно, вы ещё не зарегистрированы. Нажмите /start для регистрации.")
 
+async def show_next_candidate(user_id, state: FSMContext, message=None):
+    """
+    Показывает следующую анкету из ленты и сдвигает позицию в ней.
+    В FSM хранится только состояние ленты (версия общего снимка, позиция, курсор)
+    и telegram_id показанной анкеты.
+    message - сообщение с текущей анкетой: следующая показывается его редактированием (App/carousel.py).
+    Возвращает False, если анкеты закончились.
+    """
+    data = await state.get_data()
+    # Карточка обычно уже подготовлена в фоне на предыдущем шаге (App/lookahead.py)
+    card, feed = await lookahead.next_card(user_id, data['feed'])
+    if card is None:
+        lookahead.drop(user_id)
+        return False
+
+    await state.update_data(feed=feed, target_id=card["telegram_id"])
+    await show_card(bot, user_id, card, card["keyboard"], message)
+    return True
+
+def render_search_card(user_data):
+    """
+    Карточка анкеты для ленты поиска: подпись, фото и клавиатура.
+    """
+    return dict(render_card(user_data), keyboard=search_actions_keyboard)
+
+lookahead = Lookahead(render_search_card)
+
 @router.message(F.text == '❤️ Искать сожителя')
 async def start_search(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    current_user = get_user_by_id(user_id)
+    current_user = await get_user_by_id(user_id)
     if not current_user:
         await message.answer("Для поиска сначала создайте свою анкету, нажав /start.")
         return
 
+    await start_feed(message, state, current_user)
+
+async def start_feed(message: types.Message, state: FSMContext, current_user, origin=None, radius=None):
+    """
+    Начинает новую ленту поиска (в радиусе radius км от origin, если они заданы).
+    """
     target_gender = "Женский" if current_user[4] == "Мужской" else "Мужской"
-    profiles = get_users_by_gender(user_id, target_gender)
+    await state.set_data({'feed': new_feed(target_gender, origin, radius)})
+    await state.set_state(SearchStates.searching)
 
-    if not profiles:
-        await message.answer("К сожалению, пока нет анкет, подходящих под ваш запрос.", reply_markup=main_menu_keyboard)
+    if not await show_next_candidate(current_user[1], state):
+        text = (f"Рядом с вами (до {radius:g} км) пока нет анкет, подходящих под ваш запрос." if radius
+                else "К сожалению, пока нет анкет, подходящих под ваш запрос.")
+        await message.answer(text, reply_markup=main_menu_keyboard)
         await state.clear()
-        return
 
-    await state.update_data(profiles=profiles, current_profile_index=0)
-    await state.set_state(SearchStates.searching)
+@router.message(F.location, StateFilter(None, SearchStates.searching))
+async def start_nearby_search(message: types.Message, state: FSMContext):
+    """
+    Пользователь отправил геопозицию (кнопка "📍 Искать рядом"): запоминаем её и ищем анкеты
+    в радиусе NEARBY_RADIUS_KM, ближние первыми.
+    """
+    user_id = message.from_user.id
+    current_user = await get_user_by_id(user_id)
+    if not current_user:
+        await message.answer("Для поиска сначала создайте свою анкету, нажав /start.")
+        return
 
-    first_profile = profiles[0]
-    await send_profile(user_id, first_profile, search_actions_keyboard)
+    origin = (message.location.latitude, message.location.longitude)
+    await set_user_geo(user_id, *origin)
+    lookahead.drop(user_id)
+    await start_feed(message, state, current_user, origin, NEARBY_RADIUS_KM)
 
 @router.callback_query(SearchStates.searching, F.data == 'like')
 async def process_like(callback: types.CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     data = await state.get_data()
-    profiles = data['profiles']
-    current_index = data['current_profile_index']
-    
-    if current_index >= len(profiles):
+    target_user_id = data.get('target_id')
+
+    if target_user_id is None:
         await callback.message.answer("Профилей для лайка больше нет.", reply_markup=main_menu_keyboard)
         await state.clear()
         await callback.answer()
         return
 
-    target_user_id = profiles[current_index][1]
-    add_like(user_id, target_user_id)
+    like = await like_and_check_mutual(user_id, target_user_id)
+    if like is None:
+        # Ошибка БД: лайк не сохранён, карточка остаётся на экране, чтобы можно было повторить
+        await callback.answer("Не удалось поставить лайк. Попробуйте ещё раз.")
+        return
 
-    if is_mutual_like(user_id, target_user_id):
-        target_user_info = get_user_by_id(target_user_id)
-        requester_user_info = get_user_by_id(user_id)
+    if like["is_mutual"]:
+        target_user_info = like["to_user"]
+        requester_user_info = like["from_user"]
         
         target_username_info = target_user_info[2] if target_user_info and target_user_info[2] else f"ID: {target_user_id}"
         requester_username_info = requester_user_info[2] if requester_user_info and requester_user_info[2] else f"ID: {user_id}"
 
-        await callback.message.answer(f"🎉 Взаимный лайк! Вы можете связаться с этим человеком: {target_username_info}", reply_markup=search_actions_keyboard)
+        await callback.message.answer(f"🎉 Взаимный лайк! Вы можете связаться с этим человеком: {target_username_info}")
         
         if target_user_info:
-            await bot.send_message(target_user_id, f"🎉 Взаимный лайк! Пользователь {requester_username_info} также поставил вам лайк!", reply_markup=main_menu_keyboard)
-    else:
-        await callback.message.answer("❤️ Лайк поставлен!", reply_markup=search_actions_keyboard)
+            with outbox_priority(MATCH):
+                await bot.send_message(target_user_id, f"🎉 Взаимный лайк! Пользователь {requester_username_info} также поставил вам лайк!", reply_markup=main_menu_keyboard)
 
-    await process_next_profile(callback, state)
-    await callback.answer()
+    # "Лайк поставлен" - всплывающим уведомлением на нажатие, без отдельного сообщения
+    await callback.answer("❤️ Лайк поставлен!")
+    if not await show_next_candidate(user_id, state, callback.message):
+        await callback.message.answer("Профилей больше нет. Возвращаемся в главное меню.", reply_markup=main_menu_keyboard)
+        await state.clear()
 
 
 @router.callback_query(SearchStates.searching, F.data == 'next_profile')
 async def process_next_profile(callback: types.CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    profiles = data['profiles']
-    current_index = data['current_profile_index'] + 1
-
-    if current_index < len(profiles):
-        await state.update_data(current_profile_index=current_index)
-        next_profile = profiles[current_index]
-        await send_profile(callback.from_user.id, next_profile, search_actions_keyboard, callback.message.message_id)
-    else:
+    if not await show_next_candidate(callback.from_user.id, state, callback.message):
         await callback.message.answer("Профилей больше нет. Возвращаемся в главное меню.", reply_markup=main_menu_keyboard)
         await state.clear()
     await callback.answer()
 
 @router.callback_query(SearchStates.searching, F.data == 'cancel_search')
 async def cancel_search(callback: types.CallbackQuery, state: FSMContext):
+    lookahead.drop(callback.from_user.id)
     await state.clear()
     await callback.message.answer("Поиск отменён. Возвращаемся в главное меню.", reply_markup=main_menu_keyboard)
     await callback.answer()
@@ -355,7 +525,7 @@ async def process_support_description(message: types.Message, state: FSMContext)
     if assigned_admin_id is None:
         assigned_admin_id = ADMINS[0] # По умолчанию назначаем главному админу, если нет специализированного
 
-    request_id = add_support_request(user_id, username, request_text, reason, assigned_admin_id)
+    request_id = await add_support_request(user_id, username, request_text, reason, assigned_admin_id)
 
     if request_id:
         await message.answer("Ваше обращение отправлено. Мы рассмотрим его в ближайшее время.", reply_markup=main_menu_keyboard)
@@ -389,13 +559,14 @@ async def process_support_description(message: types.Message, state: FSMContext)
                 except Exception:
                     pass # Игнорируем ошибку получения имени пользователя, если его нет или приватный аккаунт.
 
-                await bot.send_message(assigned_admin_id,
-                                        f"❗️ Новое обращение в поддержку (ID: {request_id}):\n"
-                                        f"От: @{username} (ID: <code>{user_id}</code>)\n"
-                                        f"<b>Причина: {reason_display_text}</b>\n"
-                                        f"Текст: {request_text}\n\n"
-                                        f"Это обращение назначено вам.",
-                                        reply_markup=request_actions_keyboard(request_id))
+                with outbox_priority(ADMIN):
+                    await bot.send_message(assigned_admin_id,
+                                            f"❗️ Новое обращение в поддержку (ID: {request_id}):\n"
+                                            f"От: @{username} (ID: <code>{user_id}</code>)\n"
+                                            f"<b>Причина: {reason_display_text}</b>\n"
+                                            f"Текст: {request_text}\n\n"
+                                            f"Это обращение назначено вам.",
+                                            reply_markup=request_actions_keyboard(request_id))
 
             # Убрано общее уведомление для главного админа, чтобы он видел все только по нажатию.
             # if assigned_admin_id != ADMINS[0]:
@@ -417,6 +588,57 @@ async def admin_panel(message: types.Message, state: FSMContext):
     await state.clear()
     await message.answer("Добро пожаловать в админ-панель!", reply_markup=admin)
 
+@router.message(F.text == "/stats", F.from_user.id.in_(ADMINS))
+async def admin_stats(message: types.Message):
+    cache_stats = profile_cache.stats()
+    await message.answer(
+        f"<b>Кэш анкет</b>\n"
+        f"Записей: {cache_stats['size']}\n"
+        f"Попаданий: {cache_stats['hits']}\n"
+        f"Промахов: {cache_stats['misses']}\n"
+        f"Доля попаданий: {cache_stats['hit_rate']:.1%}\n"
+        f"Вытеснено: {cache_stats['evictions']}"
+    )
+    liked_stats = liked_sets.stats()
+    snapshot_lines = "\n".join(
+        f"{gender}: v{info['version']}, анкет {info['size']}, {info['bytes'] // 1024} КиБ"
+        for gender, info in snapshots.stats().items()
+    ) or "ещё не построены"
+    await message.answer(
+        f"<b>Лента поиска</b>\n"
+        f"Снимки кандидатов:\n{snapshot_lines}\n"
+        f"Множеств лайков в памяти: {liked_stats['users']} ({liked_stats['bytes'] // 1024} КиБ)"
+    )
+    outbox_stats = outbox.stats()
+    sent_lines = "\n".join(f"{name}: {count}" for name, count in outbox_stats['sent'].items())
+    await message.answer(
+        f"<b>Исходящие сообщения</b>\n{sent_lines}\n"
+        f"В очереди: {outbox_stats['queued']}\n"
+        f"Flood wait: {outbox_stats['flood_waits']}"
+    )
+    swipe_stats = carousel_stats.stats()
+    await message.answer(
+        f"<b>Карусель анкет</b>\n"
+        f"Листаний: {swipe_stats['swipes']}\n"
+        f"Запросов к API на листание: {swipe_stats['calls_per_swipe']:.2f}\n"
+        f"Правок на месте: {swipe_stats['edits']}\n"
+        f"Отправлено заново: {swipe_stats['fallbacks']}"
+    )
+    lookahead_stats = lookahead.stats()
+    await message.answer(
+        f"<b>Упреждающая подготовка анкет</b>\n"
+        f"Сессий: {lookahead_stats['sessions']}, карточек в буферах: {lookahead_stats['buffered']}\n"
+        f"Из буфера: {lookahead_stats['hits']}\n"
+        f"Без буфера: {lookahead_stats['misses']}"
+    )
+    await message.answer(f"<b>Состояния FSM</b>\n{storage.stats_text()}")
+    point_stats, name_stats = point_cache.stats(), name_cache.stats()
+    await message.answer(
+        f"<b>Геокодер</b>\n"
+        f"По координатам: {point_stats['hit_rate']:.1%} из кэша ({point_stats['hits']}/{point_stats['hits'] + point_stats['misses']})\n"
+        f"По названию: {name_stats['hit_rate']:.1%} из кэша ({name_stats['hits']}/{name_stats['hits'] + name_stats['misses']})"
+    )
+
 @router.message(F.text == '🔙 В админ-панель', F.from_user.id.in_(ADMINS))
 async def back_to_admin_panel(message: types.Message, state: FSMContext):
     await state.clear()
@@ -485,10 +707,6 @@ async def confirm_broadcast_send(callback: types.CallbackQuery, state: FSMContex
         await state.clear()
         return
 
-    users = get_all_users()
-    sent_count = 0
-    failed_count = 0
-
     # Убираем кнопки и меняем текст/подпись сообщения-превью
     try:
         if content_to_send["type"] in ["photo", "video", "document"]:
@@ -502,29 +720,43 @@ async def confirm_broadcast_send(callback: types.CallbackQuery, state: FSMContex
         logging.error(f"Ошибка при попытке изменить сообщение подтверждения: {e}")
         await callback.message.answer("Начинаю рассылку...", reply_markup=None)
 
-
-    for user_id in users:
-        try:
-            if content_to_send["type"] == "text":
-                await bot.send_message(user_id, content_to_send["text"])
-            elif content_to_send["type"] == "photo":
-                await bot.send_photo(user_id, content_to_send["file_id"], caption=content_to_send["caption"])
-            elif content_to_send["type"] == "video":
-                await bot.send_video(user_id, content_to_send["file_id"], caption=content_to_send["caption"])
-            elif content_to_send["type"] == "document":
-                await bot.send_document(user_id, content_to_send["file_id"], caption=content_to_send["caption"])
-            sent_count += 1
-            await asyncio.sleep(0.05) # Небольшая задержка, чтобы не превысить лимиты Telegram
-        except Exception as e:
-            logging.error(f"Не удалось отправить рассылку пользователю {user_id}: {e}")
-            failed_count += 1
-        finally:
-            await asyncio.sleep(0.05) # Дополнительная задержка
-
-    await callback.message.answer(f"Рассылка завершена!\nОтправлено: {sent_count}\nНе удалось: {failed_count}", reply_markup=admin)
+    # Рассылка сохраняется в БД и идёт в фоне (App/broadcast.py): прогресс и кнопки
+    # паузы/отмены - в отдельном сообщении, после перезапуска бота она продолжится.
+    job_id = await create_job(bot, content_to_send, callback.from_user.id)
+    if job_id is None:
+        await callback.message.answer("Не удалось создать рассылку. Попробуйте ещё раз.", reply_markup=admin)
+    else:
+        await callback.message.answer(f"Рассылка #{job_id} запущена.", reply_markup=admin)
     await state.clear()
     # clear_broadcast_content() больше не нужен
 
+@router.callback_query(F.data.startswith('broadcast_pause:'), F.from_user.id.in_(ADMINS))
+async def pause_broadcast(callback: types.CallbackQuery):
+    job_id = int(callback.data.split(':')[1])
+    if await pause_job(job_id):
+        await callback.answer("Рассылка будет поставлена на паузу.")
+    else:
+        await callback.answer("Рассылка уже не выполняется.", show_alert=True)
+    await show_job(bot, await get_broadcast_job(job_id))
+
+@router.callback_query(F.data.startswith('broadcast_resume:'), F.from_user.id.in_(ADMINS))
+async def resume_broadcast(callback: types.CallbackQuery):
+    job_id = int(callback.data.split(':')[1])
+    if await resume_job(bot, job_id):
+        await callback.answer("Рассылка продолжается.")
+    else:
+        await callback.answer("Рассылка не на паузе.", show_alert=True)
+    await show_job(bot, await get_broadcast_job(job_id))
+
+@router.callback_query(F.data.startswith('broadcast_stop:'), F.from_user.id.in_(ADMINS))
+async def stop_broadcast(callback: types.CallbackQuery):
+    job_id = int(callback.data.split(':')[1])
+    if await cancel_job(job_id):
+        await callback.answer("Рассылка отменена.")
+    else:
+        await callback.answer("Рассылка уже завершена.", show_alert=True)
+    await show_job(bot, await get_broadcast_job(job_id))
+
 @router.callback_query(F.data == 'broadcast_cancel', SupportStates.waiting_for_broadcast_confirmation, F.from_user.id.in_(ADMINS))
 async def cancel_broadcast(callback: types.CallbackQuery, state: FSMContext):
     await state.clear()
@@ -556,7 +788,7 @@ async def view_requests(message: types.Message, state: FSMContext):
         await message.answer("Выберите фильтр для просмотра обращений:", reply_markup=filter_menu)
     else: # Для других админов показываем только их обращения
         assigned_reasons = ADMINS_ROLES.get(admin_id, [])
-        requests = get_support_requests_for_admin(admin_id=admin_id, reasons=assigned_reasons)
+        requests = await get_support_requests_for_admin(admin_id=admin_id, reasons=assigned_reasons)
         if requests:
             await state.update_data(requests=requests, current_request_index=0)
             await display_request(message.chat.id, requests[0], message.message_id)
@@ -572,15 +804,15 @@ async def handle_filter(callback: types.CallbackQuery, state: FSMContext):
     
     if filter_type == 'all_active':
         # Главный админ может видеть все активные и отложенные обращения
-        requests = get_support_requests_for_admin(admin_id=None, include_processed=False)
+        requests = await get_support_requests_for_admin(admin_id=None, include_processed=False)
     elif filter_type == 'tech':
-        requests = get_support_requests_for_admin(admin_id=None, reasons=['technical_problem'], include_processed=False)
+        requests = await get_support_requests_for_admin(admin_id=None, reasons=['technical_problem'], include_processed=False)
     elif filter_type == 'profile':
-        requests = get_support_requests_for_admin(admin_id=None, reasons=['profile_error'], include_processed=False)
+        requests = await get_support_requests_for_admin(admin_id=None, reasons=['profile_error'], include_processed=False)
     elif filter_type == 'block':
-        requests = get_support_requests_for_admin(admin_id=None, reasons=['user_block'], include_processed=False)
+        requests = await get_support_requests_for_admin(admin_id=None, reasons=['user_block'], include_processed=False)
     elif filter_type == 'idea':
-        requests = get_support_requests_for_admin(admin_id=None, reasons=['suggestions_ideas'], include_processed=False)
+        requests = await get_support_requests_for_admin(admin_id=None, reasons=['suggestions_ideas'], include_processed=False)
     elif filter_type == 'back':
         await callback.message.edit_reply_markup(reply_markup=None)
         await callback.message.answer("Выберите действие с обращениями:", reply_markup=support_admin_menu)
@@ -653,7 +885,7 @@ async def process_request_actions(callback: types.CallbackQuery, state: FSMConte
     request_id = int(request_id_str)
     admin_id = callback.from_user.id
 
-    req_info = get_support_request_by_id(request_id)
+    req_info = await get_support_request_by_id(request_id)
     if not req_info:
         await callback.message.edit_text(f"Обращение #{request_id} не найдено или уже было удалено.", reply_markup=support_admin_menu)
         await callback.answer()
@@ -665,10 +897,11 @@ async def process_request_actions(callback: types.CallbackQuery, state: FSMConte
         await state.update_data(current_request_id=request_id, original_message_id=callback.message.message_id, original_chat_id=callback.message.chat.id)
     
     elif action == 'process_request':
-        if mark_support_request_processed(request_id):
+        if await mark_support_request_processed(request_id):
             user_id_of_requester = req_info[1]
             try:
-                await bot.send_message(user_id_of_requester, f"✅ Ваше обращение #{request_id} было обработано. Спасибо за ожидание!")
+                with outbox_priority(ADMIN):
+                    await bot.send_message(user_id_of_requester, f"✅ Ваше обращение #{request_id} было обработано. Спасибо за ожидание!")
             except Exception as e:
                 logging.error(f"Не удалось отправить уведомление пользователю {user_id_of_requester}: {e}")
             
@@ -683,7 +916,7 @@ async def process_request_actions(callback: types.CallbackQuery, state: FSMConte
             await callback.message.edit_text(f"Ошибка при обработке обращения #{request_id}.", reply_markup=support_admin_menu)
         
     elif action == 'defer_request':
-        if mark_support_request_deferred(request_id):
+        if await mark_support_request_deferred(request_id):
             try:
                 await callback.message.edit_text(f"Обращение #{request_id} отложено.\n\nБыло: {req_info[3]}", reply_markup=None)
             except TelegramBadRequest as e:
@@ -695,7 +928,7 @@ async def process_request_actions(callback: types.CallbackQuery, state: FSMConte
             await callback.message.edit_text(f"Ошибка при откладывании обращения #{request_id}.", reply_markup=support_admin_menu)
         
     elif action == 'delete_request':
-        if delete_support_request(request_id):
+        if await delete_support_request(request_id):
             try:
                 await callback.message.delete()
                 await callback.message.answer(f"Обращение #{request_id} удалено.", reply_markup=support_admin_menu)
@@ -725,7 +958,7 @@ async def process_admin_answer(message: types.Message, state: FSMContext):
     if admin_answer.lower() == "отмена":
         await message.answer("Ответ отменен.", reply_markup=support_admin_menu)
         if original_message_id and original_chat_id:
-            req_info_after_cancel = get_support_request_by_id(request_id)
+            req_info_after_cancel = await get_support_request_by_id(request_id)
             if req_info_after_cancel:
                 try:
                     await display_request(original_chat_id, req_info_after_cancel, original_message_id)
@@ -734,13 +967,14 @@ async def process_admin_answer(message: types.Message, state: FSMContext):
         await state.clear()
         return
 
-    target_request = get_support_request_by_id(request_id)
+    target_request = await get_support_request_by_id(request_id)
 
     if target_request:
         user_id_of_requester = target_request[1]
         try:
-            await bot.send_message(user_id_of_requester, f"✉️ Ответ по вашему обращению #{request_id}:\n\n{admin_answer}")
-            mark_support_request_processed(request_id)
+            with outbox_priority(ADMIN):
+                await bot.send_message(user_id_of_requester, f"✉️ Ответ по вашему обращению #{request_id}:\n\n{admin_answer}")
+            await mark_support_request_processed(request_id)
             await message.answer(f"Ответ пользователю по обращению #{request_id} отправлен и обращение помечено как обработанное.", reply_markup=support_admin_menu)
             
             if original_message_id and original_chat_id:
@@ -768,7 +1002,7 @@ async def confirm_clear_all_requests(message: types.Message):
 
 @router.callback_query(F.data == 'confirm_clear_requests', F.from_user.id.in_(ADMINS))
 async def clear_all_requests_confirmed(callback: types.CallbackQuery, state: FSMContext):
-    if clear_support_requests():
+    if await clear_support_requests():
         await callback.message.edit_text("Все обращения удалены.", reply_markup=support_admin_menu)
     else:
         await callback.message.edit_text("Ошибка при удалении обращений.", reply_markup=support_admin_menu)
@@ -784,8 +1018,17 @@ async def clear_all_requests_cancelled(callback: types.CallbackQuery, state: FSM
 
 # Запуск бота
 async def main():
-    create_tables()
-    await dp.start_polling(bot)
+    await create_tables()
+    await resume_jobs(bot)  # рассылки, прерванные перезапуском
+    await collect_photo_garbage()  # фото, на которые больше не ссылается ни одна анкета
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await like_notifier.flush_all()
+        await stop_jobs()
+        await storage.close()
+        shutdown_db()
+        shutdown_photo_pool()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
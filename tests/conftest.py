@@ -0,0 +1,20 @@
+import pytest
+
+from BotData import db_pool
+from BotData import database_function as db
+from BotData import database_async
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """
+    Пустая база последней версии схемы во временном каталоге; кэши database_async сброшены.
+    """
+    db_pool.configure(path=str(tmp_path / "test.db"), size=1)
+    db.create_tables()
+    database_async.profile_cache.clear()
+    database_async.liked_sets.clear()
+    database_async.compatible_sets.clear()
+    database_async.snapshots.invalidate()
+    yield
+    db_pool.close_pool()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from App import broadcast
+from App.broadcast import TokenBucket
+from BotData import database_function as db
+
+
+def _timed(coro_factory):
+    async def scenario():
+        start = time.monotonic()
+        await coro_factory()
+        return time.monotonic() - start
+    return asyncio.run(scenario())
+
+
+def test_first_token_is_immediate():
+    bucket = TokenBucket(rate=10)
+    assert _timed(bucket.acquire) < 0.05
+
+
+def test_rate_is_even_without_burst():
+    bucket = TokenBucket(rate=50)
+
+    async def take(count):
+        await asyncio.gather(*(bucket.acquire() for _ in range(count)))
+
+    elapsed = _timed(lambda: take(6))  # первый токен сразу, остальные 5 - по 20 мс
+    assert 0.09 <= elapsed < 0.3
+
+
+def test_capacity_allows_burst():
+    bucket = TokenBucket(rate=1, capacity=5)
+
+    async def take(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    assert _timed(lambda: take(5)) < 0.05
+
+
+def test_pause_delays_tokens():
+    bucket = TokenBucket(rate=1000, capacity=10)
+    bucket.pause(0.1)
+    assert _timed(bucket.acquire) >= 0.09
+
+
+class _Bot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, text, chat_id, message_id, reply_markup=None):
+        self.edits.append((text, reply_markup))
+
+
+def test_failed_job_is_paused_and_shown(temp_db, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(broadcast, "run_broadcast", broken)
+    db.add_user(1, "Аня", 20, "Женский", "МГУ", "", "photo")
+    job_id = db.create_broadcast_job('{"text": "привет"}', 100)
+    db.set_broadcast_job_status_message(job_id, 100, 1)
+    bot = _Bot()
+    asyncio.run(broadcast._run_job(bot, job_id))
+    assert db.get_broadcast_job(job_id)[2] == "paused"
+    assert len(bot.edits) == 1 and bot.edits[0][1] is not None  # кнопка "Продолжить"
@@ -0,0 +1,69 @@
+import math
+
+from BotData.cache import TTLCache
+
+
+def test_miss_then_hit():
+    cache = TTLCache()
+    missing = object()
+    assert cache.get(1, missing) is missing
+    cache.set(1, None)
+    assert cache.get(1, missing) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+
+
+def test_stale_read_is_not_cached_after_invalidate():
+    # Анкету прочитали (None), и пока чтение шло, пользователь зарегистрировался
+    cache = TTLCache()
+    generation = cache.generation()
+    cache.invalidate(1)
+    cache.set(1, None, generation)
+    missing = object()
+    assert cache.get(1, missing) is missing
+
+
+def test_invalidate_of_other_key_does_not_block_set():
+    cache = TTLCache()
+    generation = cache.generation()
+    cache.invalidate(2)
+    cache.set(1, "row", generation)
+    assert cache.get(1) == "row"
+
+
+def test_forgotten_invalidations_are_conservative():
+    cache = TTLCache(maxsize=2)
+    generation = cache.generation()
+    for key in (1, 2, 3):
+        cache.invalidate(key)
+    cache.set(1, "row", generation)  # сброс ключа 1 уже вытеснен из истории
+    assert cache.get(1) is None
+
+
+def test_clear_blocks_reads_started_before_it():
+    cache = TTLCache()
+    generation = cache.generation()
+    cache.clear()
+    cache.set(1, "row", generation)
+    assert cache.get(1) is None
+    cache.set(1, "row", cache.generation())
+    assert cache.get(1) == "row"
+
+
+def test_ttl_expiry():
+    missing = object()
+    expiring = TTLCache(ttl=0)
+    expiring.set("key", "value")
+    assert expiring.get("key", missing) is missing
+    eternal = TTLCache(ttl=math.inf)
+    eternal.set("key", "value")
+    assert eternal.get("key") == "value"
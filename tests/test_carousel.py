@@ -0,0 +1,60 @@
+import asyncio
+import datetime
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+from aiogram.types import Chat, InaccessibleMessage, Message, PhotoSize
+
+from App.carousel import show_card
+
+CHAT = Chat(id=1, type="private")
+TEXT_CARD = {"text": "анкета", "photo": None, "telegram_id": 2}
+PHOTO_CARD = {"text": "анкета", "photo": "file-id", "telegram_id": 2}
+
+
+class FakeBot:
+    """
+    Записывает вызовы API; методы из fail бросают TelegramBadRequest.
+    """
+
+    def __init__(self, *fail):
+        self.calls = []
+        self.fail = set(fail)
+
+    def __getattr__(self, name):
+        async def method(*args, **kwargs):
+            self.calls.append(name)
+            if name in self.fail:
+                raise TelegramBadRequest(EditMessageText(text=""), "Bad Request: message can't be edited")
+        return method
+
+
+def _message(photo=False):
+    return Message(message_id=10, date=datetime.datetime.now(), chat=CHAT,
+                   photo=[PhotoSize(file_id="old", file_unique_id="old", width=1, height=1)] if photo else None,
+                   text=None if photo else "старая анкета")
+
+
+def test_same_kind_is_edited_in_place():
+    bot = FakeBot()
+    asyncio.run(show_card(bot, 1, TEXT_CARD, None, _message()))
+    assert bot.calls == ["edit_message_text"]
+
+
+def test_switch_to_photo_sends_new_and_deletes_old():
+    bot = FakeBot()
+    asyncio.run(show_card(bot, 1, PHOTO_CARD, None, _message()))
+    assert bot.calls == ["send_photo", "delete_message"]
+
+
+def test_failed_edit_strips_old_keyboard_when_delete_fails():
+    bot = FakeBot("edit_message_media", "delete_message")
+    asyncio.run(show_card(bot, 1, PHOTO_CARD, None, _message(photo=True)))
+    assert bot.calls == ["edit_message_media", "send_photo", "delete_message", "edit_message_reply_markup"]
+
+
+def test_inaccessible_message_falls_back_to_new_card():
+    bot = FakeBot()
+    old = InaccessibleMessage(chat=CHAT, message_id=10)
+    asyncio.run(show_card(bot, 1, TEXT_CARD, None, old))
+    assert bot.calls == ["send_message", "delete_message"]
@@ -0,0 +1,46 @@
+import numpy as np
+
+from BotData.exclusion import ExclusionRegistry, LikedSet
+
+
+def test_liked_set_membership():
+    liked = LikedSet([5, 1, 3, 3])
+    assert len(liked) == 3
+    assert 3 in liked and 1 in liked
+    assert 2 not in liked and 6 not in liked
+    assert liked.nbytes == 3 * 8
+
+
+def test_liked_set_add_keeps_order_and_skips_duplicates():
+    liked = LikedSet([1, 10])
+    liked.add(5)
+    liked.add(5)
+    liked.add(0)
+    assert len(liked) == 4
+    assert all(x in liked for x in (0, 1, 5, 10))
+    assert list(liked.contains_many(np.array([0, 1, 2, 5, 10, 11], dtype=np.int64))) == \
+        [True, True, False, True, True, False]
+
+
+def test_empty_liked_set_contains_many():
+    assert not LikedSet().contains_many(np.array([1, 2], dtype=np.int64)).any()
+
+
+def test_registry_evicts_least_recently_used():
+    registry = ExclusionRegistry(maxsize=2)
+    registry.put(1, LikedSet([10]))
+    registry.put(2, LikedSet())
+    registry.get(1)
+    registry.put(3, LikedSet())
+    assert registry.get(2) is None
+    assert registry.get(1) is not None
+
+
+def test_registry_add_updates_loaded_set_only():
+    registry = ExclusionRegistry()
+    registry.put(1, LikedSet())
+    registry.add(1, 42)
+    registry.add(2, 42)  # множество не загружено - загрузится из БД уже с лайком
+    assert 42 in registry.get(1)
+    assert registry.get(2) is None
+    assert registry.stats() == {"users": 1, "likes": 1, "bytes": 8}
@@ -0,0 +1,20 @@
+from BotData.fsm_storage import SQLiteStorage, _Record
+
+
+def test_evict_skips_dirty_and_kept_keys():
+    storage = SQLiteStorage(hot_keys=2)
+    for key in "abcde":
+        storage._hot[key] = _Record()
+    storage._dirty = {"a"}
+    storage._evict(keep="b")
+    # вытесняются три самых давних ключа, кроме несохранённого "a" и keep="b"
+    assert list(storage._hot) == ["a", "b"]
+
+
+def test_evict_stops_when_only_dirty_keys_left():
+    storage = SQLiteStorage(hot_keys=1)
+    for key in "abc":
+        storage._hot[key] = _Record()
+    storage._dirty = {"a", "b"}
+    storage._evict()
+    assert list(storage._hot) == ["a", "b"]
@@ -0,0 +1,37 @@
+import math
+import random
+
+from BotData.gazetteer import KDTree, _to_xyz, city_at, city_named, gazetteer, translit_key
+
+
+def test_kdtree_matches_brute_force():
+    random.seed(3)
+    points = [_to_xyz(random.uniform(-90, 90), random.uniform(-180, 180)) for _ in range(500)]
+    tree = KDTree(points)
+    for _ in range(200):
+        query = _to_xyz(random.uniform(-90, 90), random.uniform(-180, 180))
+        index, dist = tree.nearest(query)
+        expected = min(range(len(points)), key=lambda i: math.dist(points[i], query))
+        assert index == expected
+        assert math.isclose(dist, math.dist(points[expected], query) ** 2)
+
+
+def test_city_at_nearby_point():
+    assert city_at(43.2567, 76.9286).name == "Алматы"
+
+
+def test_city_at_far_from_any_city_is_unknown():
+    city, distance = gazetteer.nearest(0.0, 0.0)
+    assert city is not None and distance > 1000
+    assert city_at(0.0, 0.0) is None
+
+
+def test_translit_key_merges_spellings():
+    assert translit_key("Алма-Ата") == translit_key("alma ata")
+    assert translit_key("Yekaterinburg") == translit_key("Екатеринбург") == translit_key("Ekaterinburg")
+
+
+def test_city_named():
+    assert city_named("г. Алма-Ата").name == "Алматы"
+    assert city_named("Almaty, Kazakhstan").name == "Алматы"
+    assert city_named("Несуществующий город") is None
@@ -0,0 +1,79 @@
+import math
+import random
+
+from BotData import database_function as db
+from BotData.geohash import cell_size, covering_ranges, encode
+
+
+def test_encode_known_value():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode(57.64911, 10.40744, 5) == "u4pru"
+
+
+def test_cell_size():
+    assert cell_size(1) == (45.0, 45.0)
+    lat_step, lon_step = cell_size(6)
+    assert math.isclose(lat_step, 180 / 2 ** 15) and math.isclose(lon_step, 360 / 2 ** 15)
+
+
+def _covered(ranges, value):
+    return any(start <= value < end for start, end in ranges)
+
+
+def test_covering_ranges_cover_every_point_of_the_box():
+    random.seed(5)
+    for _ in range(50):
+        south = random.uniform(-80, 79)
+        west = random.uniform(-179, 178)
+        north = south + random.uniform(0.001, 1)
+        east = west + random.uniform(0.001, 1)
+        ranges = covering_ranges(south, north, west, east)
+        assert ranges == sorted(ranges)
+        for _ in range(50):
+            point = encode(random.uniform(south, north), random.uniform(west, east), 9)
+            assert _covered(ranges, point)
+
+
+def test_covering_ranges_respect_max_cells():
+    ranges = covering_ranges(43.2, 43.3, 76.8, 76.95, max_cells=16)
+    assert 1 <= len(ranges) <= 16
+    assert all(end.endswith("~") for _, end in ranges)
+
+
+def _add_point(telegram_id, latitude, longitude):
+    db.add_user(telegram_id, f"user{telegram_id}", 20, "Женский", None, None, None)
+    db.set_user_geo(telegram_id, latitude, longitude)
+
+
+def _brute_force(points, latitude, longitude, radius_km):
+    km_per_degree_lon = db.KM_PER_DEGREE * math.cos(math.radians(latitude))
+    found = set()
+    for row_id, (lat, lon) in points.items():
+        dy = (lat - latitude) * db.KM_PER_DEGREE
+        dx = ((lon - longitude + 180.0) % 360.0 - 180.0) * km_per_degree_lon
+        if math.hypot(dx, dy) <= radius_km:
+            found.add(row_id)
+    return found
+
+
+def test_nearby_users_match_full_scan(temp_db):
+    random.seed(7)
+    origin = (43.24, 76.92)
+    points = {}
+    for telegram_id in range(1, 301):
+        point = (origin[0] + random.gauss(0, 0.03), origin[1] + random.gauss(0, 0.04))
+        _add_point(telegram_id, *point)
+        points[telegram_id] = point  # users.id совпадает с порядком регистрации
+    for radius in (0.5, 2, 5):
+        nearby = db.get_nearby_users(*origin, radius)
+        assert {row_id for row_id, _ in nearby} == _brute_force(points, *origin, radius)
+        distances = [distance for _, distance in nearby]
+        assert distances == sorted(distances)
+
+
+def test_nearby_users_across_the_180th_meridian(temp_db):
+    _add_point(1, 65.0, 179.99)
+    _add_point(2, 65.0, -179.99)
+    _add_point(3, 65.0, 179.5)
+    nearby = db.get_nearby_users(65.0, -179.995, 3)
+    assert sorted(row_id for row_id, _ in nearby) == [1, 2]
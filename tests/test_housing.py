@@ -0,0 +1,47 @@
+from datetime import date, timedelta
+
+from BotData import database_function as db
+from BotData.housing import (
+    MOVE_IN_ASAP, NO_BUDGET_LIMIT, describe, make_prefs, parse_budget, parse_move_in,
+)
+
+
+def test_parse_budget():
+    assert parse_budget("80000-150000") == (80000, 150000)
+    assert parse_budget("150 000 - 80 000 тг") == (80000, 150000)
+    assert parse_budget("до 120000") == (0, 120000)
+    assert parse_budget("от 90000₸") == (90000, NO_BUDGET_LIMIT)
+    assert parse_budget("100000") == (100000, 100000)
+    assert parse_budget("дорого") is None
+    assert parse_budget(None) is None
+
+
+def test_parse_move_in():
+    assert parse_move_in(" 01.09.2026 ") == "2026-09-01"
+    assert parse_move_in("2026-09-01") is None
+    assert parse_move_in("31.02.2026") is None
+    assert parse_move_in(None) is None
+
+
+def test_make_prefs_defaults():
+    prefs = make_prefs(None, None, "Любой", False, True)
+    assert prefs == {"budget_min": 0, "budget_max": NO_BUDGET_LIMIT, "district": "",
+                     "smoking": False, "pets": True, "move_in": MOVE_IN_ASAP}
+    assert "как можно скорее" in describe(prefs)
+    assert "с 01.09.2026" in describe(make_prefs(1, 2, "Медеуский", True, False, "2026-09-01"))
+
+
+def _register(telegram_id, move_in):
+    db.add_user(telegram_id, f"user{telegram_id}", 20, "Женский", None, None, None,
+                make_prefs(50000, 150000, "Любой", False, False, move_in))
+
+
+def test_asap_is_matched_relative_to_today(temp_db):
+    today = date.today()
+    _register(1, None)  # как можно скорее
+    _register(2, (today + timedelta(days=10)).isoformat())
+    _register(3, (today - timedelta(days=60)).isoformat())
+    _register(4, None)
+    assert db.get_compatible_ids(1) == [2, 4]
+    assert db.get_compatible_ids(2) == [1, 4]
+    assert db.get_compatible_ids(3) == []
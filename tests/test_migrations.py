@@ -0,0 +1,52 @@
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from BotData.migrations import MIGRATIONS, check_query_plans, get_schema_version, migrate
+
+SHIPPED_DB = Path(__file__).resolve().parent.parent / "database.db"
+
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    conn = sqlite3.connect(tmp_path / "fresh.db")
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def shipped_db(tmp_path):
+    """
+    Копия database.db из репозитория (неверсионированная база со старой схемой).
+    """
+    path = tmp_path / "shipped.db"
+    shutil.copy(SHIPPED_DB, path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def test_fresh_db_uses_indexes(fresh_db):
+    assert migrate(fresh_db) == MIGRATIONS[-1][0]
+    assert check_query_plans(fresh_db) == []
+
+
+def test_shipped_db_uses_indexes_after_migration(shipped_db):
+    users = shipped_db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    assert migrate(shipped_db) == MIGRATIONS[-1][0]
+    assert check_query_plans(shipped_db) == []
+    assert shipped_db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == users
+
+
+def test_migrate_is_idempotent(fresh_db):
+    migrate(fresh_db)
+    assert migrate(fresh_db) == MIGRATIONS[-1][0]
+    assert get_schema_version(fresh_db) == MIGRATIONS[-1][0]
+    versions = [row[0] for row in fresh_db.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, _, _ in MIGRATIONS]
+
+
+def test_migration_versions_are_sequential():
+    assert [version for version, _, _ in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from App.outbox import ADMIN, BULK, INTERACTIVE, MATCH, Outbox
+
+
+def test_slots_go_to_higher_priority_first():
+    async def scenario():
+        outbox = Outbox(global_rate=50, chat_rate=1000, chat_burst=1000)
+        await outbox.acquire(None, BULK)  # занимает текущий слот, остальные встают в очередь
+        order = []
+
+        async def send(level, name):
+            await outbox.acquire(None, level)
+            order.append(name)
+
+        tasks = []
+        for level, name in [(BULK, "bulk1"), (ADMIN, "admin"), (BULK, "bulk2"),
+                            (MATCH, "match"), (INTERACTIVE, "reply")]:
+            tasks.append(asyncio.create_task(send(level, name)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["reply", "match", "admin", "bulk1", "bulk2"]
+
+
+def test_global_rate_spaces_slots():
+    async def scenario():
+        outbox = Outbox(global_rate=100, chat_rate=1000, chat_burst=1000)
+        start = time.monotonic()
+        await asyncio.gather(*(outbox.acquire(None, INTERACTIVE) for _ in range(6)))
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.05 * 0.9
+
+
+def test_chat_limit_allows_burst_then_waits():
+    outbox = Outbox(global_rate=1000, chat_rate=2, chat_burst=3)
+    delays = [outbox._reserve_chat(42) for _ in range(5)]
+    assert delays[:3] == [0.0, 0.0, 0.0]
+    assert 0.4 < delays[3] <= 0.5
+    assert 0.9 < delays[4] <= 1.0
+    assert outbox._reserve_chat(7) == 0.0
+
+
+def test_flood_wait_pauses_slots():
+    async def scenario():
+        outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        outbox.flood_wait(0.1)
+        start = time.monotonic()
+        await outbox.acquire(None, INTERACTIVE)
+        return time.monotonic() - start, outbox.stats()["flood_waits"]
+
+    elapsed, flood_waits = asyncio.run(scenario())
+    assert elapsed >= 0.09
+    assert flood_waits == 1
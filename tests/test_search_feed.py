@@ -0,0 +1,68 @@
+import asyncio
+
+from BotData import database_function as db
+from BotData import search_feed
+from BotData.database_async import snapshots
+from BotData.search_feed import new_feed, next_steps
+
+VIEWER = 1
+WOMEN = range(100, 130)
+
+
+def _fill():
+    db.add_user(VIEWER, "viewer", 20, "Мужской", "КБТУ", None, None)
+    for i, telegram_id in enumerate(WOMEN):
+        db.add_user(telegram_id, f"user{telegram_id}", 18 + i % 10, "Женский",
+                    "КБТУ" if i % 3 == 0 else None, None, None)
+
+
+async def _walk(feed, limit=1):
+    """
+    Листает ленту до конца, как это делают нажатия "Далее": состояние берётся из последнего шага.
+    """
+    shown = []
+    while True:
+        steps = await next_steps(VIEWER, feed, limit)
+        if not steps:
+            return shown
+        shown.extend((row[1], state["score"]) for row, state in steps)
+        feed = steps[-1][1]
+
+
+def _run(coro):
+    search_feed._build_locks.clear()
+    return asyncio.run(coro)
+
+
+def test_keyset_paging_shows_every_profile_once_in_score_order(temp_db):
+    _fill()
+    shown = _run(_walk(new_feed("Женский")))
+    assert sorted(telegram_id for telegram_id, _ in shown) == list(WOMEN)
+    scores = [score for _, score in shown]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_page_size_does_not_change_order(temp_db):
+    _fill()
+    feed = new_feed("Женский")
+    assert _run(_walk(feed, 1)) == _run(_walk(feed, 7))
+
+
+def test_liked_profiles_are_skipped(temp_db):
+    _fill()
+    db.like_and_check_mutual(VIEWER, 100)
+    db.like_and_check_mutual(VIEWER, 105)
+    shown = {telegram_id for telegram_id, _ in _run(_walk(new_feed("Женский")))}
+    assert shown == set(WOMEN) - {100, 105}
+
+
+def test_feed_continues_after_new_registration(temp_db):
+    _fill()
+    feed = new_feed("Женский")
+    first = _run(next_steps(VIEWER, feed, 10))
+    db.add_user(500, "new", 20, "Женский", None, None, None)
+    snapshots.invalidate("Женский")
+    rest = _run(_walk(first[-1][1]))
+    seen = [row[1] for row, _ in first] + [telegram_id for telegram_id, _ in rest]
+    assert len(seen) == len(set(seen))
+    assert set(seen) <= set(WOMEN) | {500}